@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""
+:mod:`benchmarks.jolokia_pool` -- pooled vs. per request jolokia connections
+============================================================================
+
+Starts a local stub jolokia server (http/1.1, keep-alive) and times
+sequential reads through urlopen (a new connection per request, as the
+connector did before) and through JolokiaConnector (pooled connections)::
+
+    PYTHONPATH=src python benchmarks/jolokia_pool.py [-n requests]
+"""
+import http.server
+import json
+import sys
+import threading
+import time
+import urllib.request
+
+from os_perftest.performance_dumper import JolokiaConnector
+
+RESPONSE = json.dumps({"request": {"mbean": "metrics:name=requests,type=meters", "type": "read"},
+                       "value": {"Count": 1234, "MeanRate": 12.5}, "timestamp": 1700000000,
+                       "status": 200}).encode('utf-8')
+
+
+class StubJolokiaHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers and body without waiting for the delayed ack of the client
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubJolokiaHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def time_urlopen(url, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        with urllib.request.urlopen(url + "/read/metrics:name=requests,type=meters?ignoreErrors=true") as response:
+            json.loads(response.read())
+    return time.perf_counter() - start
+
+
+def time_connector(url, requests):
+    connector = JolokiaConnector(url)
+    start = time.perf_counter()
+    for _ in range(requests):
+        connector.read("metrics:name=requests,type=meters")
+    return time.perf_counter() - start
+
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--requests", type="int", action="store", dest="requests", default=2000,
+                      help="Number of sequential reads. default is 2000")
+    (options, args) = parser.parse_args()
+
+    server = start_server()
+    url = "http://127.0.0.1:%s/jolokia" % server.server_address[1]
+    try:
+        for name, func in (("urlopen", time_urlopen), ("pooled connector", time_connector)):
+            seconds = func(url, options.requests)
+            print("%-17s %6d requests in %6.2f s (%7.0f req/s)" % (name, options.requests, seconds,
+                                                                   options.requests / seconds))
+    finally:
+        server.shutdown()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
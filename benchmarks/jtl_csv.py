@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""
+:mod:`benchmarks.jtl_csv` -- reading large csv jtl files
+========================================================
+
+Writes a synthetic csv jtl file (jmeter's default columns, with a header)
+and times harvest_values_from_jtl_file on it, reporting rows per second
+and the peak resident memory of the process::
+
+    PYTHONPATH=src python benchmarks/jtl_csv.py [-n rows] [-f jtl-file]
+"""
+import csv
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from os_perftest.jmeter_result_dumper import JTL_CSV_DEFAULT_HEADER
+from os_perftest.jmeter_result_dumper import harvest_values_from_jtl_file
+
+LABELS = ['search', 'get item', 'health', 'suggest']
+
+
+def write_jtl(jtl_file, rows, seed=1):
+    rnd = random.Random(seed)
+    start = 1700000000000
+    with open(jtl_file, 'w', newline='') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(JTL_CSV_DEFAULT_HEADER)
+        for i in range(rows):
+            elapsed = int(rnd.expovariate(1 / 120.0)) + 1
+            success = 'true' if rnd.random() > 0.01 else 'false'
+            writer.writerow([start + i * 2, elapsed, LABELS[i % len(LABELS)], '200' if success == 'true' else '500',
+                             'OK', 'thread 1-%d' % (i % 50), 'text', success, '', 2048, 300, 50, 50,
+                             'http://localhost/search', elapsed - 1, 0, 3])
+
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--rows", type="int", action="store", dest="rows", default=10000000,
+                      help="Number of rows in the synthetic jtl file. default is 10000000")
+    parser.add_option("-f", "--file", type="string", action="store", dest="jtl_file", default=None,
+                      help="Keep the jtl file at this path (it is written if it does not exist)")
+    (options, args) = parser.parse_args()
+
+    jtl_file = options.jtl_file or os.path.join(tempfile.mkdtemp(), "bench.jtl")
+    if not os.path.exists(jtl_file):
+        write_jtl(jtl_file, options.rows)
+    size = os.path.getsize(jtl_file)
+
+    try:
+        start = time.perf_counter()
+        values = harvest_values_from_jtl_file(jtl_file)
+        seconds = time.perf_counter() - start
+    finally:
+        if options.jtl_file is None:
+            os.remove(jtl_file)
+            os.rmdir(os.path.dirname(jtl_file))
+
+    rows = values['time']['samples']
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print("%d rows (%.0f MB) in %.2f s (%.0f rows/s), peak rss %.0f MB"
+          % (rows, size / 1e6, seconds, rows / seconds, peak))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""
+:mod:`benchmarks.jtl_files` -- reading a jtl file per load generator
+====================================================================
+
+Writes a synthetic csv jtl file per load generator (see benchmarks.jtl_csv)
+and times harvest_values_from_jtl_files on all of them with a single
+worker process and with one worker per cpu. Ideally the files take the
+time of one file per cpu::
+
+    PYTHONPATH=src python benchmarks/jtl_files.py [-g generators] [-n rows] [-j workers]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from os_perftest.jmeter_result_dumper import harvest_values_from_jtl_files
+
+from jtl_csv import write_jtl
+
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-g", "--generators", type="int", action="store", dest="generators", default=8,
+                      help="Number of jtl files. default is 8")
+    parser.add_option("-n", "--rows", type="int", action="store", dest="rows", default=1000000,
+                      help="Number of rows in each jtl file. default is 1000000")
+    parser.add_option("-j", "--workers", type="int", action="store", dest="workers", default=None,
+                      help="Number of worker processes of the parallel run. default is the number of cpus")
+    (options, args) = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        jtl_files = []
+        for generator in range(options.generators):
+            jtl_file = os.path.join(tmp_dir, "generator-%s.jtl" % generator)
+            write_jtl(jtl_file, options.rows, seed=generator + 1)
+            jtl_files.append(jtl_file)
+        size = sum(os.path.getsize(x) for x in jtl_files)
+
+        print("%d files of %d rows (%.0f MB), %s cpus" % (len(jtl_files), options.rows, size / 1e6, os.cpu_count()))
+        for workers in (1, options.workers or os.cpu_count()):
+            start = time.perf_counter()
+            values = harvest_values_from_jtl_files(jtl_files, workers=workers)
+            seconds = time.perf_counter() - start
+            rows = values['time']['samples']
+            print("workers=%-3d %6.2f s (%.0f rows/s)" % (workers, seconds, rows / seconds))
+    finally:
+        shutil.rmtree(tmp_dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""
+:mod:`benchmarks.plot_dump` -- flattening a large mbean dump for plotting
+=========================================================================
+
+Writes a synthetic mbean dump (samples x mbeans timers, spread over 4
+services, with a fraction of the attributes missing from some samples)
+and times the steps of performance_plotter.plot_dump_to up to the
+plot_data calls: reading the dump, flattening it and creating the graphs.
+Every line is checked to have a value per timestamp::
+
+    PYTHONPATH=src python benchmarks/plot_dump.py [-s samples] [-m mbeans] [--missing fraction]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import os_perftest.performance_plotter as performance_plotter
+from os_perftest.performance_dumper import MBeanDumper
+
+KEYS = ['Count', 'Mean', 'Min', 'Max', 'StdDev', '50thPercentile', '75thPercentile', '95thPercentile',
+        '98thPercentile', '99thPercentile', '999thPercentile', 'MeanRate', 'OneMinuteRate', 'FiveMinuteRate']
+SERVICES = 4
+
+
+def write_dump(dump_file, samples, mbeans, missing, seed=3):
+    rnd = random.Random(seed)
+    per_service = max(1, mbeans // SERVICES)
+    with open(dump_file, 'w') as fh:
+        for sample in range(samples):
+            entry = {}
+            for service in range(SERVICES):
+                domain = {}
+                for m in range(per_service):
+                    key = 'name=svc%d.Resource%d.requests,type=timers' % (service, m)
+                    value = dict((k, rnd.random() * 100) for k in KEYS if rnd.random() >= missing)
+                    if 'Count' in value:
+                        value['Count'] = sample * 10 + m
+                    value['RateUnit'] = 'events/second'
+                    value['DurationUnit'] = 'milliseconds'
+                    domain[key] = {'status': 200, 'timestamp': 1700000000 + sample * 60,
+                                   'request': {'type': 'read', 'mbean': 'metrics:' + key}, 'value': value}
+                entry['http://svc%d:8080/jolokia' % service] = domain
+            fh.write(json.dumps(entry) + '\n')
+
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-s", "--samples", type="int", action="store", dest="samples", default=70,
+                      help="Number of entries in the dump. default is 70")
+    parser.add_option("-m", "--mbeans", type="int", action="store", dest="mbeans", default=2000,
+                      help="Number of mbeans in each entry. default is 2000")
+    parser.add_option("--missing", type="float", action="store", dest="missing", default=0.01,
+                      help="Fraction of the attributes missing from a sample. default is 0.01")
+    (options, args) = parser.parse_args()
+
+    dump_file = os.path.join(tempfile.mkdtemp(), "mbeans.json")
+    try:
+        write_dump(dump_file, options.samples, options.mbeans, options.missing)
+        size = os.path.getsize(dump_file)
+
+        start = time.perf_counter()
+        dump = MBeanDumper(dump_file).read_dump()
+        read = time.perf_counter()
+        mbeans = {}
+        performance_plotter._fetch_mbeans_from_dump(dump, mbeans)
+        flattened = time.perf_counter()
+        graphs = performance_plotter._create_count_graphs(mbeans) + performance_plotter._create_percentile_graphs(mbeans)
+        created = time.perf_counter()
+    finally:
+        os.remove(dump_file)
+        os.rmdir(os.path.dirname(dump_file))
+
+    for graph in graphs:
+        for line in graph['lines']:
+            if len(line[2]) != len(graph['timestamps']):
+                raise AssertionError("%s: %s has %s values for %s timestamps"
+                                     % (graph['name'], line[1], len(line[2]), len(graph['timestamps'])))
+
+    print("%d samples x %d mbeans (%.0f MB): %d graphs, %d lines"
+          % (options.samples, options.mbeans, size / 1e6, len(graphs), sum(len(x['lines']) for x in graphs)))
+    print("read %.2f s, flatten %.2f s, graphs %.2f s, total %.2f s"
+          % (read - start, flattened - read, created - flattened, created - start))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""
+:mod:`benchmarks.report_render` -- serial vs. parallel report rendering
+=======================================================================
+
+Renders a report of synthetic plots with PerformanceReport, first
+serially and then in the process pool (parallel=True)::
+
+    PYTHONPATH=src python benchmarks/report_render.py [-n plots] [-p points] [-j workers]
+"""
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from os_perftest.performance_report import PerformanceReport
+
+
+def make_plots(plots, points, seed=1):
+    rnd = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    dates = [start + datetime.timedelta(seconds=10 * i) for i in range(points)]
+    result = []
+    for i in range(plots):
+        lines = [(color, legend, [rnd.gauss(100, 15) for _ in range(points)], 2)
+                 for color, legend in (('b', 'mean'), ('r', '95th percentile'))]
+        result.append(("plot-%03d" % i, "synthetic plot %s" % i, "milliseconds", dates, lines))
+    return result
+
+
+def render(output_dir, plots, parallel, workers):
+    report = PerformanceReport(output_dir, parallel=parallel, workers=workers)
+    start = time.perf_counter()
+    for name, description, unit, dates, lines in plots:
+        report.plot_data(name, description, unit, dates, *lines)
+    report.create_report(plot_name=plots[0][0])
+    return time.perf_counter() - start
+
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-n", "--plots", type="int", action="store", dest="plots", default=20,
+                      help="Number of plots. default is 20")
+    parser.add_option("-p", "--points", type="int", action="store", dest="points", default=70,
+                      help="Number of points per line. default is 70")
+    parser.add_option("-j", "--workers", type="int", action="store", dest="workers", default=None,
+                      help="Number of worker processes. default is the number of cpus")
+    (options, args) = parser.parse_args()
+
+    plots = make_plots(options.plots, options.points)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print("%d plots of %d points, %d cpus" % (options.plots, options.points, os.cpu_count() or 1))
+        for parallel in (False, True):
+            seconds = render(os.path.join(tmp_dir, "parallel" if parallel else "serial"), plots, parallel,
+                             options.workers)
+            print("%-8s %6.2f s" % ("parallel" if parallel else "serial", seconds))
+    finally:
+        shutil.rmtree(tmp_dir)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,9 +4,47 @@
 """
 :mod:`os_perftest.performance_config_parser` -- config parser
 =============================================================
+
+The values of a line are selected by jolokiaurl (the domain in the
+dump), mbean and yCoordPath. They are names, and not patterns, so an
+mbean name with '*', '?' or '[' selects that mbean only. Instead of the
+three, a line can give a query with wildcards (see performance_query).
+If it matches several values, a reduction (sum, max, min or avg)
+combines them into one line::
+
+    [Requests]
+    unit = count
+        [[all requests]]
+        color = b
+        query = "sum(metrics:type=meters,*/value/Count)"
+
+All queries of a config are compiled once, and run in one pass over the
+dump.
+
+A line can plot a series derived from counters (see
+performance_derive), by setting derive to rate, counter-ratio or
+hit-rate, or the change per second of a gauge with gauge-rate.
+counter-ratio and hit-rate use a second counter at otherPath,
+in otherMbean of otherJolokiaurl (default the mbean of the line, and
+names like jolokiaurl and mbean unless the line gives a query), or
+selected by otherQuery. The precision of derived lines defaults to 2::
+
+    [Errors]
+    unit = ratio
+        [[error ratio]]
+        color = r
+        jolokiaurl = metrics
+        mbean = "name=errors,type=counters"
+        yCoordPath = /value/Count
+        derive = counter-ratio
+        otherMbean = "name=requests,type=meters"
+        otherPath = /value/Count
+        precision = 4
 """
 from configobj import ConfigObj
+import os_perftest.performance_derive as derive
 import os_perftest.performance_dumper as dumper
+import os_perftest.performance_query as query
 import datetime
 
 class ConfigParseError(Exception):
@@ -17,8 +55,13 @@ def parse_config(config_file):
     config = validate_config(config)
     
     pd = dumper.MBeanDumper(config["main"]["datafile"])
-    dump = pd._read_dump()
-    
+    store = pd.read_store()
+
+    # All queries of the config are compiled once, and run in one pass over the dump
+    line_queries = compile_queries(config)
+    queries = [x for queries in line_queries.values() for x in queries.values()]
+    results = dict((result.query, result) for result in query.run_queries(store, queries))
+
     graphs = []
     for graph in [x for x in list(config.keys()) if x != "main"]:
         graphvalues = { "name": graph, 
@@ -28,10 +71,26 @@ def parse_config(config_file):
         timestamps = []
         for line in [x for x in list(config[graph].keys()) if x != "description" and x != "unit"]:
             current = config[graph][line]
+            queries = line_queries[(graph, line)]
 
             linevalues = [current["color"], line]
 
-            ycoords = pd.read_values_from_dump_new(dump, current["jolokiaurl"], current["mbean"], current["yCoordPath"])
+            if queries["values"].literal_domain is not None and queries["values"].literal_domain not in store.entries:
+                print("Could not find %s in entries" % queries["values"].literal_domain)
+
+            try:
+                ycoords = results[queries["values"]].values()
+                current_timestamps = results[queries["timestamps"]].values()
+
+                if "derive" in current:
+                    # Missing samples are None, so they are not taken for counter resets
+                    counters = results[queries["values"]].values(default=None)
+                    others = None
+                    if current["derive"] in derive.PAIRED_DERIVATIONS:
+                        others = results[queries["other"]].values(default=None)
+                    ycoords = derive.fill_missing(derive.derive(current["derive"], current_timestamps, counters, others))
+            except query.QueryError as error:
+                raise ConfigParseError("Line '%s' in '%s': %s" % (line, graph, error))
 
             if current["precision"] == 0:
                 ycoords = list(map(int, ycoords))
@@ -40,7 +99,6 @@ def parse_config(config_file):
             linevalues.append(current["precision"])
             lines.append(linevalues)
 
-            current_timestamps = pd.read_values_from_dump_new(dump, current["jolokiaurl"], current["mbean"], current["timestampPath"])
             if not timestamps:
                 timestamps = current_timestamps
             else:
@@ -58,6 +116,54 @@ def parse_config(config_file):
 
     return graphs  
 
+def _config_value(value):
+    """ Unquoted values with ',' (ie. mbean names) are split into lists by ConfigObj """
+    if isinstance(value, list):
+        return ",".join(value)
+    return value
+
+def compile_queries(config):
+    """ Returns the compiled queries of each line in a (validated) config, by (graph, line) """
+    queries = {}
+    for graph in [x for x in list(config.keys()) if x != "main"]:
+        for line in [x for x in list(config[graph].keys()) if x != "description" and x != "unit"]:
+            queries[(graph, line)] = _compile_line_queries(graph, line, config[graph][line])
+    return queries
+
+def _compile_line_queries(graph, line, current):
+    """ Compiles the queries of a line: its values, timestamps and the other counter of derive """
+    queries = {}
+    try:
+        if "query" in current:
+            queries["values"] = query.compile_query(_config_value(current["query"]))
+        else:
+            for key in ("jolokiaurl", "mbean", "yCoordPath"):
+                if key not in current:
+                    raise ConfigParseError("Could not find %s or query in line '%s' of '%s'" % (key, line, graph))
+            if "reduce" in current:
+                raise ConfigParseError("reduce in line '%s' of '%s' needs a query, mbean names have no wildcards" % (line, graph))
+            queries["values"] = query.Query(current["jolokiaurl"], _config_value(current["mbean"]), current["yCoordPath"],
+                                            literal=True)
+        values = queries["values"]
+
+        # Timestamps of the matched mbeans, the latest if there are several
+        queries["timestamps"] = values.with_path(current["timestampPath"], "max")
+
+        if current.get("derive") in derive.PAIRED_DERIVATIONS:
+            if "otherQuery" in current:
+                queries["other"] = query.compile_query(_config_value(current["otherQuery"]))
+            elif "otherPath" not in current:
+                raise ConfigParseError("Could not find otherPath or otherQuery for derive '%s' in '%s'" % (current["derive"], line))
+            elif "otherMbean" in current or "otherJolokiaurl" in current:
+                queries["other"] = query.Query(current.get("otherJolokiaurl", values.domain),
+                                               _config_value(current.get("otherMbean", values.mbean)),
+                                               current["otherPath"], values.reduction, literal=values.literal)
+            else:
+                queries["other"] = values.with_path(current["otherPath"], values.reduction)
+    except query.QueryError as error:
+        raise ConfigParseError("Invalid query in line '%s' of '%s': %s" % (line, graph, error))
+    return queries
+
 def validate_config(config):
     if "main" not in config or "datafile" not in config["main"]:
         raise ConfigParseError("Could not find 'main' entry in datafile")
@@ -71,10 +177,16 @@ def validate_config(config):
         
         for line in [x for x in list(config[graph].keys()) if x != "description" and x != "unit"]:
             if "precision" not in config[graph][line]:
-                config[graph][line]["precision"] = 0
+                # Derived rates and ratios are fractions, other lines are counts
+                config[graph][line]["precision"] = 2 if "derive" in config[graph][line] else 0
             config[graph][line]["precision"] = int(config[graph][line]["precision"])
             
             if "timestampPath" not in config[graph][line]:
                 config[graph][line]["timestampPath"] = "/timestamp"
+
+            if "derive" in config[graph][line]:
+                current = config[graph][line]
+                if current["derive"] not in derive.DERIVATIONS:
+                    raise ConfigParseError("Unknown derive '%s' in '%s', must be one of %s" % (current["derive"], line, ", ".join(derive.DERIVATIONS)))
                 
     return config
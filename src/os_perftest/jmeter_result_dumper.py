@@ -1,52 +1,531 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 # -*- mode: python -*-
+from concurrent.futures import ProcessPoolExecutor
 from lxml import etree
+import collections
+import csv
+import datetime
+import functools
+import glob
+import hashlib
+import itertools
 import json
 import logging
-import math
 import os
-from .performance_report import PerformanceReport
+import re
+from .performance_report import REPORT_BACKENDS
+from .performance_report import create_performance_report
 from .performance_report import gen_dates
+from .performance_statistics import LatencyHistogram
+from .performance_statistics import Statistics
+from .performance_statistics import steady_state_start
 
 
 logger = logging.getLogger(__name__)
 
+# Percentiles stored in the dump for each run
+DUMP_PERCENTILES = [10, 50, 90, 95, 99, 99.9]
+# Size in seconds of the time windows of a run
+DEFAULT_WINDOW = 10
+
+# Sample attributes read from jtl files. CSV columns are mapped to the xml attribute names
+JTL_FIELDS = ('t', 'lt', 'ct', 's', 'lb', 'ts', 'by', 'rc')
+JTL_CSV_FIELDS = {'elapsed': 't', 'Latency': 'lt', 'Connect': 'ct', 'success': 's',
+                  'label': 'lb', 'timeStamp': 'ts', 'bytes': 'by', 'responseCode': 'rc'}
+# Rows of a csv jtl file transposed into columns at a time
+CSV_CHUNK_SIZE = 512
+# Column order of a csv jtl file written by jmeter without field names
+JTL_CSV_DEFAULT_HEADER = ['timeStamp', 'elapsed', 'label', 'responseCode', 'responseMessage', 'threadName',
+                          'dataType', 'success', 'failureMessage', 'bytes', 'sentBytes', 'grpThreads',
+                          'allThreads', 'URL', 'Latency', 'IdleTime', 'Connect']
+
+def is_success(value):
+    """ Returns True if the success attribute (s) of a sample is not 'false'.
+    Samples without it (not saved by jmeter) count as successful
+    """
+    return value is None or value.strip().lower() != 'false'
+
+
 def calculate_values(base_lst, percentiles=None):
 
-    result = {}
-    result['samples'] = len(base_lst)
-    result['min'] = min(base_lst)
-    result['max'] = max(base_lst)
-    result['mean'] = sum(base_lst) / result['samples']
-    square_dif = [(x - result['mean'])**2 for x in base_lst]
-    result['standard-deviation'] = math.sqrt(sum(square_dif) / len(square_dif))
-    result['percentiles'] = {}
-    if percentiles is not None:
-        sorted_lst = sorted(base_lst)
-        for p in percentiles:
-            result['percentiles'][p] = sorted_lst[int((p / 100.0) * len(sorted_lst)-1)]
+    return Statistics.from_values(base_lst).calculate(percentiles=percentiles)
+
+
+def iterate_jtl_samples(jtl_file):
+    """ Yields the top level sample elements (httpSample or sample) of a jtl file.
+
+    The file is parsed incrementally, and each element is cleared once it has
+    been consumed, so memory use does not grow with the size of the file.
+    """
+    for event, node in etree.iterparse(jtl_file, events=('end',), tag=('httpSample', 'sample')):
+        parent = node.getparent()
+        if parent is None or parent.getparent() is not None:
+            # sub results are cleared together with their top level sample
+            continue
+        yield node
+        node.clear()
+        while node.getprevious() is not None:
+            del parent[0]
+
+
+def is_csv_jtl(jtl_file):
+    """ Returns True if jtl_file is a csv jtl file (and not xml) """
+    with open(jtl_file, 'rb') as fh:
+        return not fh.read(1024).lstrip().startswith(b'<')
+
+
+def iterate_jtl_blocks(jtl_file, block_size=65536):
+    """ Yields the samples of a jtl file (xml or csv) in blocks of columns.
+
+    Each block is a dict from the attribute names in JTL_FIELDS to lists of
+    string values. Attributes missing from the file have None values.
+    """
+    if is_csv_jtl(jtl_file):
+        return _iterate_csv_jtl_blocks(jtl_file, block_size)
+    return _iterate_xml_jtl_blocks(jtl_file, block_size)
+
+
+def _iterate_xml_jtl_blocks(jtl_file, block_size):
+    block = dict((key, []) for key in JTL_FIELDS)
+    size = 0
+    for node in iterate_jtl_samples(jtl_file):
+        for key, values in block.items():
+            values.append(node.get(key))
+        size += 1
+        if size == block_size:
+            yield block
+            block = dict((key, []) for key in JTL_FIELDS)
+            size = 0
+    if size > 0:
+        yield block
+
+
+def _iterate_csv_jtl_blocks(jtl_file, block_size):
+    with open(jtl_file, newline='') as fh:
+        reader = csv.reader(fh)
+        first = next(reader, None)
+        if first is None:
+            return
+
+        if 'elapsed' in first or 'timeStamp' in first:
+            header = first
+            rows = reader
+        else:
+            logger.debug('No header in csv jtl file %s, using default jmeter columns' % jtl_file)
+            header = JTL_CSV_DEFAULT_HEADER
+            rows = itertools.chain([first], reader)
+
+        if 'elapsed' not in header:
+            raise ValueError('No elapsed column in csv jtl file %s' % jtl_file)
+        if 'Latency' not in header:
+            logger.warning('No Latency column in csv jtl file %s, latencies are 0' % jtl_file)
+
+        columns = [(header.index(name), key) for name, key in JTL_CSV_FIELDS.items() if name in header]
+        missing = [key for key in JTL_FIELDS if key not in [k for i, k in columns]]
+        width = max(i for i, k in columns) + 1
+
+        # Rows are read in small chunks and transposed into the columns of the block, so only
+        # a chunk of row lists is alive at a time (many live rows make the garbage collector slow)
+        chunk_size = min(CSV_CHUNK_SIZE, block_size)
+        while True:
+            block = dict((key, []) for i, key in columns)
+            size = 0
+            while size < block_size:
+                chunk = list(itertools.islice(rows, min(chunk_size, block_size - size)))
+                if not chunk:
+                    break
+                size += len(chunk)
+                if min(map(len, chunk)) < width:
+                    # skip truncated rows (ie. the last line of a file still being written)
+                    chunk = [row for row in chunk if len(row) >= width]
+                    if not chunk:
+                        continue
+                chunk_columns = list(zip(*chunk))
+                for i, key in columns:
+                    block[key].extend(chunk_columns[i])
+            samples = len(block[columns[0][1]])
+            if samples > 0:
+                for key in missing:
+                    block[key] = [None] * samples
+                yield block
+            if size < block_size:
+                return
+
+
+class LabelAggregator(object):
+    """ Mergeable aggregates of the samples with one label """
+
+    def __init__(self):
+        self.time = Statistics()
+        self.latency = Statistics()
+        self.connect = Statistics()
+        self.success = 0
+        self.errors = 0
+        self.bytes = 0
+
+    def merge(self, other):
+        self.time.merge(other.time)
+        self.latency.merge(other.latency)
+        self.connect.merge(other.connect)
+        self.success += other.success
+        self.errors += other.errors
+        self.bytes += other.bytes
+        return self
+
+    def calculate(self, percentiles):
+        result = {'time': calculate_run_values(self.time, percentiles),
+                  'latency': calculate_run_values(self.latency, percentiles),
+                  'success': self.success,
+                  'errors': self.errors,
+                  'bytes': self.bytes}
+        if self.connect.count > 0:
+            result['connect'] = self.connect.calculate(percentiles=percentiles)
+        return result
+
+
+class WindowAggregator(object):
+    """ Mergeable aggregates of the samples in fixed time windows of a run.
+
+    Samples are put in windows by their timestamp (ts, milliseconds since
+    epoch). Each window keeps the number of samples, errors and histograms
+    of time and latency.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.windows = {}
+
+    def _aggregate(self, index):
+        aggregate = self.windows.get(index)
+        if aggregate is None:
+            aggregate = [0, 0, LatencyHistogram(), LatencyHistogram()]
+            self.windows[index] = aggregate
+        return aggregate
+
+    def add(self, index, time, latency, success):
+        aggregate = self._aggregate(index)
+        aggregate[0] += 1
+        if not success:
+            aggregate[1] += 1
+        aggregate[2].add(time)
+        aggregate[3].add(latency)
+
+    def add_many(self, samples):
+        """ Adds a block of samples, a list of (index, time, latency, success).
+        Equal values in a window are counted first, and added to its histograms once
+        """
+        samples_counts = collections.Counter(x[0] for x in samples)
+        errors_counts = collections.Counter(x[0] for x in samples if not x[3])
+        for index, count in samples_counts.items():
+            aggregate = self._aggregate(index)
+            aggregate[0] += count
+            aggregate[1] += errors_counts[index]
+        for histogram, position in ((2, 1), (3, 2)):
+            for (index, value), count in collections.Counter((x[0], x[position]) for x in samples).items():
+                self.windows[index][histogram].add(value, count)
+
+    def merge(self, other):
+        if other.window != self.window:
+            raise ValueError("Cannot merge windows of %s and %s seconds" % (self.window, other.window))
+        for index, (samples, errors, time, latency) in other.windows.items():
+            aggregate = self.windows.get(index)
+            if aggregate is None:
+                self.windows[index] = [samples, errors, time, latency]
+            else:
+                aggregate[0] += samples
+                aggregate[1] += errors
+                aggregate[2].merge(time)
+                aggregate[3].merge(latency)
+        return self
+
+    def calculate(self, percentiles):
+        """ Returns the windows as lists of values, one per window from the first to the last """
+        if not self.windows:
+            return None
+
+        first = min(self.windows)
+        last = max(self.windows)
+        result = {'size': self.window,
+                  'start': first * self.window,
+                  'throughput': [],
+                  'error-rate': [],
+                  'time': dict((p, []) for p in percentiles),
+                  'latency': dict((p, []) for p in percentiles)}
+        for index in range(first, last + 1):
+            aggregate = self.windows.get(index)
+            if aggregate is None:
+                samples, errors = 0, 0
+            else:
+                samples, errors = aggregate[0], aggregate[1]
+            result['throughput'].append(samples / float(self.window))
+            result['error-rate'].append(100.0 * errors / samples if samples else 0.0)
+            for key, histogram in (('time', 2), ('latency', 3)):
+                for p in percentiles:
+                    value = aggregate[histogram].percentile(p) if aggregate is not None else 0
+                    result[key][p].append(value)
+        result['steady-state-start'] = steady_state_start(result['throughput'])
+        return result
+
+
+class RunAggregator(object):
+    """ Mergeable aggregates of all samples in a run, and of the samples of each label.
+
+    All aggregates are updated from the same blocks, so a jtl file is only
+    read once.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.time = Statistics()
+        self.latency = Statistics()
+        self.labels = {}
+        self.windows = WindowAggregator(window)
+
+    def add_block(self, block):
+        time = list(map(int, block['t']))
+        # Samples without a latency (not saved by jmeter) get 0, as jmeter gives samplers without one
+        latency = [int(x) if x else 0 for x in block['lt']]
+        self.time.add_many(time)
+        self.latency.add_many(latency)
+
+        successes = [is_success(x) for x in block['s']]
+        window_ms = self.windows.window * 1000
+        # timestamps missing or not in milliseconds (ie. formatted dates in csv) are not windowed
+        self.windows.add_many([(int(ts) // window_ms, t, lt, success)
+                               for ts, t, lt, success in zip(block['ts'], time, latency, successes)
+                               if ts is not None and ts.isdigit()])
+
+        groups = {}
+        for i, label in enumerate(block['lb']):
+            indices = groups.get(label)
+            if indices is None:
+                indices = []
+                groups[label] = indices
+            indices.append(i)
+
+        connect, size = block['ct'], block['by']
+        for label, indices in groups.items():
+            aggregator = self.labels.get(label)
+            if aggregator is None:
+                aggregator = LabelAggregator()
+                self.labels[label] = aggregator
+            aggregator.time.add_many([time[i] for i in indices])
+            aggregator.latency.add_many([latency[i] for i in indices])
+            aggregator.connect.add_many([int(connect[i]) for i in indices if connect[i] is not None])
+            label_successes = sum(1 for i in indices if successes[i])
+            aggregator.success += label_successes
+            aggregator.errors += len(indices) - label_successes
+            aggregator.bytes += sum(int(size[i]) for i in indices if size[i] is not None)
+
+    def merge(self, other):
+        self.time.merge(other.time)
+        self.latency.merge(other.latency)
+        self.windows.merge(other.windows)
+        for label, aggregator in other.labels.items():
+            if label in self.labels:
+                self.labels[label].merge(aggregator)
+            else:
+                self.labels[label] = aggregator
+        return self
+
+    def calculate(self, percentiles):
+        """ Returns the values of the run in the dump format """
+        result = {'time': calculate_run_values(self.time, percentiles),
+                  'latency': calculate_run_values(self.latency, percentiles),
+                  'labels': dict((label, aggregator.calculate(percentiles))
+                                 for label, aggregator in self.labels.items())}
+        windows = self.windows.calculate(percentiles)
+        if windows is not None:
+            result['windows'] = windows
+            # Mean throughput of the run, in requests per second
+            result['throughput'] = sum(windows['throughput']) / len(windows['throughput'])
+        return result
+
+
+def parse_trim(value):
+    """ Parses a warm-up/cool-down specification.
+
+    '<n>s' is a duration in seconds, and '<n>' is a number of samples.
+    returns a tuple (unit, amount) with unit 'seconds' or 'samples', or None
+    """
+    if value is None or value == '' or value == '0':
+        return None
+    if isinstance(value, tuple):
+        return value
+    value = str(value).strip()
+    if value.endswith('s'):
+        return ('seconds', float(value[:-1]))
+    return ('samples', int(value))
+
+
+class SampleTrimmer(object):
+    """ Removes the warm-up and cool-down samples from the blocks of a jtl file.
+
+    The warm-up is either the first samples, or the samples within a
+    duration from the first timestamp (ts). The cool-down samples are held
+    back in a buffer until it is known that they are not among the last
+    samples (by count or by duration from the last timestamp), so the file
+    is still read once and memory is bounded by the cool-down.
+    """
+
+    def __init__(self, warm_up=None, cool_down=None):
+        self.warm_up = parse_trim(warm_up)
+        self.cool_down = parse_trim(cool_down)
+        self.trimmed_warm_up = 0
+        self.trimmed_cool_down = 0
+        self._seen = 0
+        self._first_ts = None
+        self._last_ts = None
+        self._buffer = collections.deque()
+
+    def trim(self, blocks):
+        ts_index = JTL_FIELDS.index('ts')
+        for block in blocks:
+            kept = []
+            for row in zip(*[block[key] for key in JTL_FIELDS]):
+                ts = row[ts_index]
+                ts = int(ts) if ts is not None and ts.isdigit() else None
+                if self._in_warm_up(ts):
+                    self.trimmed_warm_up += 1
+                    continue
+                kept.extend(self._release(row, ts))
+            if kept:
+                yield dict((key, list(values)) for key, values in zip(JTL_FIELDS, zip(*kept)))
+
+        self.trimmed_cool_down += len(self._buffer)
+        self._buffer.clear()
+        logger.debug("Trimmed %s warm-up and %s cool-down samples" % (self.trimmed_warm_up, self.trimmed_cool_down))
+
+    def _in_warm_up(self, ts):
+        self._seen += 1
+        if self.warm_up is None:
+            return False
+        unit, amount = self.warm_up
+        if unit == 'samples':
+            return self._seen <= amount
+        if ts is None:
+            return False
+        if self._first_ts is None:
+            self._first_ts = ts
+        return ts < self._first_ts + amount * 1000
+
+    def _release(self, row, ts):
+        """ Returns the buffered rows which are known to be before the cool-down """
+        if self.cool_down is None:
+            return [row]
+
+        unit, amount = self.cool_down
+        self._buffer.append((row, ts))
+        released = []
+        if unit == 'samples':
+            while len(self._buffer) > amount:
+                released.append(self._buffer.popleft()[0])
+        else:
+            if ts is not None and (self._last_ts is None or ts > self._last_ts):
+                self._last_ts = ts
+            if self._last_ts is not None:
+                limit = self._last_ts - amount * 1000
+                while self._buffer and (self._buffer[0][1] is None or self._buffer[0][1] < limit):
+                    released.append(self._buffer.popleft()[0])
+        return released
 
-    return result
 
+def harvest_statistics_from_jtl_file(jtl_file, window=DEFAULT_WINDOW, warm_up=None, cool_down=None):
+    """ Harvests mergeable statistics from a jtl file
 
-def harvest_values_from_jtl_file(jtl_file):
+    warm_up and cool_down samples are left out (see parse_trim for the format)
+    """
 
     logger.debug('Harvesting raw values from jtl file %s' % jtl_file)
-    time = []
-    latency = []
-    xml = etree.parse(jtl_file)
-    for node in xml.xpath('/testResults/httpSample'):
-        time.append(int(node.get('t')))
-        latency.append(int(node.get('lt')))
+    run = RunAggregator(window=window)
+    blocks = iterate_jtl_blocks(jtl_file)
+    if parse_trim(warm_up) is not None or parse_trim(cool_down) is not None:
+        blocks = SampleTrimmer(warm_up, cool_down).trim(blocks)
+    for block in blocks:
+        run.add_block(block)
+
+    return run
+
+
+def harvest_values_from_jtl_file(jtl_file, percentiles=DUMP_PERCENTILES, window=DEFAULT_WINDOW, warm_up=None, cool_down=None):
+
+    run = harvest_statistics_from_jtl_file(jtl_file, window=window, warm_up=warm_up, cool_down=cool_down)
 
     logger.debug("Calculating derived values")
-    return {'time': calculate_values(time, percentiles=[10,90]),
-            'latency': calculate_values(latency, percentiles=[10,90])}
+    return run.calculate(percentiles)
 
 
+def harvest_values_from_jtl_files(jtl_files, percentiles=DUMP_PERCENTILES, workers=None, window=DEFAULT_WINDOW,
+                                  warm_up=None, cool_down=None):
+    """ Harvests values from several jtl files (ie. one per load generator) into one run.
+
+    The files are parsed in parallel in a process pool, and the statistics
+    of each file are merged. The values of each file are kept under
+    'generators'. Warm-up and cool-down are trimmed from each file.
+    """
+    if len(jtl_files) == 1:
+        return harvest_values_from_jtl_file(jtl_files[0], percentiles=percentiles, window=window,
+                                            warm_up=warm_up, cool_down=cool_down)
+
+    logger.debug('Harvesting %s jtl files' % len(jtl_files))
+    harvest = functools.partial(harvest_statistics_from_jtl_file, window=window, warm_up=warm_up, cool_down=cool_down)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partials = list(executor.map(harvest, jtl_files))
+
+    merged = RunAggregator(window=window)
+    generators = {}
+    for jtl_file, partial in zip(jtl_files, partials):
+        values = partial.calculate(percentiles)
+        generators[jtl_file] = {'time': values['time'], 'latency': values['latency']}
+        merged.merge(partial)
+
+    logger.debug("Calculating derived values")
+    result = merged.calculate(percentiles)
+    result['generators'] = generators
+    return result
+
+
+def calculate_run_values(stats, percentiles):
+    """ Calculates the values stored in the dump for a run, including its histogram """
+    result = stats.calculate(percentiles=percentiles)
+    result['histogram'] = LatencyHistogram.from_counts(stats.counts).to_dict()
+    return result
 
-def collect_and_append_jtl_results_to_dump_file(dump_file, jtl_file, strict=False):
+
+def merge_histograms(dump_file, key, runs=None):
+    """ Merges the histograms of key ('time' or 'latency') of the latest runs in the dump.
+
+    Runs dumped without histograms are skipped. If runs is None all runs are merged.
+    """
+    with open(dump_file) as fh:
+        data = json.load(fh)
+
+    if runs is not None:
+        data = data[-runs:]
+
+    merged = None
+    for entry in data:
+        histogram = entry.get(key, {}).get('histogram')
+        if histogram is None:
+            continue
+        histogram = LatencyHistogram.from_dict(histogram)
+        merged = histogram if merged is None else merged.merge(histogram)
+
+    if merged is None:
+        raise RuntimeError("No histograms for %s found in %s" % (key, dump_file))
+    return merged
+
+
+
+def collect_and_append_jtl_results_to_dump_file(dump_file, jtl_file, strict=False, percentiles=DUMP_PERCENTILES, workers=None,
+                                                window=DEFAULT_WINDOW, warm_up=None, cool_down=None, history=None):
+    """ Appends the values of a run to the dump file.
+
+    jtl_file is either a single jtl file, or a list of jtl files which
+    are merged into one run. If history is given (a sqlite database, see
+    performance_history), the run is also added to the history, which
+    keeps it after it is truncated from the dump file.
+    """
 
     data = []
     if os.path.exists(dump_file):
@@ -61,41 +540,147 @@ def collect_and_append_jtl_results_to_dump_file(dump_file, jtl_file, strict=Fals
     # Truncate data to 20 weeks/140 days
     data = data[-140:]
 
-    data.append(harvest_values_from_jtl_file(jtl_file))
+    # Only the latest run keeps its time windows, to keep the dump small
+    for entry in data:
+        entry.pop('windows', None)
+
+    if isinstance(jtl_file, str):
+        jtl_file = [jtl_file]
+    data.append(harvest_values_from_jtl_files(jtl_file, percentiles=percentiles, workers=workers, window=window,
+                                              warm_up=warm_up, cool_down=cool_down))
+
+    if history is not None:
+        from os_perftest.performance_history import record_jtl_run
+        logger.debug('adding run to history %s' % history)
+        record_jtl_run(history, data[-1], source=dump_file)
 
     logger.debug('entries in new dump %s' % len(data))
+    logger.debug('saving dump to %s' % dump_file)
+    write_dump(dump_file, data)
+
+
+def write_dump(dump_file, data):
+    """ Writes the runs of a dump as a json array with one compact run per line.
+
+    Indenting the runs would put each bucket count of the histograms on a line of its own.
+    """
     with open(dump_file, 'w') as fh:
-        logger.debug('saving dump to %s' % dump_file)
-        json.dump(data, fh, indent=2)
+        fh.write('[\n' + ',\n'.join(json.dumps(entry, separators=(',', ':')) for entry in data) + '\n]\n')
 
 
 
 def order_values(dump_file, key):
+    with open(dump_file) as fh:
+        data = json.load(fh)
+    return order_entry_values([x[key] for x in data])
+
+
+def order_entry_values(entries):
     colors = ['b', 'g', 'c', 'y', 'orange', 'm', 'r']
     values = []
-    samples, this_slice = slice_data_dump(dump_file, key)
+    samples, this_slice = slice_entries(entries)
     for i, (k, v) in enumerate(this_slice.items()):
-        values.append((colors[i], k, v, 0))
+        values.append((colors[i % len(colors)], k, v, 0))
     return samples, values
 
 
-def make_performance_report(dump_file):
+def make_performance_report(dump_file, backend='png', incremental=False, thumbnails=True):
 
-    time_samples, time_data = order_values(dump_file, 'time')
-    latency_samples, latency_data = order_values(dump_file, 'latency')
+    with open(dump_file) as fh:
+        data = json.load(fh)
+
+    time_samples, time_data = order_entry_values([x['time'] for x in data])
+    latency_samples, latency_data = order_entry_values([x['latency'] for x in data])
 
     values = [("Time", "request time (%s samples)" % time_samples[-1], "milliseconds", time_data),
               ("Latency", "request latency (%s samples)" % latency_samples[-1], "milliseconds", latency_data)]
 
+    # Graphs per label, for the labels of the latest run. Runs without the label have 0 values
+    for label in sorted(data[-1].get('labels', {})):
+        label_entries = [x.get('labels', {}).get(label) for x in data]
+        name = label_plot_name(label)
+
+        samples, label_time = order_entry_values([x['time'] if x else None for x in label_entries])
+        values.append(("Time-%s" % name, "request time of '%s' (%s samples)" % (label, samples[-1]),
+                       "milliseconds", label_time))
+
+        counts = [('g', 'success', [x['success'] if x else 0 for x in label_entries], 0),
+                  ('r', 'errors', [x['errors'] if x else 0 for x in label_entries], 0)]
+        values.append(("Requests-%s" % name, "successful and failed requests of '%s'" % label, "requests", counts))
+
+        kbytes = [('b', 'kbytes', [x['bytes'] / 1024.0 if x else 0 for x in label_entries], 0)]
+        values.append(("Bytes-%s" % name, "received kbytes of '%s'" % label, "kbytes", kbytes))
 
-    pr = PerformanceReport('performance-report')
+        if label_entries[-1].get('connect'):
+            samples, label_connect = order_entry_values([x.get('connect') if x else None for x in label_entries])
+            values.append(("Connect-%s" % name, "connect time of '%s'" % label, "milliseconds", label_connect))
 
-    for name, description, unit, data in values:
-        dates = gen_dates(len(data[0][2]))
-        pr.plot_data(name, description, unit, dates, *data)
+    pr = create_performance_report('performance-report', backend=backend, incremental=incremental, thumbnails=thumbnails)
+
+    for name, description, unit, lines in values:
+        dates = gen_dates(len(lines[0][2]))
+        pr.plot_data(name, description, unit, dates, *lines)
 
     pr.create_report(plot_name="Time")
 
+    if 'windows' in data[-1]:
+        make_window_report(data[-1]['windows'], os.path.join('performance-report', 'latest-run'), backend=backend,
+                           thumbnails=thumbnails)
+        add_to_index(os.path.join('performance-report', 'index.html'),
+                     '<p><a href="latest-run/index.html">The latest run over time</a></p>\n')
+
+
+def add_to_index(index_file, html):
+    """ Adds html to the end of the report index. Indexes with a body (the html backend)
+    get it before </body>, the others at the end of the file
+    """
+    with open(index_file) as fh:
+        content = fh.read()
+    end = content.lower().rfind('</body>')
+    if end < 0:
+        content += html
+    else:
+        content = content[:end] + html + content[end:]
+    with open(index_file, 'w') as fh:
+        fh.write(content)
+
+
+def make_window_report(windows, output_dir, backend='png', thumbnails=True):
+    """ Plots the throughput, error rate and percentiles of the time windows of a run """
+    colors = ['b', 'g', 'c', 'y', 'orange', 'm', 'r']
+    size = windows['size']
+    dates = [datetime.datetime.fromtimestamp(windows['start'] + i * size) for i in range(len(windows['throughput']))]
+
+    steady = ""
+    if windows.get('steady-state-start') is not None:
+        steady = ", steady state from %s" % dates[windows['steady-state-start']].strftime("%H:%M:%S")
+
+    values = [("Throughput", "requests per second (%s second windows%s)" % (size, steady), "requests/second",
+               [('b', 'throughput', windows['throughput'], 1)]),
+              ("Error-rate", "failed requests (%s second windows)" % size, "percent",
+               [('r', 'error rate', windows['error-rate'], 2)])]
+    for key, name in (('time', 'Time'), ('latency', 'Latency')):
+        percentiles = sorted(windows[key].items(), key=lambda x: float(x[0]))
+        lines = [(colors[i % len(colors)], "%s_percentile" % p, v, 0) for i, (p, v) in enumerate(percentiles)]
+        values.append((name, "request %s percentiles (%s second windows)" % (key, size), "milliseconds", lines))
+
+    pr = create_performance_report(output_dir, backend=backend, thumbnails=thumbnails)
+    for name, description, unit, lines in values:
+        pr.plot_data(name, description, unit, dates, *lines, date_format="%H:%M:%S")
+
+    pr.create_report(plot_name="Throughput")
+
+
+def label_plot_name(label):
+    """ Returns label in a form usable in plot (file) names.
+
+    Labels with characters that are replaced get a short hash of the label,
+    so labels that only differ in those characters get different names.
+    """
+    name = re.sub(r'[^\w.-]+', '_', label)
+    if name != label:
+        name += '-' + hashlib.sha1(label.encode('utf-8')).hexdigest()[:8]
+    return name
 
 
 def slice_data_dump(dump_file, value):
@@ -108,28 +693,48 @@ def slice_data_dump(dump_file, value):
     if data is None:
         raise RuntimeError("No data found")
 
-    entry = [x[value] for x in data]
+    return slice_entries([x[value] for x in data])
+
+
+def slice_entries(entry):
+    """ Slices a list of run values into lists per value. Runs without values (None) get 0 values
+    """
+    latest = [x for x in entry if x is not None][-1]
     sliced_data = {}
     samples = None
-    for key in list(entry[0].keys()):
+    for key in list(latest.keys()):
         if key == 'samples':
-            samples = [x[key] for x in entry]
+            samples = [x.get(key, 0) if x else 0 for x in entry]
+        elif key == 'histogram':
+            continue
         elif key == 'percentiles':
-            for p in list(entry[0][key].keys()):
-                sliced_data["%s_percentile" % p] = [x[key][p] for x in entry]
+            # Percentiles of the latest run. Older runs may lack some of them
+            for p in list(latest[key].keys()):
+                sliced_data["%s_percentile" % p] = [x[key].get(p, 0) if x else 0 for x in entry]
         else:
-            sliced_data[key] = [x[key] for x in entry]
+            sliced_data[key] = [x.get(key, 0) if x else 0 for x in entry]
 
     return samples, sliced_data
 
 
 def main():
     
-    jtl_file, dump_file, plot_dump = cli()
-    collect_and_append_jtl_results_to_dump_file(dump_file, jtl_file)
+    jtl_files, options = cli()
+    collect_and_append_jtl_results_to_dump_file(options.dump_file, jtl_files, percentiles=options.percentiles,
+                                                workers=options.workers, window=options.window,
+                                                warm_up=options.warm_up, cool_down=options.cool_down,
+                                                history=options.history)
 
-    if plot_dump:
-        make_performance_report(dump_file)
+    if options.merged_runs is not None:
+        for key in ('time', 'latency'):
+            histogram = merge_histograms(options.dump_file, key, runs=options.merged_runs or None)
+            percentiles = histogram.percentiles(options.percentiles)
+            print("%s percentiles of %s samples: %s" % (key, histogram.count,
+                                                        ", ".join("p%s=%.1f" % (p, percentiles[p]) for p in options.percentiles)))
+
+    if options.plot_dump:
+        make_performance_report(options.dump_file, backend=options.backend, incremental=options.incremental,
+                                thumbnails=options.thumbnails)
 
 
 def cli():
@@ -138,7 +743,7 @@ def cli():
     console.setLevel(logging.DEBUG)
     logger.addHandler(console)
 
-    usage_msg = "%prog [options] jtl-result-file"
+    usage_msg = "%prog [options] jtl-result-file|glob [jtl-result-file|glob ...] (xml or csv)"
 
     from optparse import OptionParser
     parser = OptionParser(usage=usage_msg + '\n')
@@ -151,15 +756,65 @@ def cli():
     parser.add_option("-p", "--plot-dump", action="store_true", dest="plot_dump", default=False,
                       help="Creates performance report based on plot")
 
+    parser.add_option("--backend", type="choice", action="store", dest="backend", choices=list(REPORT_BACKENDS), default='png',
+                      help="Report backend, png images or interactive html charts (%s). default is 'png'" % "|".join(REPORT_BACKENDS))
+
+    parser.add_option("--incremental", action="store_true", dest="incremental", default=False,
+                      help="Keep the report folder, and only render plots whose values have changed")
+
+    parser.add_option("--no-thumbnails", action="store_false", dest="thumbnails", default=True,
+                      help="Show the full size plots in the report index, instead of small images")
+
+    default_percentiles = ",".join(str(p) for p in DUMP_PERCENTILES)
+    parser.add_option("--percentiles", type="string", action="store", dest="percentiles", default=default_percentiles,
+                      help="Comma separated percentiles to calculate. default is '%s'" % default_percentiles)
+
+    parser.add_option("-w", "--window", type="int", action="store", dest="window", default=DEFAULT_WINDOW,
+                      help="Size in seconds of the time windows of a run. default is %s" % DEFAULT_WINDOW)
+
+    parser.add_option("--warm-up", type="string", action="store", dest="warm_up", default=None,
+                      help="Leave out the warm-up of each jtl file. Either seconds ('60s') or number of samples ('1000')")
+
+    parser.add_option("--cool-down", type="string", action="store", dest="cool_down", default=None,
+                      help="Leave out the cool-down of each jtl file. Either seconds ('60s') or number of samples ('1000')")
+
+    parser.add_option("--history", type="string", action="store", dest="history", default=None,
+                      help="History database (sqlite) to add the run to, see performance_history")
+
+    parser.add_option("--merged-runs", type="int", action="store", dest="merged_runs", default=None,
+                      help="Print the percentiles of the histograms merged over the latest MERGED_RUNS runs of the dump "
+                           "(0 for all runs)")
+
+    parser.add_option("-j", "--workers", type="int", action="store", dest="workers", default=None,
+                      help="Number of processes parsing jtl files. default is the number of cpus")
+
     (options, args) = parser.parse_args()
 
     if len(args) < 1:
         parser.error('Need jtl result file')
 
-    if not os.path.exists(args[0]):
-        parser.error('jtl result file "%s" does not exist' % args[0])
+    if options.incremental and options.backend != 'png':
+        parser.error('--incremental is only supported by the png backend')
+
+    jtl_files = []
+    for arg in args:
+        matches = sorted(glob.glob(arg))
+        if not matches:
+            parser.error('jtl result file "%s" does not exist' % arg)
+        jtl_files.extend(x for x in matches if x not in jtl_files)
+
+    try:
+        options.percentiles = [float(p) if '.' in p else int(p) for p in options.percentiles.split(',')]
+    except ValueError:
+        parser.error('Invalid percentiles "%s"' % options.percentiles)
+
+    try:
+        options.warm_up = parse_trim(options.warm_up)
+        options.cool_down = parse_trim(options.cool_down)
+    except ValueError:
+        parser.error('Invalid warm-up/cool-down "%s"/"%s"' % (options.warm_up, options.cool_down))
 
-    return args[0], options.dump_file, options.plot_dump
+    return jtl_files, options
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""
+:mod:`os_perftest.performance_assertion_suite` -- declarative assertions
+========================================================================
+
+Assertions on a dump, declared in an ini file in the style of the
+config_parser graphs. The dump is read and flattened once, and all
+assertions are evaluated on it. The results can be written as a JUnit xml
+report (for Jenkins) and as json.
+
+Example::
+
+    [main]
+    datafile = performance-dump.json
+
+    [no-errors]
+    jolokiaurl = metrics
+    mbean = "name=errors,type=counters"
+    path = /value/Count
+    operator = ==
+    value = 0
+
+    [search-time]
+    jolokiaurl = metrics
+    mbean = "name=search,type=timers"
+    path = /value/95thPercentile
+    sample = max
+    min = 0
+    max = 500
+
+    [request-rate]
+    type = rate
+    jolokiaurl = metrics
+    mbean = "name=requests,type=meters"
+    path = /value/Count
+    sample = mean
+    min = 10
+
+    [error-ratio]
+    type = counter-ratio
+    jolokiaurl = metrics
+    mbean = "name=errors,type=counters"
+    path = /value/Count
+    otherMbean = "name=requests,type=meters"
+    otherPath = /value/Count
+    sample = all
+    max = 0.01
+
+    [heap-share]
+    type = ratio
+    max = 0.9
+        [[numerator]]
+        jolokiaurl = java.lang
+        mbean = "type=Memory"
+        path = /value/HeapMemoryUsage/used
+        [[denominator]]
+        jolokiaurl = java.lang
+        mbean = "type=Memory"
+        path = /value/HeapMemoryUsage/max
+
+The type of an assertion gives the series it checks:
+
+ * value (default): the values at path
+ * rate: the increase per second of a counter between consecutive
+   samples (the timestamps are read from timestampPath, default
+   /timestamp)
+ * counter-ratio: the increase of the counter relative to the increase of
+   the counter at otherPath (in otherMbean of otherJolokiaurl, default the
+   mbean of the assertion), ie. the error ratio
+ * hit-rate: the increase of the counter relative to the sum of the
+   increases of both counters, ie. the cache hit rate from hits and misses
+ * gauge-rate: the change per second of a gauge (ie. the used heap)
+   between consecutive samples, negative when it decreases
+ * ratio: the numerator values divided by the denominator values
+
+rate, counter-ratio and hit-rate are for counters: a decrease is taken
+as a counter reset (ie. a restart of the service), see
+performance_derive. Use gauge-rate for values that may decrease.
+
+sample reduces the series to the value checked: last (default), first,
+min, max or mean. all checks every value of the series. The value is
+checked against operator and value (<, <=, ==, !=, >=, >), and against
+min and max (inclusive), whichever are given.
+
+jolokiaurl and mbean are the keys of the mbean in the dump entries (the
+domain and the mbean name), as in the config_parser graphs. Without
+them, path is a '/' separated path from the top of the dump entries
+(ie. 'time/percentiles/95' in a jtl dump).
+"""
+from configobj import ConfigObj
+import json
+import logging
+import operator
+import os
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+
+import os_perftest.performance_derive as derive
+import os_perftest.performance_dumper as dumper
+from os_perftest.performance_store import is_number
+
+logger = logging.getLogger("dbc." + __name__)
+
+TYPES = ('value', 'ratio') + derive.DERIVATIONS
+
+OPERATORS = {'<': operator.lt,
+             '<=': operator.le,
+             '==': operator.eq,
+             '!=': operator.ne,
+             '>=': operator.ge,
+             '>': operator.gt}
+
+SAMPLES = {'last': lambda x: x[-1],
+           'first': lambda x: x[0],
+           'min': min,
+           'max': max,
+           'mean': lambda x: sum(x) / float(len(x))}
+
+
+class AssertionConfigError(Exception):
+    pass
+
+
+class AssertionDataError(Exception):
+    pass
+
+
+def parse_assertions(config_file):
+    """ Reads and validates the assertions in config_file, returns (datafile, assertions) """
+    config = ConfigObj(config_file)
+    if "main" not in config or "datafile" not in config["main"]:
+        raise AssertionConfigError("Could not find 'main' entry with datafile in %s" % config_file)
+
+    assertions = []
+    for name in [x for x in list(config.keys()) if x != "main"]:
+        assertions.append(validate_assertion(name, dict(config[name])))
+    return config["main"]["datafile"], assertions
+
+
+def validate_assertion(name, assertion):
+    """ Validates an assertion, and sets its defaults """
+    assertion['name'] = name
+    assertion.setdefault('type', 'value')
+    assertion.setdefault('sample', 'last')
+
+    if assertion['type'] not in TYPES:
+        raise AssertionConfigError("Unknown type '%s' in '%s', must be one of %s" % (assertion['type'], name, ", ".join(TYPES)))
+    if assertion['sample'] != 'all' and assertion['sample'] not in SAMPLES:
+        raise AssertionConfigError("Unknown sample '%s' in '%s'" % (assertion['sample'], name))
+
+    if assertion['type'] == 'ratio':
+        for part in ('numerator', 'denominator'):
+            if not isinstance(assertion.get(part), dict):
+                raise AssertionConfigError("Could not find [[%s]] in ratio '%s'" % (part, name))
+            _validate_source(name, assertion[part])
+    else:
+        _validate_source(name, assertion)
+
+    if assertion['type'] in derive.PAIRED_DERIVATIONS:
+        if 'otherPath' not in assertion:
+            raise AssertionConfigError("Could not find otherPath in '%s'" % name)
+        other = {'path': assertion['otherPath']}
+        if 'jolokiaurl' in assertion or 'otherJolokiaurl' in assertion:
+            other['jolokiaurl'] = assertion.get('otherJolokiaurl', assertion.get('jolokiaurl'))
+            other['mbean'] = assertion.get('otherMbean', assertion.get('mbean'))
+        _validate_source(name, other)
+        assertion['other'] = other
+
+    if 'operator' in assertion or 'value' in assertion:
+        if assertion.get('operator') not in OPERATORS:
+            raise AssertionConfigError("operator in '%s' must be one of %s" % (name, " ".join(OPERATORS)))
+        if 'value' not in assertion:
+            raise AssertionConfigError("Could not find value in '%s'" % name)
+    elif 'min' not in assertion and 'max' not in assertion:
+        raise AssertionConfigError("'%s' needs operator and value, or min and/or max" % name)
+
+    try:
+        for key in ('value', 'min', 'max'):
+            if key in assertion:
+                assertion[key] = float(assertion[key])
+    except ValueError as error:
+        raise AssertionConfigError("Invalid number in '%s': %s" % (name, error))
+
+    return assertion
+
+
+def _validate_source(name, source):
+    if "path" not in source:
+        raise AssertionConfigError("Could not find path in '%s'" % name)
+    if ("jolokiaurl" in source) != ("mbean" in source):
+        raise AssertionConfigError("'%s' needs both jolokiaurl and mbean, or none of them" % name)
+    if isinstance(source.get("mbean"), list):
+        # unquoted mbean names are split on ',' by ConfigObj
+        source["mbean"] = ",".join(source["mbean"])
+    source.setdefault("timestampPath", "/timestamp")
+
+
+def _values(store, source, path_key="path"):
+    if "jolokiaurl" in source:
+        if source["jolokiaurl"] not in store.entries:
+            raise AssertionDataError("Could not find %s in entries" % source["jolokiaurl"])
+        return store.lookup(source["jolokiaurl"], source["mbean"], source[path_key], default=None)
+    path = source[path_key]
+    return store.values(path[1:] if path.startswith("/") else path, default=None)
+
+
+def assertion_series(store, assertion):
+    """ Returns the series of values checked by assertion """
+    if assertion['type'] == 'ratio':
+        numerators = _values(store, assertion['numerator'])
+        denominators = _values(store, assertion['denominator'])
+        return [float(n) / d for n, d in zip(numerators, denominators) if is_number(n) and is_number(d) and d != 0]
+
+    values = _values(store, assertion)
+    if assertion['type'] in derive.DERIVATIONS:
+        timestamps = _values(store, assertion, "timestampPath")
+        others = _values(store, assertion['other']) if 'other' in assertion else None
+        values = derive.derive(assertion['type'], timestamps, values, others)
+
+    return [x for x in values if is_number(x)]
+
+
+def check_value(assertion, value):
+    """ Returns a failure message if value does not satisfy assertion, or None """
+    if 'operator' in assertion and not OPERATORS[assertion['operator']](value, assertion['value']):
+        return "%s is not %s %s" % (value, assertion['operator'], assertion['value'])
+    if 'min' in assertion and value < assertion['min']:
+        return "%s is below minimum %s" % (value, assertion['min'])
+    if 'max' in assertion and value > assertion['max']:
+        return "%s is above maximum %s" % (value, assertion['max'])
+    return None
+
+
+def evaluate_assertion(store, assertion):
+    """ Evaluates assertion on store, returns the result as a dict with 'status' passed, failed or error """
+    start = time.time()
+    result = {'name': assertion['name'], 'type': assertion['type'], 'sample': assertion['sample']}
+    try:
+        series = assertion_series(store, assertion)
+        if not series:
+            raise AssertionDataError("No values for '%s'" % assertion['name'])
+
+        if assertion['sample'] == 'all':
+            result['value'] = series
+            messages = [check_value(assertion, x) for x in series]
+            failures = [x for x in messages if x is not None]
+            message = "%s of %s values fail, first: %s" % (len(failures), len(series), failures[0]) if failures else None
+        else:
+            result['value'] = SAMPLES[assertion['sample']](series)
+            message = check_value(assertion, result['value'])
+
+        result['status'] = 'failed' if message is not None else 'passed'
+        if message is not None:
+            result['message'] = message
+    except AssertionDataError as error:
+        result['status'] = 'error'
+        result['message'] = str(error)
+
+    result['time'] = time.time() - start
+    return result
+
+
+def evaluate_assertions(dump, assertions):
+    """ Evaluates all assertions on a single read of dump (a MBeanDumper), returns list of results """
+    store = dump.read_store()
+    results = []
+    for assertion in assertions:
+        result = evaluate_assertion(store, assertion)
+        logger.debug("Assertion %s: %s", assertion['name'], result['status'])
+        results.append(result)
+    return results
+
+
+def write_junit_report(results, filename, suite_name="performance-assertions"):
+    """ Writes the results as a JUnit xml report """
+    suite = ElementTree.Element("testsuite", name=suite_name, tests=str(len(results)),
+                                failures=str(len([x for x in results if x['status'] == 'failed'])),
+                                errors=str(len([x for x in results if x['status'] == 'error'])),
+                                time="%.3f" % sum(x['time'] for x in results))
+    for result in results:
+        case = ElementTree.SubElement(suite, "testcase", classname=suite_name, name=result['name'], time="%.3f" % result['time'])
+        if result['status'] == 'failed':
+            ElementTree.SubElement(case, "failure", message=result['message']).text = result['message']
+        elif result['status'] == 'error':
+            ElementTree.SubElement(case, "error", message=result['message']).text = result['message']
+
+    ElementTree.ElementTree(suite).write(filename, encoding="utf-8", xml_declaration=True)
+
+
+def write_json_report(results, filename):
+    with open(filename, 'w') as fh:
+        json.dump({'passed': all(x['status'] == 'passed' for x in results), 'assertions': results}, fh, indent=2)
+
+
+def run_assertions(config_file, junit_file=None, json_file=None, datafile=None):
+    """ Evaluates the assertions in config_file, and writes the reports.
+
+    datafile overrides the dump file of the config. Returns True if all assertions passed
+    """
+    config_datafile, assertions = parse_assertions(config_file)
+    datafile = datafile or config_datafile
+    if not os.path.exists(datafile):
+        raise AssertionDataError("Dump file %s does not exist" % datafile)
+
+    results = evaluate_assertions(dumper.MBeanDumper(datafile), assertions)
+    for result in results:
+        if result['status'] != 'passed':
+            logger.error("Assertion %s %s: %s", result['name'], result['status'], result['message'])
+
+    if junit_file:
+        write_junit_report(results, junit_file)
+    if json_file:
+        write_json_report(results, json_file)
+    return all(x['status'] == 'passed' for x in results)
+
+
+def main():
+    config_file, options = cli()
+    try:
+        passed = run_assertions(config_file, options.junit, options.json, options.dump_file)
+    except (AssertionConfigError, AssertionDataError) as error:
+        logger.error("Could not evaluate assertions: %s", error)
+        sys.exit(2)
+    sys.exit(0 if passed else 1)
+
+
+def cli():
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    usage_msg = "%prog [options] assertions-file"
+
+    from optparse import OptionParser
+    parser = OptionParser(usage=usage_msg + '\n')
+
+    parser.add_option("-d", "--dump-file", type="string", action="store", dest="dump_file", default=None,
+                      help="Dump file to check. default is the datafile in the assertions file")
+
+    parser.add_option("--junit", type="string", action="store", dest="junit", default=None,
+                      help="File to write JUnit xml report to")
+
+    parser.add_option("--json", type="string", action="store", dest="json", default=None,
+                      help="File to write json report to")
+
+    (options, args) = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error('Need one assertions file')
+
+    return args[0], options
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@
 :mod:`os_perftest.performance_assertions` -- assert statements
 ==============================================================
 """
+import os_perftest.performance_regression as regression
 
 def assertZero( dump, entry, path ):
     key = path.split( '/' )[-1]
@@ -17,3 +18,11 @@ def assertNotZero( dump, entry, path ):
     value = dump.read_values( entry, path )[-1]
     if int( value ) == 0:
         raise Exception("%s is zero"%key)
+
+def assertNoRegression( dump, *checks ):
+    """ Raises if the latest runs in dump (a MBeanDumper) have regressed, by the
+    checks of os_perftest.performance_regression (DEFAULT_CHECKS if none are given)
+    """
+    verdict = regression.check_regressions( dump.read_dump(), regression.normalize_checks( checks or regression.DEFAULT_CHECKS ) )
+    if verdict['verdict'] != 'pass':
+        raise Exception("Performance regression in %s"%", ".join( verdict['regressions'] ))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""
+:mod:`os_perftest.performance_derive` -- derived series of counters
+===================================================================
+
+Cumulative counters (ie. the Count attribute of a meter) only grow,
+until the service restarts and the counter starts again from 0. The
+functions here turn such counters into values per sample interval:
+
+ * rate: the increase of a counter per second
+ * counter-ratio: the increase of one counter relative to the increase of
+   another (ie. errors / requests, the error ratio)
+ * hit-rate: the increase of one counter relative to the sum of the
+   increases of both (ie. hits / (hits + misses), the cache hit rate)
+
+A counter lower than in the sample before has been reset, and its
+increase in that interval is taken to be its value.
+
+Gauges (ie. the used heap, or the length of a queue) go up and down, so
+a decrease is not a reset. For them there is:
+
+ * gauge-rate: the change of a gauge per second, negative when it
+   decreases
+
+All derived series have the length of the input, with a value for each
+sample from the interval ending at it. The first sample, and samples
+where a value is missing (None), get None.
+"""
+
+from os_perftest.performance_store import is_number
+
+DERIVATIONS = ('rate', 'counter-ratio', 'hit-rate', 'gauge-rate')
+
+# Derivations of two counters
+PAIRED_DERIVATIONS = ('counter-ratio', 'hit-rate')
+
+
+def counter_deltas(values):
+    """ Returns the increase of the counter in each interval, with counter resets detected """
+    deltas = [None] * len(values)
+    for i in range(1, len(values)):
+        previous, value = values[i - 1], values[i]
+        if not is_number(previous) or not is_number(value):
+            continue
+        deltas[i] = value - previous if value >= previous else value
+    return deltas
+
+
+def counter_resets(values):
+    """ Returns the indices of the samples where the counter was reset """
+    return [i for i in range(1, len(values))
+            if is_number(values[i - 1]) and is_number(values[i]) and values[i] < values[i - 1]]
+
+
+def gauge_deltas(values):
+    """ Returns the change of the gauge in each interval (negative for a decrease) """
+    deltas = [None] * len(values)
+    for i in range(1, len(values)):
+        previous, value = values[i - 1], values[i]
+        if is_number(previous) and is_number(value):
+            deltas[i] = value - previous
+    return deltas
+
+
+def _rates(timestamps, deltas):
+    """ Returns deltas per second. Intervals without time between the samples get None """
+    rates = [None] * len(deltas)
+    for i, delta in enumerate(deltas):
+        if delta is None or not is_number(timestamps[i - 1]) or not is_number(timestamps[i]):
+            continue
+        seconds = timestamps[i] - timestamps[i - 1]
+        if seconds > 0:
+            rates[i] = delta / float(seconds)
+    return rates
+
+
+def counter_rates(timestamps, values):
+    """ Returns the increase of the counter per second in each interval.
+    timestamps are in seconds. Intervals without time between the samples get None
+    """
+    return _rates(timestamps, counter_deltas(values))
+
+
+def gauge_rates(timestamps, values):
+    """ Returns the change of the gauge per second in each interval.
+    timestamps are in seconds. Intervals without time between the samples get None
+    """
+    return _rates(timestamps, gauge_deltas(values))
+
+
+def counter_ratio(numerators, denominators):
+    """ Returns the increase of numerators relative to the increase of denominators in each interval.
+    Intervals where the denominator did not increase get None
+    """
+    result = [None] * len(numerators)
+    for i, (numerator, denominator) in enumerate(zip(counter_deltas(numerators), counter_deltas(denominators))):
+        if numerator is not None and denominator:
+            result[i] = numerator / float(denominator)
+    return result
+
+
+def hit_rate(hits, misses):
+    """ Returns hits / (hits + misses) of the increases in each interval.
+    Intervals without hits or misses get None
+    """
+    result = [None] * len(hits)
+    for i, (hit, miss) in enumerate(zip(counter_deltas(hits), counter_deltas(misses))):
+        if hit is not None and miss is not None and hit + miss > 0:
+            result[i] = hit / float(hit + miss)
+    return result
+
+
+def derive(derivation, timestamps, values, others=None):
+    """ Returns the derivation (one of DERIVATIONS) of values.
+
+    others are the second counter of counter-ratio (the denominator) and
+    hit-rate (the misses)
+    """
+    if derivation == 'rate':
+        return counter_rates(timestamps, values)
+    if derivation == 'gauge-rate':
+        return gauge_rates(timestamps, values)
+    if derivation not in DERIVATIONS:
+        raise ValueError("Unknown derivation '%s', must be one of %s" % (derivation, ", ".join(DERIVATIONS)))
+    if others is None:
+        raise ValueError("Derivation '%s' needs a second counter" % derivation)
+    if derivation == 'counter-ratio':
+        return counter_ratio(values, others)
+    return hit_rate(values, others)
+
+
+def fill_missing(values, default=0):
+    """ Returns values with None replaced by default """
+    return [default if x is None else x for x in values]
@@ -6,11 +6,18 @@
 ===================================================================
 """
 import urllib.request, urllib.error, urllib.parse
+import http.client
 import logging
 import datetime
+import gzip
 import os
 import json
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from os_perftest.performance_store import DumpStore
 
 
 class NullHandler( logging.Handler ):
@@ -24,21 +31,166 @@ class NullHandler( logging.Handler ):
 logger = logging.getLogger( "dbc." + __name__ )
 logger.addHandler( NullHandler() )
 
+# Phases of entries which are left out of plots
+TRIMMED_PHASES = ( 'warm-up', 'cool-down' )
+
+
+class HTTPStatusError( http.client.HTTPException ):
+    """ Raised for http error responses (status 400 and above)
+    """
+
+    def __init__( self, status, message ):
+        http.client.HTTPException.__init__( self, message )
+        self.status = status
+
+
+class ConnectionPool( object ):
+    """
+    Pool of persistent (keep-alive) http connections to a single host:port.
+
+    At most size connections are open at the same time. Idle connections
+    are reused by later requests, and responses are gzip decoded if the
+    server compresses them.
+    """
+
+    def __init__( self, scheme, host, port, size=4, timeout=10 ):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore( size )
+
+    def request( self, method, path, body=None, headers=None, timeout=None ):
+        """ Performs request on a pooled connection, and returns the response body
+        """
+        headers = dict( headers or {} )
+        headers.setdefault( 'Accept-Encoding', 'gzip' )
+        if timeout is None:
+            timeout = self.timeout
+
+        with self._semaphore:
+            conn, reused = self._acquire()
+            try:
+                response, content = self._send( conn, method, path, body, headers, timeout )
+            except ( http.client.RemoteDisconnected, ConnectionError ):
+                conn.close()
+                if not reused:
+                    raise
+                # The server has closed the idle connection. Retry once on a new one
+                logger.debug( "Stale connection to %s:%s, reconnecting"%( self.host, self.port ) )
+                conn = self._connect()
+                response, content = self._send( conn, method, path, body, headers, timeout )
+            except Exception:
+                conn.close()
+                raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._release( conn )
+
+        if response.status >= 400:
+            raise HTTPStatusError( response.status, "HTTP error %s %s from %s:%s%s"%( response.status, response.reason, self.host, self.port, path ) )
+
+        if response.getheader( 'Content-Encoding', '' ).lower() == 'gzip':
+            content = gzip.decompress( content )
+
+        return content
+
+    def close( self ):
+        """ Closes all idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _send( self, conn, method, path, body, headers, timeout ):
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout( timeout )
+        conn.request( method, path, body=body, headers=headers )
+        response = conn.getresponse()
+        return response, response.read()
+
+    def _acquire( self ):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _release( self, conn ):
+        with self._lock:
+            self._idle.append( conn )
+
+    def _connect( self ):
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection( self.host, self.port, timeout=self.timeout )
+        return http.client.HTTPConnection( self.host, self.port, timeout=self.timeout )
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_connection_pool( url, size=4, timeout=10 ):
+    """ Returns the connection pool shared by all connectors to the host:port of url.
+
+    size and timeout are only used when the pool is created.
+    """
+    parts = urllib.parse.urlsplit( url )
+    scheme = parts.scheme or 'http'
+    port = parts.port or ( 443 if scheme == 'https' else 80 )
+    key = ( scheme, parts.hostname, port )
+    with _pools_lock:
+        pool = _pools.get( key )
+        if pool is None:
+            pool = ConnectionPool( scheme, parts.hostname, port, size=size, timeout=timeout )
+            _pools[key] = pool
+    return pool
+
 
 class JolokiaConnector( object ):
     """
     Jolokia connector object designed for jmx communication.
     This is a copy of the class found in os_python.jolokia
+
+    Connections are kept alive and shared through a connection pool per
+    host:port. timeout is the socket timeout of a single request.
     """
 
-    def __init__( self, url ):
+    def __init__( self, url, pool_size=4, timeout=10 ):
         self.url = url
+        self.timeout = timeout
+        self.pool = get_connection_pool( url, size=pool_size, timeout=timeout )
 
     def list( self ):
         """
         """
         return self._request( "/".join( [self.url, 'list'] ) )
 
+    def bulk_read( self, mBeans ):
+        """ Reads all attributes of the given mBeans in one bulk request.
+
+        All read operations are posted as a single json array, and the
+        responses are returned in the same order as the requested mBeans.
+        Raises RuntimeError if the service does not answer with a response
+        per mBean (ie. if bulk requests are not allowed by its policy).
+        """
+        operations = [ { "type": "read", "mbean": mBean } for mBean in mBeans ]
+        if not operations:
+            return []
+
+        request_url = self.url + "/?ignoreErrors=true"
+
+        responses = self._request( request_url, data=operations )
+        if not isinstance( responses, list ) or len( responses ) != len( operations ):
+            raise RuntimeError( "Unexpected response to bulk read of %s mBeans from %s"%( len( operations ), self.url ) )
+
+        return responses
+
     def read( self, mBean, attribute=None, inner_path=None ):
         """
         """
@@ -62,18 +214,40 @@ class JolokiaConnector( object ):
 
         return self._request( request_url )
 
-    def _request( self, url, latency=30 ):
+    def _request( self, url, latency=30, data=None ):
         """ Retrieves content from url.
+
+        If data is given, it is posted as json (used for bulk requests), and
+        the status of each response in the returned list is checked.
+
+        Failed requests are retried until latency seconds have passed,
+        except for http client errors (status 4xx), which are raised at once.
         """
 
         logger.debug( "Requesting jolokia service with url: %s (latency=%s senconds)"%( url, latency ) )
         endtime = datetime.datetime.now() + datetime.timedelta( 0, latency )
 
-        response = None
-        while response == None:
+        body = None
+        headers = {}
+        if data is not None:
+            body = json.dumps( data ).encode( 'utf-8' )
+            headers['Content-Type'] = 'application/json'
+
+        parts = urllib.parse.urlsplit( url )
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        method = "GET" if body is None else "POST"
+
+        response_str = None
+        while response_str == None:
             try:
-                response = urllib.request.urlopen( url )
-                response_str = response.read()
+                response_str = self.pool.request( method, path, body=body, headers=headers, timeout=self.timeout )
+            except HTTPStatusError as e:
+                # Client errors are not retried, the same request gets the same answer
+                if e.status < 500 or datetime.datetime.now() > endtime:
+                    logger.error( "Request to jolokia service failed: %s"%e )
+                    raise
             except Exception as e:
                 if datetime.datetime.now() > endtime:
                     err_msg = "Could not retrieve response in %s seconds. Latest error mesg %s"%( latency, e )
@@ -81,6 +255,17 @@ class JolokiaConnector( object ):
                     raise e
 
         result = json.loads( response_str )
+        if isinstance( result, list ):
+            for entry in result:
+                self._check_status( entry )
+        else:
+            self._check_status( result )
+
+        return result
+
+    def _check_status( self, result ):
+        """ Checks the status of a single jolokia response
+        """
         status = result['status']
         if status != 200:
             err_msg = "Could not retrieve response from Jolokia App: error Code: %s"%status
@@ -92,26 +277,77 @@ class JolokiaConnector( object ):
                 logger.error( "Original Response %s"%result )
                 raise RuntimeError( err_msg )
 
-        return result
+
+# Number of entries in the dump files appended to by this process
+_entry_counts = {}
+_entry_counts_lock = threading.Lock()
+
+def _set_entry_count( dump_file, count ):
+    with _entry_counts_lock:
+        _entry_counts[os.path.abspath( dump_file )] = count
 
 
 class MBeanDumper( object ):
 
-    def __init__( self, dump_file ):
+    def __init__( self, dump_file, bulk=True, concurrency=8 ):
         """ Initializes mBean dumper
+
+        If bulk is True, all mBeans in a domain are read with a single
+        jolokia bulk request, instead of one request per mBean. Services
+        refusing the bulk request are read one mBean at a time.
+
+        concurrency is the maximum number of jolokia services sampled at
+        the same time.
         """
         self.dump_file = dump_file
+        self.bulk = bulk
+        self.concurrency = concurrency
 
     def dump( self, *mBean_pair, **kwargs):
+        """ Appends a new entry to the dump file
+
+        Entries are appended as single lines. The history is truncated by
+        compacting the file once it holds compact_every entries more than
+        the retained count. The entries of the file are counted once per
+        process, and then by the appends, so a dump does not read the
+        file. Dump files in the old json array format are converted on the
+        first dump.
+
+        If phase is given (ie. 'warm-up', 'steady' or 'cool-down'), it is
+        stored in the entry. Entries in TRIMMED_PHASES are left out of
+        read_store.
+
+        If history is given (a sqlite database, see performance_history),
+        the entry is also added to run in the history, which keeps it
+        after it is truncated from the dump file.
+        """
 
         # Max history 70 plots. Older data will be truncated
         count = kwargs.get('count', 70);
+        compact_every = kwargs.get('compact_every', 10)
+        phase = kwargs.get('phase')
+        history = kwargs.get('history')
 
-        full_dump = self._read_dump()
         entry = self._dump_mBeans( *mBean_pair )
-        full_dump = full_dump[-count:]
-        full_dump.append( entry )
-        self._write_dump( full_dump )
+        if phase is not None:
+            entry['phase'] = phase
+
+        if history is not None:
+            from os_perftest.performance_history import record_mbean_entry
+            record_mbean_entry( history, entry, kwargs.get( 'run' ) or os.path.basename( self.dump_file ),
+                                source=self.dump_file )
+
+        if self._is_array_dump():
+            full_dump = self._read_dump()
+            full_dump = full_dump[-count:]
+            full_dump.append( entry )
+            self._write_dump( full_dump )
+            _set_entry_count( self.dump_file, len( full_dump ) )
+            return
+
+        self._append_entry( entry )
+        if self._count_append() > count + 1 + compact_every:
+            self._compact( count + 1 )
 
     def read_values( self, entry, path ):
         """ Constructs list of values found at path for the specific entry
@@ -123,103 +359,216 @@ class MBeanDumper( object ):
     def read_values_from_dump( self, dump, entry, path, id=None ):
         """ Constructs list of values found at path for the specific entry
         """
-        if len( dump ) < 1:
-            print("No entries in dump")
-
-        entries = []
-        for e in dump:
-            entries += list(e.keys())
-
-        entries = list(set(entries))
-
-        if not entry in entries:
+        store = self._store_for( dump )
+        if not entry in store.entries:
             print("Could not find %s in entries"%entry)
 
-        values = []
-
         path = [str( x ) for x in path.split( "/" )]
         path.insert(0, str( entry ) )
-        
+
         if id:
             path.insert(1, str( id ) )
-        
-        for entry in dump:
-
-            self.val = 0
-            self._walk( entry, tuple( path ) ),
-            values.append( self.val )
 
-        return values
+        return store.values( tuple( path ) )
 
     def read_values_from_dump_new( self, dump, entry, mbean, path):
         """ Constructs list of values found at path for the specific entry
         """
-        if len( dump ) < 1:
-            print("No entries in dump")
+        store = self._store_for( dump )
+        if not entry in store.entries:
+            print("Could not find %s in entries"%entry)
 
-        entries = []
-        for e in dump:
-            entries += list(e.keys())
+        return store.lookup( entry, mbean, path )
 
-        entries = list(set(entries))
-        
-        if not entry in entries:
-            print("Could not find %s in entries"%entry)
+    def read_store( self, include_trimmed=False ):
+        """ Reads the dump into a columnar DumpStore
 
-        values = []
-        
-        if "/" is path[0:1]:
-            path = path[1:]
+        Warm-up and cool-down entries are left out, unless include_trimmed is True
+        """
+        return DumpStore( self.read_dump( include_trimmed ) )
+
+    def read_dump( self, include_trimmed=False ):
+        """ Reads the entries of the dump
+
+        Warm-up and cool-down entries are left out, unless include_trimmed is True
+        """
+        dump = self._read_dump()
+        if not include_trimmed:
+            dump = [ entry for entry in dump if entry.get( 'phase' ) not in TRIMMED_PHASES ]
+        return dump
+
+    def _store_for( self, dump ):
+        """ Returns a DumpStore for dump. The store is reused by later
+        lookups in the same (unchanged) dump
+        """
+        cached = getattr( self, '_store_cache', None )
+        if cached is None or cached[0] is not dump or cached[1].samples != len( dump ):
+            cached = ( dump, DumpStore( dump ) )
+            self._store_cache = cached
+
+        store = cached[1]
+        if store.samples < 1:
+            print("No entries in dump")
+
+        return store
 
-        path = [str( x ) for x in path.split( "/" )]
-        path.insert(0, str( entry ) )
-        path.insert(1, str( mbean ) )
-        
-        for entry in dump:
-
-            self.val = 0
-            self._walk( entry, tuple( path ) ),
-            values.append( self.val )
-        
-        return values
-    
     def _dump_mBeans( self, *mBean_pair ):
         """
         a mBean pair consists of a jolokia url where the mbeanserver is exposed, and the name of a mBean server to dump
+
+        All pairs are sampled concurrently. The start and end time of each
+        sample is recorded in the 'sampling' list of the entry.
         """
 
         entry = {}
+        sampling = []
 
-        for pair in mBean_pair:
+        workers = max( 1, min( self.concurrency, len( mBean_pair ) ) )
+        with ThreadPoolExecutor( max_workers=workers ) as executor:
+            samples = list( executor.map( lambda pair: self._sample_mBeans( *pair ), mBean_pair ) )
+
+        for pair, ( mBeans, start, end ) in zip( mBean_pair, samples ):
             if pair[1] not in entry:
                 entry[pair[1]] = {}
-            logger.info( "Requesting jolokia with url %s"%pair[0] )
-            con = JolokiaConnector( pair[0] )
-            keys = list(con.list()['value'][pair[1]].keys())
-            for key in keys:
-                entry[pair[1]][key] = con.read( pair[1] + ":" + key)
+            entry[pair[1]].update( mBeans )
+            sampling.append( { 'url': pair[0], 'domain': pair[1], 'start': start, 'end': end } )
+
+        if sampling:
+            entry['sampling'] = sampling
+            logger.debug( "Sampled %s services with a skew of %.3f seconds"%( len( sampling ), sample_skew( entry ) ) )
 
         return entry
 
+    def _sample_mBeans( self, url, domain ):
+        """ Reads all mBeans of domain from a single jolokia service
+
+        returns the mBeans together with the start and end time of the sample
+        """
+        logger.info( "Requesting jolokia with url %s"%url )
+        start = time.time()
+        mBeans = {}
+        con = JolokiaConnector( url, pool_size=self.concurrency )
+        keys = list(con.list()['value'][domain].keys())
+        responses = None
+        if self.bulk:
+            try:
+                responses = con.bulk_read( [ domain + ":" + key for key in keys ] )
+            except ( RuntimeError, http.client.HTTPException ) as e:
+                logger.warning( "Bulk read from %s failed, reading mBeans one at a time: %s"%( url, e ) )
+
+        if responses is not None:
+            for key, response in zip( keys, responses ):
+                mBeans[key] = response
+        else:
+            for key in keys:
+                mBeans[key] = con.read( domain + ":" + key)
+
+        return mBeans, start, time.time()
+
     def _read_dump( self ):
         """ reads dump from file
+
+        Both line delimited dumps (one entry per line) and dumps in the old
+        json array format are supported. A line that cannot be decoded (an
+        append interrupted by a crash) is skipped.
         """
-        dump = "[]"
+        content = ""
         if os.path.exists( self.dump_file ):
-            fh = open( self.dump_file )
-            content = fh.read()
-            fh.close()
-            if content.strip() != "":
-                dump = content
+            with open( self.dump_file ) as fh:
+                content = fh.read()
+
+        stripped = content.strip()
+        if stripped == "":
+            return []
+        if stripped.startswith( "[" ):
+            return json.loads( stripped )
+
+        dump = []
+        for line in stripped.split( "\n" ):
+            if line.strip() == "":
+                continue
+            try:
+                dump.append( json.loads( line ) )
+            except ValueError:
+                logger.warning( "Skipping corrupt entry in dump file %s"%self.dump_file )
 
-        return json.loads( dump )
+        return dump
 
     def _write_dump( self, dump ):
-        """ Writes dump to file
+        """ Writes dump to file, one entry per line
+
+        The file is written to a temporary file and renamed, so the dump
+        is replaced atomically.
+        """
+        self._replace_lines( [ self._encode_entry( entry ) for entry in dump ] )
+
+    def _append_entry( self, entry ):
+        """ Appends a single entry to the dump file with one write
         """
-        fh = open( self.dump_file, 'w' )
-        fh.write( json.dumps( dump, indent=4 ) )
-        fh.close()
+        data = self._encode_entry( entry )
+        fd = os.open( self.dump_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644 )
+        try:
+            # Terminate a line left unfinished by an interrupted append
+            if os.fstat( fd ).st_size > 0:
+                with open( self.dump_file, 'rb' ) as fh:
+                    fh.seek( -1, os.SEEK_END )
+                    if fh.read( 1 ) != b"\n":
+                        data = b"\n" + data
+            while data:
+                written = os.write( fd, data )
+                data = data[written:]
+            os.fsync( fd )
+        finally:
+            os.close( fd )
+
+    def _count_append( self ):
+        """ Returns the number of entries in the dump file after an append.
+        The file is only read the first time this process appends to it
+        """
+        with _entry_counts_lock:
+            key = os.path.abspath( self.dump_file )
+            if key in _entry_counts:
+                _entry_counts[key] += 1
+            else:
+                _entry_counts[key] = len( self._read_lines() )
+            return _entry_counts[key]
+
+    def _compact( self, count ):
+        """ Truncates the dump file to the latest count entries
+        """
+        lines = self._read_lines()
+        if len( lines ) > count:
+            logger.debug( "Compacting dump file %s from %s to %s entries"%( self.dump_file, len( lines ), count ) )
+            lines = lines[-count:]
+            self._replace_lines( [ line + b"\n" for line in lines ] )
+        _set_entry_count( self.dump_file, len( lines ) )
+
+    def _read_lines( self ):
+        with open( self.dump_file, 'rb' ) as fh:
+            return [ line for line in fh.read().split( b"\n" ) if line.strip() != b"" ]
+
+    def _replace_lines( self, lines ):
+        tmp_file = self.dump_file + ".tmp"
+        with open( tmp_file, 'wb' ) as fh:
+            fh.writelines( lines )
+            fh.flush()
+            os.fsync( fh.fileno() )
+        os.replace( tmp_file, self.dump_file )
+
+    def _is_array_dump( self ):
+        """ Returns True if the dump file is in the old json array format
+        """
+        if not os.path.exists( self.dump_file ):
+            return False
+        with open( self.dump_file, 'rb' ) as fh:
+            for chunk in iter( lambda: fh.read( 4096 ), b"" ):
+                chunk = chunk.lstrip()
+                if chunk:
+                    return chunk.startswith( b"[" )
+        return False
+
+    def _encode_entry( self, entry ):
+        return ( json.dumps( entry, separators=( ',', ':' ) ) + "\n" ).encode( 'utf-8' )
 
     def _walk( self, dikt, target_path, path=() ):
 
@@ -231,6 +580,15 @@ class MBeanDumper( object ):
             else:
                 self._walk( dikt[key], target_path, path + ( key, ) )
 
+def sample_skew( entry ):
+    """ Returns the skew (in seconds) between the start of the samples in a dump entry
+    """
+    starts = [ x['start'] for x in entry.get( 'sampling', [] ) ]
+    if not starts:
+        return 0.0
+    return max( starts ) - min( starts )
+
+
 if __name__ == '__main__':
 
     ### Logger
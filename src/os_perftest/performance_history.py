@@ -0,0 +1,549 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""
+:mod:`os_perftest.performance_history` -- history of runs in sqlite
+===================================================================
+
+The json dumps only keep the latest runs (70 entries of an mbean dump,
+140 runs of a jtl dump). The history store keeps the values of all runs
+in a local sqlite database, so months of runs can be queried without
+parsing the dumps.
+
+Every numeric value is stored as a sample of a series, keyed on
+
+ * service: the domain of an mbean dump entry (ie. 'metrics' or
+   'java.lang'), or 'jmeter' for jtl runs
+ * mbean: the mbean name, or for jtl runs 'all' or the label
+ * attribute: the path of the value in the mbean (or jtl run), ie.
+   'Count', 'HeapMemoryUsage/used' or 'time/percentiles/95'
+
+and belongs to a run. The samples are indexed on run, and on series and
+time, and the series are indexed on service, mbean and attribute.
+
+Retention is in two tiers. Runs within the raw retention (the latest
+raw_runs runs of each kind, or the runs of the last raw_days days) keep
+all samples. Older runs are rolled up into a single row per series and
+day (UTC) with count, sum, min, max and the last value, and their raw
+samples are deleted (see apply_retention).
+
+Existing dumps are imported with::
+
+    performance_history.py history.db import-mbean mbean-dump.json [run]
+    performance_history.py history.db import-jtl jtl-performance-dump.json
+    performance_history.py history.db retention --raw-days 30
+    performance_history.py history.db runs
+    performance_history.py history.db series SERVICE MBEAN ATTRIBUTE
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+from os_perftest.performance_dumper import MBeanDumper
+from os_perftest.performance_dumper import TRIMMED_PHASES
+from os_perftest.performance_store import is_number
+
+logger = logging.getLogger("dbc." + __name__)
+
+KINDS = ('mbean', 'jtl')
+TIERS = ('raw', 'daily')
+
+JTL_SERVICE = 'jmeter'
+JTL_ALL = 'all'
+
+# Parts of a jtl run that are not stored (bucket counts and per window/generator values)
+JTL_SKIPPED_KEYS = ('histogram', 'windows', 'generators')
+
+DEFAULT_RAW_DAYS = 30
+
+DAY = 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    source TEXT,
+    timestamp REAL NOT NULL,
+    finished REAL,
+    tier TEXT NOT NULL DEFAULT 'raw'
+);
+CREATE INDEX IF NOT EXISTS runs_kind_timestamp ON runs (kind, timestamp);
+
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    service TEXT NOT NULL,
+    mbean TEXT NOT NULL,
+    attribute TEXT NOT NULL,
+    UNIQUE (service, mbean, attribute)
+);
+CREATE INDEX IF NOT EXISTS series_mbean ON series (mbean, attribute);
+CREATE INDEX IF NOT EXISTS series_attribute ON series (attribute);
+
+CREATE TABLE IF NOT EXISTS samples (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    series_id INTEGER NOT NULL REFERENCES series (id),
+    timestamp REAL NOT NULL,
+    value REAL NOT NULL,
+    UNIQUE (run_id, series_id, timestamp)
+);
+CREATE INDEX IF NOT EXISTS samples_series_timestamp ON samples (series_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS daily (
+    series_id INTEGER NOT NULL REFERENCES series (id),
+    day INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    last REAL NOT NULL,
+    last_timestamp REAL NOT NULL,
+    PRIMARY KEY (series_id, day)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_DAILY = """
+INSERT INTO daily (series_id, day, count, sum, min, max, last, last_timestamp)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (series_id, day) DO UPDATE SET
+    count = count + excluded.count,
+    sum = sum + excluded.sum,
+    min = min(min, excluded.min),
+    max = max(max, excluded.max),
+    last = CASE WHEN excluded.last_timestamp >= last_timestamp THEN excluded.last ELSE last END,
+    last_timestamp = max(last_timestamp, excluded.last_timestamp)
+"""
+
+
+class HistoryError(Exception):
+    pass
+
+
+def _flatten(dikt, path=(), skipped=()):
+    """ Yields (path, value) of the numeric leaf values of dikt, path is '/' separated """
+    for key, value in dikt.items():
+        if key in skipped:
+            continue
+        key_path = path + (str(key),)
+        if isinstance(value, dict):
+            for item in _flatten(value, key_path, skipped):
+                yield item
+        elif is_number(value):
+            yield "/".join(key_path), value
+
+
+def mbean_entry_samples(entry):
+    """ Yields (service, mbean, attribute, timestamp, value) of an mbean dump entry.
+    service is the domain key of the entry. Values without a timestamp get None
+    """
+    for service, mbeans in entry.items():
+        if not isinstance(mbeans, dict):
+            continue
+        for mbean, data in mbeans.items():
+            if not isinstance(data, dict) or not isinstance(data.get('value'), dict):
+                continue
+            timestamp = data.get('timestamp')
+            if not is_number(timestamp) or timestamp <= 0:
+                timestamp = None
+            for attribute, value in _flatten(data['value']):
+                yield service, mbean, attribute, timestamp, value
+
+
+def jtl_run_samples(entry):
+    """ Yields (service, mbean, attribute, value) of a jtl run (an entry of a jtl dump) """
+    labels = entry.get('labels', {})
+    for attribute, value in _flatten(entry, skipped=JTL_SKIPPED_KEYS + ('labels',)):
+        yield JTL_SERVICE, JTL_ALL, attribute, value
+    for label, values in labels.items():
+        if isinstance(values, dict):
+            for attribute, value in _flatten(values, skipped=JTL_SKIPPED_KEYS):
+                yield JTL_SERVICE, label, attribute, value
+
+
+def jtl_run_name(entry):
+    """ Returns a name identifying a jtl run by its values.
+
+    The time windows are left out, as they are dropped from all but the
+    latest run of a dump, so a run keeps its name between imports
+    """
+    values = dict((k, v) for k, v in entry.items() if k != 'windows')
+    digest = hashlib.sha1(json.dumps(values, sort_keys=True).encode('utf-8')).hexdigest()
+    return "jtl-%s" % digest[:20]
+
+
+def _day(timestamp):
+    return int(timestamp // DAY) * DAY
+
+
+class HistoryStore(object):
+    """ History of runs in a sqlite database """
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.connection = sqlite3.connect(db_file)
+        self.connection.executescript(SCHEMA)
+        self._series = {}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _series_id(self, service, mbean, attribute):
+        key = (service, mbean, attribute)
+        series_id = self._series.get(key)
+        if series_id is None:
+            row = self.connection.execute("SELECT id FROM series WHERE service = ? AND mbean = ? AND attribute = ?",
+                                          key).fetchone()
+            if row is None:
+                series_id = self.connection.execute("INSERT INTO series (service, mbean, attribute) VALUES (?, ?, ?)",
+                                                    key).lastrowid
+            else:
+                series_id = row[0]
+            self._series[key] = series_id
+        return series_id
+
+    def _run(self, name, kind, source, timestamp):
+        """ Returns (id, finished, tier) of run name, which is created if it does not exist """
+        if kind not in KINDS:
+            raise HistoryError("Unknown kind of run '%s', must be one of %s" % (kind, ", ".join(KINDS)))
+        row = self.connection.execute("SELECT id, kind, finished, tier FROM runs WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            cursor = self.connection.execute("INSERT INTO runs (name, kind, source, timestamp) VALUES (?, ?, ?, ?)",
+                                             (name, kind, source, timestamp))
+            return cursor.lastrowid, None, 'raw'
+        if row[1] != kind:
+            raise HistoryError("Run '%s' is a %s run, not %s" % (name, row[1], kind))
+        return row[0], row[2], row[3]
+
+    def _add_samples(self, run_id, finished, tier, samples):
+        """ Adds samples (series_id, timestamp, value) to a run. Samples already in the run are
+        skipped. A rolled up run only gets samples newer than it, and goes back to the raw tier
+        """
+        if tier != 'raw':
+            samples = [x for x in samples if finished is None or x[1] > finished]
+        rows = [(run_id, series_id, timestamp, value) for series_id, timestamp, value in samples]
+        if not rows:
+            return 0
+
+        before = self.connection.total_changes
+        self.connection.executemany("INSERT OR IGNORE INTO samples (run_id, series_id, timestamp, value) "
+                                    "VALUES (?, ?, ?, ?)", rows)
+        added = self.connection.total_changes - before
+
+        first = min(x[2] for x in rows)
+        last = max(x[2] for x in rows)
+        self.connection.execute("UPDATE runs SET timestamp = min(timestamp, ?), finished = max(coalesce(finished, ?), ?), "
+                                "tier = 'raw' WHERE id = ?", (first, last, last, run_id))
+        return added
+
+    def add_mbean_entries(self, entries, run, source=None, include_trimmed=False):
+        """ Adds the values of mbean dump entries to run. Entries of a warm-up or cool-down
+        are left out, unless include_trimmed is True. Values without a timestamp are
+        left out too, as they could not be told apart when a dump is imported again.
+        Returns the number of samples added
+        """
+        samples = []
+        skipped = 0
+        for entry in entries:
+            if not include_trimmed and entry.get('phase') in TRIMMED_PHASES:
+                continue
+            for service, mbean, attribute, timestamp, value in mbean_entry_samples(entry):
+                if timestamp is None:
+                    skipped += 1
+                    continue
+                samples.append((self._series_id(service, mbean, attribute), timestamp, value))
+        if skipped:
+            logger.debug("Skipped %s values without a timestamp for run '%s'", skipped, run)
+        if not samples:
+            return 0
+
+        with self.connection:
+            run_id, finished, tier = self._run(run, 'mbean', source, min(x[1] for x in samples))
+            return self._add_samples(run_id, finished, tier, samples)
+
+    def add_jtl_run(self, entry, timestamp=None, source=None, name=None):
+        """ Adds a jtl run (an entry of a jtl dump). The run is timestamped with the start of its
+        time windows, or timestamp (default now). Returns False if the run is already in the store
+        """
+        name = name or jtl_run_name(entry)
+        if self.connection.execute("SELECT 1 FROM runs WHERE name = ?", (name,)).fetchone() is not None:
+            return False
+
+        windows = entry.get('windows')
+        if isinstance(windows, dict) and is_number(windows.get('start')):
+            timestamp = windows['start']
+        elif timestamp is None:
+            timestamp = time.time()
+
+        with self.connection:
+            run_id, finished, tier = self._run(name, 'jtl', source, timestamp)
+            samples = [(self._series_id(service, mbean, attribute), timestamp, value)
+                       for service, mbean, attribute, value in jtl_run_samples(entry)]
+            self._add_samples(run_id, finished, tier, samples)
+        return True
+
+    def import_mbean_dump(self, dump_file, run=None, include_trimmed=False):
+        """ Imports an mbean dump as run (default the name of the file).
+        Importing a dump again only adds the entries dumped since
+        """
+        run = run or os.path.basename(dump_file)
+        dump = MBeanDumper(dump_file).read_dump(include_trimmed=include_trimmed)
+        added = self.add_mbean_entries(dump, run, source=dump_file, include_trimmed=include_trimmed)
+        logger.info("Imported %s samples from %s entries of %s into run '%s'", added, len(dump), dump_file, run)
+        return added
+
+    def import_jtl_dump(self, dump_file):
+        """ Imports the runs of a jtl dump, runs already in the store are skipped.
+
+        Runs without time windows are dated one day apart, with the last
+        one at the modification time of the dump (as in the performance
+        report). Returns the number of runs added
+        """
+        with open(dump_file) as fh:
+            dump = json.load(fh)
+        if isinstance(dump, dict):
+            dump = [dump]
+
+        latest = os.path.getmtime(dump_file)
+        added = 0
+        for i, entry in enumerate(dump):
+            timestamp = latest - (len(dump) - 1 - i) * DAY
+            if self.add_jtl_run(entry, timestamp=timestamp, source=dump_file):
+                added += 1
+        logger.info("Imported %s of %s runs from %s", added, len(dump), dump_file)
+        return added
+
+    def apply_retention(self, raw_runs=None, raw_days=DEFAULT_RAW_DAYS, now=None):
+        """ Rolls up runs outside the raw retention into daily rows, and deletes their samples.
+
+        A run is kept raw if it is among the latest raw_runs runs of its
+        kind, or started within the last raw_days days. With both None, all
+        runs are kept raw. Returns the number of runs rolled up
+        """
+        if raw_runs is None and raw_days is None:
+            return 0
+        now = time.time() if now is None else now
+
+        keep = set()
+        if raw_runs is not None:
+            for kind in KINDS:
+                keep.update(x[0] for x in self.connection.execute(
+                    "SELECT id FROM runs WHERE kind = ? ORDER BY timestamp DESC LIMIT ?", (kind, raw_runs)))
+        if raw_days is not None:
+            keep.update(x[0] for x in self.connection.execute(
+                "SELECT id FROM runs WHERE timestamp >= ?", (now - raw_days * DAY,)))
+
+        runs = [x[0] for x in self.connection.execute("SELECT id FROM runs WHERE tier = 'raw' ORDER BY timestamp")
+                if x[0] not in keep]
+        with self.connection:
+            for run_id in runs:
+                self._roll_up(run_id)
+        if runs:
+            logger.info("Rolled up %s runs into daily values", len(runs))
+        return len(runs)
+
+    def _roll_up(self, run_id):
+        rollups = {}
+        for series_id, timestamp, value in self.connection.execute(
+                "SELECT series_id, timestamp, value FROM samples WHERE run_id = ? ORDER BY series_id, timestamp",
+                (run_id,)):
+            key = (series_id, _day(timestamp))
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollups[key] = [1, value, value, value, value, timestamp]
+            else:
+                rollup[0] += 1
+                rollup[1] += value
+                rollup[2] = min(rollup[2], value)
+                rollup[3] = max(rollup[3], value)
+                rollup[4] = value
+                rollup[5] = timestamp
+
+        self.connection.executemany(_UPSERT_DAILY, [key + tuple(rollup) for key, rollup in rollups.items()])
+        self.connection.execute("DELETE FROM samples WHERE run_id = ?", (run_id,))
+        self.connection.execute("UPDATE runs SET tier = 'daily' WHERE id = ?", (run_id,))
+
+    def runs(self, kind=None):
+        """ Returns the runs (oldest first) as dicts """
+        sql = "SELECT id, name, kind, source, timestamp, finished, tier FROM runs"
+        args = ()
+        if kind is not None:
+            sql += " WHERE kind = ?"
+            args = (kind,)
+        columns = ('id', 'name', 'kind', 'source', 'timestamp', 'finished', 'tier')
+        return [dict(zip(columns, row)) for row in self.connection.execute(sql + " ORDER BY timestamp", args)]
+
+    def series(self, service='*', mbean='*', attribute='*'):
+        """ Returns (service, mbean, attribute) of the series matching the glob patterns """
+        return self.connection.execute("SELECT service, mbean, attribute FROM series "
+                                       "WHERE service GLOB ? AND mbean GLOB ? AND attribute GLOB ? "
+                                       "ORDER BY service, mbean, attribute",
+                                       (service, mbean, attribute)).fetchall()
+
+    def samples(self, service, mbean, attribute, since=None, until=None, run=None):
+        """ Returns the raw samples of a series as a list of (timestamp, value), oldest first """
+        sql = ("SELECT samples.timestamp, samples.value FROM samples "
+               "JOIN series ON series.id = samples.series_id "
+               "WHERE series.service = ? AND series.mbean = ? AND series.attribute = ?")
+        args = [service, mbean, attribute]
+        if since is not None:
+            sql += " AND samples.timestamp >= ?"
+            args.append(since)
+        if until is not None:
+            sql += " AND samples.timestamp < ?"
+            args.append(until)
+        if run is not None:
+            sql += " AND samples.run_id = (SELECT id FROM runs WHERE name = ?)"
+            args.append(run)
+        return self.connection.execute(sql + " ORDER BY samples.timestamp", args).fetchall()
+
+    def daily(self, service, mbean, attribute, since=None, until=None):
+        """ Returns the daily rollups of a series as dicts, oldest first.
+        since and until are rounded down to the start of their day
+        """
+        sql = ("SELECT day, count, sum, min, max, last FROM daily "
+               "JOIN series ON series.id = daily.series_id "
+               "WHERE series.service = ? AND series.mbean = ? AND series.attribute = ?")
+        args = [service, mbean, attribute]
+        if since is not None:
+            sql += " AND day >= ?"
+            args.append(_day(since))
+        if until is not None:
+            sql += " AND day < ?"
+            args.append(_day(until))
+        result = []
+        for day, count, total, minimum, maximum, last in self.connection.execute(sql + " ORDER BY day", args):
+            result.append({'day': day, 'count': count, 'mean': total / count,
+                           'min': minimum, 'max': maximum, 'last': last})
+        return result
+
+    def history(self, service, mbean, attribute, rollup='mean', since=None):
+        """ Returns the full history of a series as a list of (timestamp, value), oldest first.
+
+        Days that are rolled up give one value (rollup is 'mean', 'min',
+        'max' or 'last' of the day), followed by the raw samples
+        """
+        if rollup not in ('mean', 'min', 'max', 'last'):
+            raise HistoryError("Unknown rollup '%s', must be mean, min, max or last" % rollup)
+        values = [(x['day'], x[rollup]) for x in self.daily(service, mbean, attribute, since=since)]
+        values.extend(self.samples(service, mbean, attribute, since=since))
+        values.sort(key=lambda x: x[0])
+        return values
+
+
+def record_jtl_run(db_file, entry, source=None, raw_runs=None, raw_days=DEFAULT_RAW_DAYS):
+    """ Adds a jtl run to the history in db_file, and applies the retention """
+    with HistoryStore(db_file) as store:
+        store.add_jtl_run(entry, source=source)
+        store.apply_retention(raw_runs=raw_runs, raw_days=raw_days)
+
+
+def record_mbean_entry(db_file, entry, run, source=None):
+    """ Adds an mbean dump entry to run in the history in db_file.
+
+    This is called for every dump of a test, so the retention is not
+    applied here, but once at the end of the test (see apply_retention)
+    """
+    with HistoryStore(db_file) as store:
+        store.add_mbean_entries([entry], run, source=source)
+
+
+def apply_retention(db_file, raw_runs=None, raw_days=DEFAULT_RAW_DAYS):
+    """ Applies the retention to the history in db_file, returns the number of runs rolled up """
+    with HistoryStore(db_file) as store:
+        return store.apply_retention(raw_runs=raw_runs, raw_days=raw_days)
+
+
+def _format_time(timestamp):
+    if timestamp is None:
+        return "-"
+    return datetime.datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def main():
+    db_file, command, args, options = cli()
+
+    try:
+        with HistoryStore(db_file) as store:
+            if command == 'import-mbean':
+                store.import_mbean_dump(args[0], run=args[1] if len(args) > 1 else None,
+                                        include_trimmed=options.include_trimmed)
+            elif command == 'import-jtl':
+                for dump_file in args:
+                    store.import_jtl_dump(dump_file)
+            elif command == 'retention':
+                store.apply_retention(raw_runs=options.raw_runs, raw_days=options.raw_days)
+            elif command == 'runs':
+                for run in store.runs(kind=options.kind):
+                    print("%s  %-5s %-5s %s" % (_format_time(run['timestamp']), run['kind'], run['tier'], run['name']))
+            elif command == 'series':
+                service, mbean, attribute = (list(args) + ['*', '*', '*'])[:3]
+                if options.history:
+                    for timestamp, value in store.history(service, mbean, attribute, rollup=options.rollup):
+                        print("%s  %s" % (_format_time(timestamp), value))
+                else:
+                    for key in store.series(service, mbean, attribute):
+                        print("  ".join(key))
+    except (HistoryError, IOError, ValueError, sqlite3.Error) as error:
+        logger.error("History %s failed: %s", command, error)
+        sys.exit(1)
+
+
+def cli():
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    commands = ('import-mbean', 'import-jtl', 'retention', 'runs', 'series')
+    usage_msg = ("%prog [options] history-db command [args]\n\n"
+                 "commands:\n"
+                 "  import-mbean mbean-dump [run]    import an mbean dump (as run, default the file name)\n"
+                 "  import-jtl jtl-dump [jtl-dump]   import the runs of jtl dumps\n"
+                 "  retention                        roll up runs outside the raw retention\n"
+                 "  runs                             list the runs\n"
+                 "  series [service mbean attribute] list series (glob patterns), or with --history the values")
+
+    from optparse import OptionParser
+    parser = OptionParser(usage=usage_msg + '\n')
+
+    parser.add_option("--raw-days", type="int", action="store", dest="raw_days", default=DEFAULT_RAW_DAYS,
+                      help="Keep runs of the last days raw (retention). default is %s" % DEFAULT_RAW_DAYS)
+
+    parser.add_option("--raw-runs", type="int", action="store", dest="raw_runs", default=None,
+                      help="Keep the latest runs of each kind raw (retention)")
+
+    parser.add_option("--include-trimmed", action="store_true", dest="include_trimmed", default=False,
+                      help="Import warm-up and cool-down entries of an mbean dump too")
+
+    parser.add_option("--kind", type="choice", action="store", dest="kind", choices=list(KINDS), default=None,
+                      help="Only list runs of kind (%s)" % "|".join(KINDS))
+
+    parser.add_option("--history", action="store_true", dest="history", default=False,
+                      help="Print the values of the series (service, mbean and attribute without wildcards)")
+
+    parser.add_option("--rollup", type="choice", action="store", dest="rollup",
+                      choices=['mean', 'min', 'max', 'last'], default='mean',
+                      help="Value of rolled up days printed with --history. default is 'mean'")
+
+    (options, args) = parser.parse_args()
+
+    if len(args) < 2:
+        parser.error('Need a history database and a command')
+    db_file, command, args = args[0], args[1], args[2:]
+    if command not in commands:
+        parser.error("Unknown command '%s', must be one of %s" % (command, ", ".join(commands)))
+    if command in ('import-mbean', 'import-jtl') and not args:
+        parser.error("%s needs a dump file" % command)
+
+    return db_file, command, args, options
+
+if __name__ == '__main__':
+    main()
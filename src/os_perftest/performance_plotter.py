@@ -4,22 +4,31 @@
 
 import sys
 import datetime
+import functools
 import re
 import logging
+import math
+from array import array
 from operator import itemgetter
 
+import os_perftest.performance_derive as derive
 import os_perftest.performance_report as report
 import os_perftest.config_parser as parser
 import os_perftest.performance_dumper as dumper
+from os_perftest.performance_store import is_number
 
 COLORS = ["b", "y", "orange", "m", "r", "k", "g", "c" ]
 
+# Value of a sample without the attribute, in the flattened mbean values
+_MISSING = array('d', [math.nan])
+
 logger = logging.getLogger("dbc." + __name__)
 
-def plot(ini_file, main_plot, file_folder='performance-report' ):
+def plot(ini_file, main_plot, file_folder='performance-report', parallel=False, backend='png', incremental=False, thumbnails=True ):
     logger.info("Plot configured values. ini_file='%s', main_plot='%s', file_folder='%s'", ini_file, main_plot, file_folder)
     graphs = parser.parse_config(ini_file)
-    pr = report.PerformanceReport( file_folder )
+    pr = report.create_performance_report( file_folder, backend=backend, parallel=parallel, incremental=incremental,
+                                           thumbnails=thumbnails )
 
     for graph in graphs:
         pr.plot_data( graph["name"], graph["description"], graph["unit"], graph["timestamps"], *graph["lines"] )
@@ -47,127 +56,160 @@ def _update_line_colors(lines):
     return lines
 
 def _has_values(value_list):
+    """ True if value_list holds numeric values (ints or floats, also negative) """
     if value_list is not None:
+        if isinstance(value_list, array):
+            return len(value_list) > 0
         for value in value_list:
-            if str(value).isdigit():
+            if is_number(value):
                 return True
     return False
 
-def _create_count_graphs(mbeans):
+@functools.lru_cache(maxsize=None)
+def _clean_name(mbean_name):
+    return re.search(r'(.+=[\w\.]+)', mbean_name).group(1).replace('/', '-').replace(':', '-')
+
+@functools.lru_cache(maxsize=None)
+def _classify_key(key):
+    """ Returns (graph, legend, precision) for an attribute key, or None if the attribute is not plotted.
+    graph is either 'count' or 'timings'
+    """
+    if 'Count' in key or 'requests' in key:
+        return ('count', 'Count', 0)
+    if '50th' in key:
+        return ('timings', '50th percentile', 2)
+    if '75th' in key:
+        return ('timings', '75th percentile', 2)
+    if '95th' in key:
+        return ('timings', '95th percentile', 2)
+    if '99th' in key and not '999th' in key:
+        return ('timings', '99th percentile', 2)
+    if 'median' in key:
+        return ('timings', '50th percentile', 2)
+    if key in ('avgTimePerRequest', 'Mean'):
+        return ('timings', 'Mean', 2)
+    if key in ('Min', 'Max'):
+        return ('timings', key, 2)
+    return None
+
+def _counter_rates(mbean, values):
+    """ Returns the rates per second of a cumulative counter of mbean. Samples without the counter
+    (NaN) or without a timestamp (0) are left out of the rates, so they are not taken for counter
+    resets, and intervals without a rate are 0
+    """
+    timestamps = mbean['timestamp']
+    counters = [None if not timestamp or math.isnan(value) else value for timestamp, value in zip(timestamps, values)]
+    resets = derive.counter_resets(counters)
+    if resets:
+        logger.info("Counter of %s was reset %s times", mbean['name'], len(resets))
+    return derive.fill_missing(derive.counter_rates(timestamps, counters))
+
+def _missing_as_zero(values):
+    return [0.0 if math.isnan(value) else value for value in values]
+
+def _create_graphs(mbeans, kind, name_prefix, description, unit, rates=False):
     graphs = []
-    for key in mbeans:
-        logger.debug("Create count graph for %s", key)
-
-        mbean = mbeans[key]
-        timestamps = mbean.get('timestamp')
+    for mbean in mbeans.values():
+        timestamps = mbean['timestamp']
         lines = []
-        for key in mbean['value']:
+        for key, key_kind in mbean['keys'].items():
             values = mbean['value'][key]
-            if _has_values(values):
-                logger.debug("values %s", values)
-                if 'Count' in key:
-                    lines.append(_create_line('Count', values, 0))
-                elif 'requests' in key:
-                    lines.append(_create_line('Count', values, 0))
+            if key_kind is not None and key_kind[0] == kind and _has_values(values):
+                if rates:
+                    lines.append(_create_line(key_kind[1] + ' per second', _counter_rates(mbean, values), 2))
+                else:
+                    lines.append(_create_line(key_kind[1], _missing_as_zero(values), key_kind[2]))
 
         if len(lines) > 0:
-            graph = _create_graph('Count-' + mbean['clean-name'], 'counts', "milliseconds", timestamps)
-            graph['lines'] = _update_line_colors(lines)
+            graph = _create_graph(name_prefix + mbean['clean-name'], description, unit, timestamps)
+            graph['lines'] = _update_line_colors(sorted(lines, key=itemgetter(1)) if kind == 'timings' else lines)
             graphs.append(graph)
         else:
-            logger.debug("Skip 0 value for %s", key)
-
-
-    logger.debug("Create %s graphs", len(graphs))
-    return graphs
-
-def _create_percentile_graphs(mbeans):
-    graphs = []
-
-    for key in mbeans:
-        mbean = mbeans[key]
-        timestamps = mbean.get('timestamp')
-        lines = []
-        for key in mbean['value']:
-            values = mbean['value'][key]
-            if _has_values(values):
-                if '50th' in key:
-                    lines.append(_create_line('50th percentile', values, 2))
-                elif '75th' in key:
-                    lines.append(_create_line('75th percentile', values, 2))
-                elif '95th' in key:
-                    lines.append(_create_line('95th percentile', values, 2))
-                elif '99th' in key and not '999th' in key:
-                    lines.append(_create_line('99th percentile', values, 2))
-                elif 'median' in key:
-                    lines.append(_create_line('50th percentile', values, 2))
-                elif 'avgTimePerRequest' == key:
-                    lines.append(_create_line('Mean', values, 2))
-                elif 'Mean' == key:
-                    lines.append(_create_line('Mean', values, 2))
-                elif 'Min' == key:
-                    lines.append(_create_line('Min', values, 2))
-                elif 'Max' == key:
-                    lines.append(_create_line('Max', values, 2))
-
-        if len(lines) > 0:
-            graph = _create_graph('Timings-' + mbean['clean-name'], 'timings', "milliseconds", timestamps)
-            graph['lines'] = _update_line_colors(sorted(lines, key=itemgetter(1)))
-            graphs.append(graph)
+            logger.debug("Skip %s graph without values for %s", kind, mbean['name'])
 
+    logger.debug("Create %s %s graphs", len(graphs), kind)
     return graphs
 
-def _is_mbean(element):
-        if 'value' in element:
-            return True
-        return False
-
-def _fetch_mbeans(element, mbeans):
-
-    if not isinstance(element, dict):
-        return
-
-    if _is_mbean(element):
-        mbean_name = element['request']['mbean']
-        mbean_dict = mbeans.get(mbean_name)
-        if mbean_dict is None:
-            mbean_dict = {}
-            mbean_dict['name'] = mbean_name
-            mbean_dict['clean-name'] = re.search(r'(.+=[\w\.]+)', mbean_name).group(1).replace('/', '-').replace(':', '-')
-            mbean_dict['timestamp'] = []
-            mbean_dict['value'] = {}
-            #print(mbean_dict['clean-name'])
-        mbeans[mbean_name] = mbean_dict
-        mbean_dict['timestamp'].append(element.get('timestamp'))
-
-        for key in element['value']:
-            value_list = mbean_dict['value'].get(key)
-            if value_list is None:
-                value_list = []
-                mbean_dict['value'][key] = value_list
-            value_list.append(element['value'][key])
-
-        return
-
-    for key in element:
-        _fetch_mbeans(element[key], mbeans)
-
-def plot_dump(*dump_file):
-    plot_dump_to('performance-report', *dump_file)
+def _create_count_graphs(mbeans):
+    """ Graphs of the cumulative counters of the mbeans, as rates per second """
+    return _create_graphs(mbeans, 'count', 'Count-', 'counts per second', "per second", rates=True)
 
-def plot_dump_to(filefolder, *dump_file):
+def _create_percentile_graphs(mbeans):
+    return _create_graphs(mbeans, 'timings', 'Timings-', 'timings', "milliseconds")
+
+def _fetch_mbeans_from_dump(dump, mbeans):
+    """ Flattens the plotted values of the mbeans in dump (a list of entries) into mbeans, in one pass.
+
+    mbeans maps each mbean name to a dict with its clean name, timestamps,
+    and values per plotted attribute key (arrays of floats). The attribute
+    keys are classified (see _classify_key) once per mbean. Samples without
+    an attribute get NaN, so all values have the length of the timestamps.
+    """
+    by_path = {}
+    for entry in dump:
+        for name, domain in entry.items():
+            if not isinstance(domain, dict):
+                continue
+            for key, data in domain.items():
+                if not isinstance(data, dict):
+                    continue
+                values = data.get('value')
+                if not isinstance(values, dict) or not values:
+                    continue
+
+                mbean = by_path.get((name, key))
+                if mbean is None:
+                    request = data.get('request')
+                    mbean_name = request.get('mbean') if isinstance(request, dict) else None
+                    if mbean_name is None:
+                        mbean_name = name + ":" + key
+                    mbean = mbeans.get(mbean_name)
+                    if mbean is None:
+                        mbean = {'name': mbean_name, 'clean-name': _clean_name(mbean_name),
+                                 'timestamp': [], 'keys': {}, 'value': {}}
+                        mbeans[mbean_name] = mbean
+                    by_path[(name, key)] = mbean
+
+                index = len(mbean['timestamp'])
+                mbean['timestamp'].append(data.get('timestamp', 0))
+                mbean_keys = mbean['keys']
+                mbean_values = mbean['value']
+                for attribute, value in values.items():
+                    if attribute not in mbean_keys:
+                        kind = _classify_key(attribute)
+                        mbean_keys[attribute] = kind
+                        mbean_values[attribute] = _MISSING * index if kind is not None else None
+                    column = mbean_values[attribute]
+                    if column is None:
+                        continue
+                    if not is_number(value):
+                        # Not a numeric attribute, it is not plotted
+                        mbean_values[attribute] = None
+                        continue
+                    column.extend(_MISSING * (index - len(column)))
+                    column.append(value)
+
+    for mbean in mbeans.values():
+        samples = len(mbean['timestamp'])
+        for column in mbean['value'].values():
+            if column is not None and len(column) < samples:
+                column.extend(_MISSING * (samples - len(column)))
+
+def plot_dump(*dump_file, parallel=False, backend='png', incremental=False, thumbnails=True):
+    plot_dump_to('performance-report', *dump_file, parallel=parallel, backend=backend, incremental=incremental,
+                 thumbnails=thumbnails)
+
+def plot_dump_to(filefolder, *dump_file, parallel=False, backend='png', incremental=False, thumbnails=True):
 
     logger.info("Plotting graphs to folder '%s'", filefolder)
 
     mbeans = {}
     for file in dump_file:
         pd = dumper.MBeanDumper(file)
-        dump = pd._read_dump()
-
-        for element in dump:
-            _fetch_mbeans(element, mbeans)
+        _fetch_mbeans_from_dump(pd.read_dump(), mbeans)
 
-    pr = report.PerformanceReport(filefolder)
+    pr = report.create_performance_report(filefolder, backend=backend, parallel=parallel, incremental=incremental,
+                                          thumbnails=thumbnails)
     graphs = []
 
     # Create a graph for each mbean, which has count data
@@ -188,8 +230,8 @@ def plot_dump_to(filefolder, *dump_file):
 
 if __name__ == '__main__':
 
-    if len(sys.argv) < 2 or len(sys.argv) > 4:
-        print("Usage: python %s ini_file [main_plot_name] [file_folder]" % sys.argv[0])
+    if len(sys.argv) < 2 or len(sys.argv) > 5:
+        print("Usage: python %s ini_file [main_plot_name] [file_folder] [png|html]" % sys.argv[0])
         sys.exit(1)
     
     ini_file = sys.argv[1]
@@ -201,5 +243,9 @@ if __name__ == '__main__':
     if len(sys.argv) > 3:
         file_folder = sys.argv[3]
 
-    plot(ini_file, main_plot, file_folder)
+    backend = 'png'
+    if len(sys.argv) > 4:
+        backend = sys.argv[4]
+
+    plot(ini_file, main_plot, file_folder, backend=backend)
     # plot_dump(ini_file)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""
+:mod:`os_perftest.performance_query` -- path queries on dumps
+=============================================================
+
+A query selects values in the entries of a dump by domain, mbean and the
+path of the value in the mbean, with wildcards::
+
+    [reduction(]domain:mbean/path[)]
+
+ * domain and the segments of path are glob patterns (*, ? and [...])
+ * mbean is either a glob pattern on the whole mbean name, or a list of
+   key properties like 'name=*.requests,type=timers'. Each property must
+   match, in any order. With a trailing ',*' the mbean may have other
+   properties too (as in jmx object name patterns). A '/' in the mbean
+   name is written '!/' (as in jolokia urls)
+ * reduction is sum, max, min or avg, and combines the values of all
+   matched mbeans and paths into a single series
+
+Examples::
+
+    metrics:name=search.requests,type=meters/value/Count
+    sum(metrics:type=meters,*/value/Count)
+    max(java.lang:type=GarbageCollector,*/value/LastGcInfo/duration)
+
+Queries are compiled once, and any number of them are run in a single
+pass over the columns of a DumpStore (see run_queries). A Query made with
+literal=True has no wildcards, and matches its domain, mbean (key
+properties in any order) and path as they are written.
+"""
+import fnmatch
+import functools
+import re
+
+from os_perftest.performance_store import is_number
+
+REDUCTIONS = {'sum': sum,
+              'max': max,
+              'min': min,
+              'avg': lambda values: sum(values) / float(len(values))}
+
+_QUERY_RE = re.compile(r'^\s*(?:(\w+)\((.*)\)|(.*?))\s*$')
+_SPLIT_RE = re.compile(r'(?<!!)/')
+
+
+class QueryError(Exception):
+    pass
+
+
+def _is_pattern(text):
+    return any(c in text for c in '*?[')
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_glob(pattern):
+    """ Returns a function testing a string against the glob pattern """
+    if not _is_pattern(pattern):
+        return pattern.__eq__
+    return re.compile(fnmatch.translate(pattern)).match
+
+
+def _compile_literal(text):
+    """ Returns a function testing a string for equality with text """
+    return text.__eq__
+
+
+@functools.lru_cache(maxsize=None)
+def _key_properties(mbean):
+    """ Returns the key properties of an mbean name as a dict """
+    properties = {}
+    for part in mbean.split(','):
+        key, _, value = part.partition('=')
+        properties[key] = value
+    return properties
+
+
+@functools.lru_cache(maxsize=None)
+def _canonical_name(mbean):
+    """ Returns the key properties of an mbean name in sorted order """
+    return tuple(sorted(_key_properties(mbean).items()))
+
+
+class MBeanPattern(object):
+    """ Pattern matching mbean names, either on the whole name, or on its key properties
+
+    If literal is True, the pattern is an mbean name without wildcards
+    """
+
+    def __init__(self, pattern, literal=False):
+        self.pattern = pattern
+        self.properties = None
+        self.extra = False
+        self._match = None
+        # The canonical name of the mbean matched by a pattern without wildcards
+        self.literal = None
+
+        compile_value = _compile_glob if not literal else _compile_literal
+        if '=' not in pattern:
+            self._match = compile_value(pattern)
+            if literal or not _is_pattern(pattern):
+                self.literal = _canonical_name(pattern)
+            return
+
+        parts = pattern.split(',')
+        if parts[-1] == '*' and not literal:
+            self.extra = True
+            parts = parts[:-1]
+
+        self._matched = {}
+        self.properties = []
+        for part in parts:
+            key, sep, value = part.partition('=')
+            if not sep:
+                raise QueryError("Invalid key property '%s' in mbean pattern '%s'" % (part, pattern))
+            self.properties.append((key, compile_value(value)))
+        if literal or (not self.extra and not _is_pattern(pattern)):
+            self.literal = _canonical_name(pattern)
+
+    def matches(self, mbean):
+        if self._match is not None:
+            return bool(self._match(mbean))
+
+        matched = self._matched.get(mbean)
+        if matched is None:
+            matched = self._match_properties(mbean)
+            self._matched[mbean] = matched
+        return matched
+
+    def _match_properties(self, mbean):
+        if mbean == self.pattern:
+            return True
+        properties = _key_properties(mbean)
+        if not self.extra and len(properties) != len(self.properties):
+            return False
+        for key, match in self.properties:
+            value = properties.get(key)
+            if value is None or not match(value):
+                return False
+        return True
+
+
+class Query(object):
+    """ A compiled query. If literal is True, domain, mbean and path have no wildcards """
+
+    def __init__(self, domain, mbean, path, reduction=None, text=None, literal=False):
+        if reduction is not None and reduction not in REDUCTIONS:
+            raise QueryError("Unknown reduction '%s', must be one of %s" % (reduction, ", ".join(sorted(REDUCTIONS))))
+        if isinstance(path, str):
+            path = [x for x in path.split('/') if x != '']
+        if not path:
+            raise QueryError("No path in query '%s'" % (text or domain + ":" + mbean))
+
+        self.domain = domain
+        self.mbean = mbean
+        self.path = tuple(path)
+        self.reduction = reduction
+        self.literal = literal
+        self.text = text or self._text()
+
+        compile_value = _compile_glob if not literal else _compile_literal
+        self.literal_domain = domain if literal or not _is_pattern(domain) else None
+        self._domain = compile_value(domain)
+        self._mbean = MBeanPattern(mbean, literal)
+        self.literal_mbean = self._mbean.literal
+        self.literal_path = self.path if literal or not any(_is_pattern(x) for x in self.path) else None
+        self._path = tuple(compile_value(x) for x in self.path)
+
+    def with_path(self, path, reduction=None):
+        """ Returns a query on path in the same mbeans """
+        return Query(self.domain, self.mbean, path, reduction, literal=self.literal)
+
+    def matches(self, key):
+        """ True if key (a column key of a DumpStore) is matched by this query """
+        return self.matches_domain(key[0]) and self.matches_mbean(key[1]) and self.matches_path(key[2:])
+
+    def matches_domain(self, domain):
+        return bool(self._domain(domain))
+
+    def matches_mbean(self, mbean):
+        return self._mbean.matches(mbean)
+
+    def matches_path(self, path):
+        if len(path) != len(self._path):
+            return False
+        for match, segment in zip(self._path, path):
+            if not match(segment):
+                return False
+        return True
+
+    def _text(self):
+        text = "%s:%s/%s" % (self.domain, self.mbean.replace('/', '!/'), "/".join(self.path))
+        if self.reduction is not None:
+            text = "%s(%s)" % (self.reduction, text)
+        return text
+
+    def __repr__(self):
+        return "Query(%r)" % self.text
+
+
+def compile_query(text):
+    """ Compiles a query string, see the module documentation """
+    match = _QUERY_RE.match(text)
+    reduction, body = match.group(1), match.group(2)
+    if reduction is None:
+        body = match.group(3)
+
+    domain, sep, rest = body.partition(':')
+    if not sep:
+        raise QueryError("No domain in query '%s'" % text)
+
+    parts = [x.replace('!/', '/') for x in _SPLIT_RE.split(rest)]
+    return Query(domain, parts[0], parts[1:], reduction, text=text.strip())
+
+
+class QueryResult(object):
+    """ The columns matched by a query """
+
+    def __init__(self, query, samples):
+        self.query = query
+        self.samples = samples
+        self.columns = []
+
+    def keys(self):
+        return [key for key, column in self.columns]
+
+    def series(self, default=0):
+        """ Returns a list of (key, values) with the values of each matched column """
+        return [(key, column.dense(self.samples, default)) for key, column in self.columns]
+
+    def values(self, default=0):
+        """ Returns the values of the query, one per sample.
+
+        With a reduction, the values of all matched columns in a sample are
+        reduced to one (samples without values get default). Without a
+        reduction, the query must match a single column.
+        """
+        if self.query.reduction is None:
+            if len(self.columns) > 1:
+                raise QueryError("'%s' matches %s values, and needs a reduction (%s)"
+                                 % (self.query.text, len(self.columns), ", ".join(sorted(REDUCTIONS))))
+            if not self.columns:
+                return [default] * self.samples
+            return self.columns[0][1].dense(self.samples, default)
+
+        per_sample = [[] for _ in range(self.samples)]
+        for key, column in self.columns:
+            if not isinstance(column.values, list) or all(is_number(x) for x in column.values):
+                for index, value in zip(column.indices, column.values):
+                    per_sample[index].append(value)
+        reduce = REDUCTIONS[self.query.reduction]
+        return [reduce(values) if values else default for values in per_sample]
+
+
+def run_queries(store, queries):
+    """ Runs queries on store (a DumpStore) in one pass over its columns.
+
+    The mbeans of each domain are matched once against the queries of the
+    domain, and only the columns of matched mbeans are tested against the
+    paths. Returns a QueryResult for each query
+    """
+    results = [QueryResult(query, store.samples) for query in queries]
+
+    # Queries of a single mbean are looked up by its name, the others are matched
+    by_mbean = {}
+    by_domain = {}
+    wildcards = []
+    for result in results:
+        query = result.query
+        if query.literal_domain is not None and query.literal_mbean is not None:
+            by_mbean.setdefault((query.literal_domain, query.literal_mbean), []).append(result)
+        elif query.literal_domain is not None:
+            by_domain.setdefault(query.literal_domain, []).append(result)
+        else:
+            wildcards.append(result)
+
+    for entry in sorted(store.entries):
+        candidates = by_domain.get(entry, []) + [x for x in wildcards if x.query.matches_domain(entry)]
+        for mbean in store.mbeans(entry):
+            matched = by_mbean.get((entry, _canonical_name(mbean)), [])
+            if candidates:
+                matched = matched + [x for x in candidates if x.query.matches_mbean(mbean)]
+            if not matched:
+                continue
+            patterns = []
+            for result in matched:
+                if result.query.literal_path is not None:
+                    column = store.column((entry, mbean) + result.query.literal_path)
+                    if column is not None:
+                        result.columns.append(((entry, mbean) + result.query.literal_path, column))
+                else:
+                    patterns.append(result)
+            if not patterns:
+                continue
+            for key in store.mbean_columns(entry, mbean):
+                for result in patterns:
+                    if result.query.matches_path(key[2:]):
+                        result.columns.append((key, store.columns[key]))
+
+    return results
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""
+:mod:`os_perftest.performance_regression` -- regression gate over dump history
+==============================================================================
+
+Compares the latest runs in a dump (a jtl dump from jmeter_result_dumper,
+or an mbean dump) with the runs before them, and fails when a value has
+become worse.
+
+Each check follows one value through the dump, by its path in the dump
+entries (ie. 'time/percentiles/95' or 'throughput' in a jtl dump). The
+candidate runs (the latest runs) are compared with a baseline window (the
+runs before them) with one of the tests:
+
+ * mean-shift: the mean of the candidate runs has moved more than
+   threshold percent from the mean of the baseline in the worse
+   direction, and more than sigmas standard deviations of the baseline.
+ * mann-whitney: the candidate values are worse than the baseline values
+   by a one sided Mann-Whitney U test at significance level alpha, and the
+   median has moved more than threshold percent. The test needs a few
+   candidate runs (with 1 candidate and 10 baseline runs, p is at least 0.09).
+
+The checks can be given in a file in the ConfigObj format::
+
+    [main]
+    baseline = 10
+
+    [p95-time]
+    path = time/percentiles/95
+    worse = higher
+    threshold = 10
+
+    [throughput]
+    path = throughput
+    worse = lower
+    test = mann-whitney
+    candidate = 3
+
+The verdict is written as json, and the exit code is 0 if no check found
+a regression, 1 if any did, and 2 on errors.
+"""
+from configobj import ConfigObj
+import json
+import logging
+import math
+import os
+import sys
+
+from os_perftest.performance_dumper import MBeanDumper
+from os_perftest.performance_statistics import Statistics
+from os_perftest.performance_store import DumpStore
+from os_perftest.performance_store import is_number
+
+logger = logging.getLogger("dbc." + __name__)
+
+TESTS = ('mean-shift', 'mann-whitney')
+
+# Default checks for a jtl dump
+DEFAULT_CHECKS = [{'name': 'p95-time', 'path': 'time/percentiles/95', 'worse': 'higher'},
+                  {'name': 'throughput', 'path': 'throughput', 'worse': 'lower'}]
+
+DEFAULT_BASELINE = 10
+
+# Check options and their defaults
+CHECK_DEFAULTS = {'worse': 'higher',
+                  'test': 'mean-shift',
+                  'threshold': 10.0,
+                  'sigmas': 2.0,
+                  'alpha': 0.05,
+                  'candidate': 1,
+                  'baseline': DEFAULT_BASELINE,
+                  'min-baseline': 3}
+
+EXIT_PASS = 0
+EXIT_REGRESSION = 1
+EXIT_ERROR = 2
+
+
+class RegressionConfigError(Exception):
+    pass
+
+
+def mann_whitney(baseline, candidate):
+    """ One sided Mann-Whitney U test of candidate values being greater than baseline values.
+
+    Returns (U, p) where U counts the pairs with the candidate value greater
+    (ties count a half), and p is from the normal approximation with tie
+    and continuity correction.
+    """
+    n1 = len(baseline)
+    n2 = len(candidate)
+    if n1 == 0 or n2 == 0:
+        raise ValueError("Mann-Whitney needs values in both samples")
+
+    values = sorted([(x, 0) for x in baseline] + [(x, 1) for x in candidate])
+    ranks = [0.0] * len(values)
+    tie_term = 0
+    i = 0
+    while i < len(values):
+        j = i
+        while j + 1 < len(values) and values[j + 1][0] == values[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2.0 + 1
+        ties = j - i + 1
+        tie_term += ties**3 - ties
+        i = j + 1
+
+    rank_sum = sum(rank for rank, (value, group) in zip(ranks, values) if group == 1)
+    u = rank_sum - n2 * (n2 + 1) / 2.0
+
+    n = n1 + n2
+    mean = n1 * n2 / 2.0
+    variance = n1 * n2 / 12.0 * ((n + 1) - tie_term / float(n * (n - 1)))
+    if variance <= 0:
+        return u, 1.0 if u <= mean else 0.0
+    z = (u - mean - 0.5) / math.sqrt(variance)
+    return u, 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def _median(values):
+    return Statistics.from_values(values).percentiles([50])[50]
+
+
+def _change_percent(baseline, candidate):
+    """ Relative change from baseline to candidate in percent, None if baseline is 0 """
+    if baseline == 0:
+        return None
+    return 100.0 * (candidate - baseline) / abs(baseline)
+
+
+def evaluate_check(check, series):
+    """ Evaluates a check on the series of values of its path (one per run, oldest first).
+
+    Returns the result of the check as a dict, with 'verdict' 'pass',
+    'regression' or 'skipped' (not enough runs)
+    """
+    values = [x for x in series if x is not None]
+    candidate = values[-check['candidate']:] if len(values) >= check['candidate'] else []
+    baseline = values[:len(values) - len(candidate)][-check['baseline']:]
+
+    result = {'name': check['name'], 'path': check['path'], 'test': check['test'], 'worse': check['worse'],
+              'threshold': check['threshold'], 'baseline-runs': len(baseline), 'candidate-runs': len(candidate)}
+
+    if not candidate or len(baseline) < check['min-baseline']:
+        result['verdict'] = 'skipped'
+        result['reason'] = "%s baseline and %s candidate runs with values" % (len(baseline), len(candidate))
+        return result
+
+    # Flip signs, so larger values are always worse
+    sign = 1 if check['worse'] == 'higher' else -1
+
+    if check['test'] == 'mean-shift':
+        baseline_stats = Statistics.from_values(baseline, keep_counts=False)
+        candidate_stats = Statistics.from_values(candidate, keep_counts=False)
+        result['baseline'] = baseline_stats.mean
+        result['candidate'] = candidate_stats.mean
+        result['baseline-standard-deviation'] = baseline_stats.standard_deviation()
+        shift = sign * (candidate_stats.mean - baseline_stats.mean)
+        significant = shift > check['sigmas'] * baseline_stats.standard_deviation()
+    else:
+        result['baseline'] = _median(baseline)
+        result['candidate'] = _median(candidate)
+        u, p = mann_whitney([sign * x for x in baseline], [sign * x for x in candidate])
+        result['u'] = u
+        result['p-value'] = p
+        result['alpha'] = check['alpha']
+        significant = p < check['alpha']
+
+    change = _change_percent(result['baseline'], result['candidate'])
+    result['change-percent'] = change
+    worse = sign * change if change is not None else (math.inf if sign * result['candidate'] > 0 else 0)
+
+    result['verdict'] = 'regression' if significant and worse > check['threshold'] else 'pass'
+    return result
+
+
+def check_regressions(dump, checks):
+    """ Evaluates checks on dump (a list of entries), returns the verdict as a dict.
+
+    The dump is flattened once into a DumpStore, and all checks read
+    their values from it.
+    """
+    store = DumpStore(dump)
+    results = []
+    for check in checks:
+        series = store.values(check['path'], default=None)
+        series = [x if is_number(x) else None for x in series]
+        result = evaluate_check(check, series)
+        logger.debug("Check %s: %s", check['name'], result)
+        results.append(result)
+
+    regressions = [x['name'] for x in results if x['verdict'] == 'regression']
+    return {'verdict': 'fail' if regressions else 'pass',
+            'runs': store.samples,
+            'regressions': regressions,
+            'checks': results}
+
+
+def check_dump_file(dump_file, checks=None, **defaults):
+    """ Loads dump_file once and evaluates checks (or DEFAULT_CHECKS) on it """
+    checks = normalize_checks(checks if checks is not None else DEFAULT_CHECKS, **defaults)
+    if not os.path.exists(dump_file):
+        raise IOError("Dump file %s does not exist" % dump_file)
+    dump = MBeanDumper(dump_file).read_dump()
+    return check_regressions(dump, checks)
+
+
+def normalize_checks(checks, **defaults):
+    """ Returns checks with all options set (from defaults, or CHECK_DEFAULTS) and validated """
+    result = []
+    for check in checks:
+        if 'path' not in check:
+            raise RegressionConfigError("No path in check %s" % check.get('name'))
+
+        normalized = dict(CHECK_DEFAULTS)
+        normalized.update((k, v) for k, v in defaults.items() if v is not None)
+        normalized.update(check)
+        normalized.setdefault('name', check['path'])
+
+        try:
+            for key in ('threshold', 'sigmas', 'alpha'):
+                normalized[key] = float(normalized[key])
+            for key in ('candidate', 'baseline', 'min-baseline'):
+                normalized[key] = int(normalized[key])
+        except ValueError as error:
+            raise RegressionConfigError("Invalid value in check '%s': %s" % (normalized['name'], error))
+
+        if normalized['worse'] not in ('higher', 'lower'):
+            raise RegressionConfigError("worse must be 'higher' or 'lower' in check '%s'" % normalized['name'])
+        if normalized['test'] not in TESTS:
+            raise RegressionConfigError("test must be one of %s in check '%s'" % (", ".join(TESTS), normalized['name']))
+        if normalized['candidate'] < 1:
+            raise RegressionConfigError("candidate must be at least 1 in check '%s'" % normalized['name'])
+        result.append(normalized)
+    return result
+
+
+def parse_checks(config_file):
+    """ Reads checks from a ConfigObj file. Options in [main] apply to all checks.
+
+    Returns (checks, defaults)
+    """
+    config = ConfigObj(config_file)
+    defaults = dict(config.get('main', {}))
+    checks = []
+    for name in [x for x in list(config.keys()) if x != 'main']:
+        check = dict(config[name])
+        check['name'] = name
+        checks.append(check)
+    if not checks:
+        raise RegressionConfigError("No checks in %s" % config_file)
+    return checks, defaults
+
+
+def main():
+    dump_file, options = cli()
+
+    try:
+        checks = None
+        defaults = {}
+        if options.config:
+            checks, defaults = parse_checks(options.config)
+        for key in ('baseline', 'threshold', 'test', 'candidate'):
+            if getattr(options, key) is not None:
+                defaults[key] = getattr(options, key)
+        verdict = check_dump_file(dump_file, checks, **defaults)
+    except (RegressionConfigError, IOError, ValueError) as error:
+        logger.error("Regression check failed: %s", error)
+        verdict = {'verdict': 'error', 'error': str(error)}
+
+    output = json.dumps(verdict, indent=2)
+    if options.output:
+        with open(options.output, 'w') as fh:
+            fh.write(output + "\n")
+    else:
+        print(output)
+
+    if verdict['verdict'] == 'error':
+        sys.exit(EXIT_ERROR)
+    if verdict['verdict'] == 'fail':
+        logger.error("Performance regression in %s", ", ".join(verdict['regressions']))
+        sys.exit(EXIT_REGRESSION)
+    sys.exit(EXIT_PASS)
+
+
+def cli():
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    usage_msg = "%prog [options] dump-file (jtl dump or mbean dump)"
+
+    from optparse import OptionParser
+    parser = OptionParser(usage=usage_msg + '\n')
+
+    parser.add_option("-c", "--config", type="string", action="store", dest="config", default=None,
+                      help="File with the checks (ConfigObj format). default checks p95 time and throughput of a jtl dump")
+
+    parser.add_option("-b", "--baseline", type="int", action="store", dest="baseline", default=None,
+                      help="Number of runs in the baseline window. default is %s" % DEFAULT_BASELINE)
+
+    parser.add_option("-n", "--candidate", type="int", action="store", dest="candidate", default=None,
+                      help="Number of latest runs compared with the baseline. default is %s" % CHECK_DEFAULTS['candidate'])
+
+    parser.add_option("-t", "--threshold", type="float", action="store", dest="threshold", default=None,
+                      help="Change in percent allowed in the worse direction. default is %s" % CHECK_DEFAULTS['threshold'])
+
+    parser.add_option("--test", type="choice", action="store", dest="test", choices=list(TESTS), default=None,
+                      help="Statistical test (%s). default is %s" % ("|".join(TESTS), CHECK_DEFAULTS['test']))
+
+    parser.add_option("-o", "--output", type="string", action="store", dest="output", default=None,
+                      help="File to write the verdict (json) to. default is stdout")
+
+    (options, args) = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error('Need one dump file')
+
+    return args[0], options
+
+if __name__ == '__main__':
+    main()
@@ -9,17 +9,47 @@ import os
 import random
 import shutil
 import base64
+import hashlib
+import json
 import urllib.request, urllib.parse, urllib.error
 import logging
 
 import matplotlib
 matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import datetime
 import matplotlib.dates as mdates
+import matplotlib.ticker
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from PIL import Image
 
 logger = logging.getLogger("dbc." + __name__)
 
+# Resolution of the plots, and of their thumbnails
+PLOT_DPI = 150
+THUMBNAIL_DPI = 50
+
+# Width in pixels of the rendered plots. Lines with more points than
+# POINTS_PER_PIXEL * PLOT_WIDTH are downsampled before they are drawn
+PLOT_WIDTH = int( matplotlib.rcParams['figure.figsize'][0] * PLOT_DPI )
+POINTS_PER_PIXEL = 2
+
+# Date ticks are put at every 6th point, but at most MAX_TICKS on a plot
+MAX_TICKS = 24
+
+# Hashes of the rendered plots in an incremental report. Changes to the
+# manifest are appended to the journal as each plot is written, and folded
+# into the manifest when the report is created
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_JOURNAL = 'manifest.journal'
+# Manifest key of the main plot (main.png and main-small.png)
+MAIN_PLOT_KEY = ':main'
+
+# Report backends: png images made with matplotlib, or interactive html charts
+REPORT_BACKENDS = ( 'png', 'html' )
+
 color_map = { "b": "#0000FF",
               "r": "#FF0000",
               "g": "#00FF00",
@@ -68,21 +98,51 @@ color_map = { "b": "#0000FF",
 
 class PerformanceReport( object ):
 
-    def __init__( self, output_dir ):
+    def __init__( self, output_dir, parallel=False, workers=None, thumbnails=True, incremental=False, downsample=True ):
+        """
+        If parallel is True, the plots are rendered in a pool of workers processes
+        when the report is created, instead of one by one in plot_data
+
+        If thumbnails is False, no small images are made, and the index
+        shows the full size images
+
+        If incremental is True, the output dir is kept, and only plots whose
+        input has changed since the last report (by the hashes in the
+        manifest) are rendered again. The manifest entry of a plot is
+        cleared before it is rendered, and set as soon as its files are
+        written, so a report interrupted half way does not leave files
+        that do not match the manifest. Files of plots no longer in the
+        report are removed when the report is created.
+
+        If downsample is True, lines with more points than the plot has
+        pixels to show (see PLOT_WIDTH) are reduced to the minimum and
+        maximum points of each pixel column (see downsample_min_max). A
+        number instead sets the maximum points of a line, and False plots
+        all points.
+        """
 
         self.output_dir = os.path.abspath( output_dir )
-        if os.path.exists( self.output_dir ):
-            shutil.rmtree( self.output_dir )
-        os.mkdir( self.output_dir )
-
+        self.incremental = incremental
+        self.manifest = {}
+        if incremental and os.path.exists( self.output_dir ):
+            self.manifest = self._read_manifest()
+        else:
+            if os.path.exists( self.output_dir ):
+                shutil.rmtree( self.output_dir )
+            os.mkdir( self.output_dir )
+
+        self.parallel = parallel
+        self.workers = workers
+        self.thumbnails = thumbnails
+        self.max_points = max_plot_points( downsample )
         self.figs = []
+        self.pending = []
+        self.hashes = {}
 
-    def plot_data( self, plot_name, description, unit, dates, *data_list ):
+    def plot_data( self, plot_name, description, unit, dates, *data_list, date_format="%d-%m-%Y" ):
 
         tlen = len( dates )
         logger.debug("Plot data plot_name='%s', description='%s', unit=%s, dates=%s", plot_name, description, unit, tlen)
-        fixed_tick_spacing = True
-
 
         #logger.debug("Plot data has %s records", tlen)
 
@@ -90,58 +150,57 @@ class PerformanceReport( object ):
             if len( lst ) != tlen:
                 raise RuntimeError( "mismatch in length of timestamp/data lists, %s != %s"%(len(lst), tlen) )
 
-        fig = plt.figure()
-        ax = fig.add_subplot(111)
-
-
-        x_axis_ticks = None
-
-        if fixed_tick_spacing:
-            x_axis_ticks = list(range(tlen))
-            def tick_format(a, b):
-                if dates[int(a)] == datetime.datetime.fromtimestamp(0):
-                    return ""
-                else:
-                    return dates[int(a)].strftime("%d-%m-%Y")
-            ax.xaxis.set_major_formatter(matplotlib.ticker.FuncFormatter(tick_format))
-            ax.xaxis.set_major_locator(matplotlib.ticker.FixedLocator(x_axis_ticks[0::6]))
-        else:
-            x_axis_ticks = dates
-            ax.xaxis.set_major_formatter(mdates.DateFormatter('%d-%m-%Y'))
-            ax.xaxis.set_major_locator(mdates.WeekdayLocator())
-
-
-        ax.set_xlim(x_axis_ticks[0], x_axis_ticks[-1])
-        #ax.set_ylim( min( map( min, map( lambda x: x[2], data_list ) ) ) -2,
-        #             max( map( max, map( lambda x: x[2], data_list ) ) ) +2 )
-        ax.set_ylim( 0,
-                     max( list(map( max, [x[2] for x in data_list] )) ) *1.1 )
-
-        ax.grid( True )
-
         plot_legend = []
 
         for color, legend, lst, precision in data_list:
 
             plot_legend.append( (color_map[color], legend, lst[ -1 ], precision ) )
-            plt.plot( x_axis_ticks, lst, color=color, aa=True, lw=1 )
 
-        fig.autofmt_xdate()
         fname = os.path.join( self.output_dir, plot_name + '.png' )
         fname_small = os.path.join( self.output_dir, plot_name + '-small.png' )
-        plt.ylabel( unit )
-        plt.savefig( fname, dpi=150, bbox_inches='tight' )
-        plt.savefig( fname_small, dpi=50, bbox_inches='tight' )
-        plt.close()
+        if not self.thumbnails:
+            fname_small = fname
+
+        job = plot_job( fname, fname_small, plot_name, unit, dates, data_list, date_format, self.max_points )
+        self.hashes[plot_name] = plot_hash( job )
+        if self.incremental and self._is_rendered( plot_name, job ):
+            logger.debug( "Plot '%s' is unchanged, skip rendering", plot_name )
+        elif self.parallel:
+            self.pending.append( job )
+        else:
+            self._update_manifest( [ ( plot_name, None ) ] )
+            render_plot( job )
+            self._update_manifest( [ ( plot_name, self.hashes[plot_name] ) ] )
 
         self.figs.append( { 'filename': fname, 'smallfilename': fname_small, 'plotname': plot_name, 'description': description, 'legend': plot_legend } )
 
+    def render( self ):
+        """ Renders the pending plots (in parallel mode) in a process pool
+        """
+        if not self.pending:
+            return
+
+        logger.debug( "Rendering %s plots in parallel", len( self.pending ) )
+        self._update_manifest( [ ( job['plotname'], None ) for job in self.pending ] )
+        with ProcessPoolExecutor( max_workers=self.workers ) as executor:
+            futures = dict( ( executor.submit( render_plot, job ), job['plotname'] ) for job in self.pending )
+            for future in as_completed( futures ):
+                # result() propagates errors from the workers
+                future.result()
+                self._update_manifest( [ ( futures[future], self.hashes[futures[future]] ) ] )
+        self.pending = []
+
     def create_report( self, filename='index.html', plot_name=None, legend_timing=True ):
         """
         if plot_name is supplied, the specific plot is also saved as a png file called 'main.png'
         """
         logger.debug("Create report filename='%s', plot_name='%s', legend_timing=%s", filename, plot_name, legend_timing)
 
+        self.render()
+        main_hash = self._create_main_plot( plot_name )
+        if self.incremental:
+            self._remove_stale_files( filename, main_hash is not None )
+            self._write_manifest( main_hash )
 
         fh = open( os.path.join( self.output_dir, filename ), 'w' )
 
@@ -164,16 +223,108 @@ class PerformanceReport( object ):
             #fh.write( '<a href="%s"><img src="%s" alt="%s"></a>\n'%( fig_url, fig_small_url, plotname ) )
             fh.write( '<a href="%s"><img src="%s" alt="%s"></a>\n'%( subname, fig_small_url, plotname ) )
             if legend != []:
-                fh.write( self._create_legend( legend, legend_timing ) )
+                fh.write( create_legend( legend, legend_timing ) )
 
             fh.write( "</p>\n")
 
             self._create_subreport( subname, figname, plotname, description, legend )
 
-            if plotname == plot_name:
-                shutil.copyfile( fig['filename'], os.path.join( self.output_dir, "main.png" ) )
-                shutil.copyfile( fig['smallfilename'], os.path.join( self.output_dir, "main-small.png" ) )
 
+    def _create_main_plot( self, plot_name ):
+        """ Copies the files of plot_name to main.png and main-small.png, unless they
+        are copies of the same input already. Returns the hash of the main plot, or
+        None if there is none
+        """
+        figs = [ fig for fig in self.figs if fig['plotname'] == plot_name ]
+        if plot_name is None or not figs:
+            return None
+
+        main_hash = self.hashes[plot_name]
+        main_files = [ ( figs[-1]['filename'], os.path.join( self.output_dir, "main.png" ) ),
+                       ( figs[-1]['smallfilename'], os.path.join( self.output_dir, "main-small.png" ) ) ]
+        if ( self.incremental and self.manifest.get( MAIN_PLOT_KEY ) == main_hash and
+             all( os.path.exists( target ) for source, target in main_files ) ):
+            return main_hash
+
+        self._update_manifest( [ ( MAIN_PLOT_KEY, None ) ] )
+        for source, target in main_files:
+            shutil.copyfile( source, target )
+        self._update_manifest( [ ( MAIN_PLOT_KEY, main_hash ) ] )
+        return main_hash
+
+    def _is_rendered( self, plot_name, job ):
+        """ Returns True if the files of the plot exist, and were rendered from the same input """
+        return ( self.manifest.get( plot_name ) == self.hashes[plot_name] and
+                 os.path.exists( job['filename'] ) and os.path.exists( job['smallfilename'] ) )
+
+    def _read_manifest( self ):
+        """ Reads the manifest, with the changes in the journal (of an interrupted report) applied """
+        manifest = {}
+        path = os.path.join( self.output_dir, MANIFEST_FILE )
+        if os.path.exists( path ):
+            try:
+                with open( path ) as fh:
+                    manifest = json.load( fh )
+            except ValueError:
+                logger.warning( "Ignoring corrupt manifest %s", path )
+
+        journal = os.path.join( self.output_dir, MANIFEST_JOURNAL )
+        if os.path.exists( journal ):
+            with open( journal ) as fh:
+                for line in fh:
+                    try:
+                        name, digest = json.loads( line )
+                    except ValueError:
+                        # The last line of an interrupted report may be torn
+                        continue
+                    if digest is None:
+                        manifest.pop( name, None )
+                    else:
+                        manifest[name] = digest
+        return manifest
+
+    def _update_manifest( self, changes ):
+        """ Appends changes (name, hash) to the manifest journal, hash None clears the entry """
+        if not self.incremental or not changes:
+            return
+        for name, digest in changes:
+            if digest is None:
+                self.manifest.pop( name, None )
+            else:
+                self.manifest[name] = digest
+        with open( os.path.join( self.output_dir, MANIFEST_JOURNAL ), 'a' ) as fh:
+            fh.write( "".join( json.dumps( [ name, digest ] ) + "\n" for name, digest in changes ) )
+
+    def _write_manifest( self, main_hash=None ):
+        """ Writes the manifest of the report, and removes the journal """
+        manifest = dict( self.hashes )
+        if main_hash is not None:
+            manifest[MAIN_PLOT_KEY] = main_hash
+        path = os.path.join( self.output_dir, MANIFEST_FILE )
+        with open( path + ".tmp", 'w' ) as fh:
+            json.dump( manifest, fh, indent=1, sort_keys=True )
+        os.replace( path + ".tmp", path )
+
+        journal = os.path.join( self.output_dir, MANIFEST_JOURNAL )
+        if os.path.exists( journal ):
+            os.remove( journal )
+
+    def _remove_stale_files( self, filename, main_plot=True ):
+        """ Removes files in the output dir, which are not part of this report """
+        keep = set( [ filename, MANIFEST_FILE, MANIFEST_JOURNAL ] )
+        if main_plot:
+            keep.update( [ "main.png", "main-small.png" ] )
+        for fig in self.figs:
+            figname = os.path.basename( fig['filename'] )
+            keep.add( figname )
+            keep.add( os.path.basename( fig['smallfilename'] ) )
+            keep.add( os.path.splitext( figname )[0] + ".html" )
+
+        for name in os.listdir( self.output_dir ):
+            path = os.path.join( self.output_dir, name )
+            if name not in keep and os.path.isfile( path ):
+                logger.debug( "Removing stale file %s", path )
+                os.remove( path )
 
     def _create_subreport( self, filename, image_name, plotname, description, legend_lst ):
 
@@ -186,22 +337,202 @@ class PerformanceReport( object ):
         fh.write( "<br>\n" )
         fh.write( '<img src="%s" alt="%s">\n'%( fig_url, plotname ) )
         if legend_lst != []:
-            fh.write( self._create_legend( legend_lst ) )
-
+            fh.write( create_legend( legend_lst ) )
 
-    def _create_legend( self, legend_lst, legend_timing=True ):
 
-        legend_str = '<table border="0" style="margin-left:120px;">\n'
-        legend_str += '<caption align="left"><em>Legend:&nbsp;&nbsp;&nbsp;&nbsp;</em></caption>\n'
-        for legend in legend_lst:
-            if legend_timing:
-                legend_str += '<tr><td><font color="%s">&#9632;</font></td><td>%s:</td><td align=right>%.*f</td></tr>\n'%( legend[0], legend[1], legend[3], legend[2] )
+def create_legend( legend_lst, legend_timing=True ):
+    """
+    Returns the html table of the legend of a plot. legend_lst holds a (color, legend,
+    latest value, precision) tuple per line
+    """
+    legend_str = '<table border="0" style="margin-left:120px;">\n'
+    legend_str += '<caption align="left"><em>Legend:&nbsp;&nbsp;&nbsp;&nbsp;</em></caption>\n'
+    for legend in legend_lst:
+        if legend_timing:
+            legend_str += '<tr><td><font color="%s">&#9632;</font></td><td>%s:</td><td align=right>%.*f</td></tr>\n'%( legend[0], legend[1], legend[3], legend[2] )
 
-            else:
-                legend_str += '<tr><td><font color="%s">&#9632;</font></td><td>%s</td></tr>\n'%( legend[0], legend[1] )
-                
-        legend_str += "</table>\n"
-        return legend_str
+        else:
+            legend_str += '<tr><td><font color="%s">&#9632;</font></td><td>%s</td></tr>\n'%( legend[0], legend[1] )
+
+    legend_str += "</table>\n"
+    return legend_str
+
+
+def max_plot_points( downsample ):
+    """
+    Returns the maximum points of a plotted line for the downsample option of a
+    report (see PerformanceReport), or None if lines are not downsampled
+    """
+    if downsample is True:
+        return POINTS_PER_PIXEL * PLOT_WIDTH
+    if downsample:
+        return int( downsample )
+    return None
+
+
+def plot_job( filename, small_filename, plot_name, unit, dates, data_list, date_format="%d-%m-%Y", max_points=None ):
+    """
+    Returns the job render_plot draws a plot from. Lines with more than max_points
+    points are downsampled (see downsample_min_max). If small_filename is filename,
+    no thumbnail is made
+    """
+    tlen = len( dates )
+    indices = None
+    if max_points and tlen > max_points:
+        logger.debug( "Downsampling %s points to at most %s", tlen, max_points )
+        indices = []
+        lines = []
+        for color, legend, lst, precision in data_list:
+            line_indices, line_values = downsample_min_max( lst, max_points // 2 )
+            indices.append( line_indices )
+            lines.append( ( color, legend, line_values, precision ) )
+        data_list = lines
+
+    return { 'filename': filename, 'smallfilename': small_filename, 'unit': unit, 'dates': dates,
+             'data_list': data_list, 'indices': indices, 'date_format': date_format,
+             'plotname': plot_name }
+
+
+def render_plot( job ):
+    """
+    Renders a plot (a job created by PerformanceReport.plot_data) to its png files.
+
+    The plot is drawn on its own Figure with the Agg canvas, and not through
+    the global pyplot state, so plots can be rendered in worker processes.
+    """
+    dates = job['dates']
+    data_list = job['data_list']
+    date_format = job['date_format']
+    tlen = len( dates )
+    fixed_tick_spacing = True
+
+    fig = Figure()
+    FigureCanvasAgg( fig )
+    ax = fig.add_subplot(111)
+
+
+    x_axis_ticks = None
+
+    if fixed_tick_spacing:
+        x_axis_ticks = list(range(tlen))
+        def tick_format(a, b):
+            return date_label( dates[int(a)], date_format )
+        ax.xaxis.set_major_formatter(matplotlib.ticker.FuncFormatter(tick_format))
+        tick_step = max( 6, -( -tlen // MAX_TICKS ) )
+        ax.xaxis.set_major_locator(matplotlib.ticker.FixedLocator(x_axis_ticks[0::tick_step]))
+    else:
+        x_axis_ticks = dates
+        ax.xaxis.set_major_formatter(mdates.DateFormatter(date_format))
+        ax.xaxis.set_major_locator(mdates.WeekdayLocator())
+
+
+    ax.set_xlim(x_axis_ticks[0], x_axis_ticks[-1])
+    #ax.set_ylim( min( map( min, map( lambda x: x[2], data_list ) ) ) -2,
+    #             max( map( max, map( lambda x: x[2], data_list ) ) ) +2 )
+    ax.set_ylim( 0,
+                 max( list(map( max, [x[2] for x in data_list] )) ) *1.1 )
+
+    ax.grid( True )
+
+    for i, ( color, legend, lst, precision ) in enumerate( data_list ):
+        xs = x_axis_ticks
+        if job.get( 'indices' ) is not None:
+            # Downsampled line, the points are at these indices of the dates
+            xs = [ x_axis_ticks[index] for index in job['indices'][i] ]
+        ax.plot( xs, lst, color=color, aa=True, lw=1 )
+
+    fig.autofmt_xdate()
+    ax.set_ylabel( job['unit'] )
+    fig.savefig( job['filename'], dpi=PLOT_DPI, bbox_inches='tight' )
+    if job['smallfilename'] != job['filename']:
+        save_thumbnail( fig.canvas, job['smallfilename'] )
+
+
+def downsample_min_max( values, buckets ):
+    """
+    Reduces values to the minimum and maximum value of each of buckets
+    consecutive ranges, in their original order. Spikes are kept, as the
+    extremes of each range are. The first and last values are always kept.
+
+    Returns the indices of the kept values, and the kept values
+    """
+    tlen = len( values )
+    if buckets < 1 or tlen <= 2 * buckets:
+        return list( range( tlen ) ), list( values )
+
+    values = list( values )
+    indices = [ 0 ]
+    for bucket in range( buckets ):
+        start = bucket * tlen // buckets
+        end = ( bucket + 1 ) * tlen // buckets
+        segment = values[start:end]
+        low = start + segment.index( min( segment ) )
+        high = start + segment.index( max( segment ) )
+        for index in sorted( set( ( low, high ) ) ):
+            if index != indices[-1]:
+                indices.append( index )
+    if indices[-1] != tlen - 1:
+        indices.append( tlen - 1 )
+
+    return indices, [ values[index] for index in indices ]
+
+
+def date_label( date, date_format ):
+    """
+    Returns the tick label of date on the x axis (empty for the epoch, ie. missing timestamps)
+    """
+    if date == datetime.datetime.fromtimestamp(0):
+        return ""
+    return date.strftime( date_format )
+
+
+def plot_hash( job ):
+    """
+    Returns a hash of everything a plot is rendered from (timestamps, lines, colors, unit etc.)
+
+    The dates are hashed as their tick labels, as that is all the plot shows of
+    them, so dates generated at another time of the same day give the same hash
+    """
+    content = { 'unit': job['unit'],
+                'dates': [ date_label( d, job['date_format'] ) for d in job['dates'] ],
+                'data_list': [ list( x[:2] ) + [ list( x[2] ), x[3] ] for x in job['data_list'] ],
+                'indices': job.get( 'indices' ),
+                'date_format': job['date_format'],
+                'thumbnail': job['smallfilename'] != job['filename'],
+                'dpi': [ PLOT_DPI, THUMBNAIL_DPI ] }
+    return hashlib.sha1( json.dumps( content, sort_keys=True, default=str ).encode( 'utf-8' ) ).hexdigest()
+
+
+def save_thumbnail( canvas, small_filename, dpi=THUMBNAIL_DPI ):
+    """
+    Saves a small version of the image last drawn on the Agg canvas (a plot saved at
+    PLOT_DPI) by resampling its pixel buffer, instead of drawing the plot again at a
+    lower dpi, or reading back the saved png
+    """
+    renderer = canvas.renderer
+    image = Image.frombuffer( 'RGBA', ( int( renderer.width ), int( renderer.height ) ),
+                              canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1 )
+    if PLOT_DPI % dpi == 0:
+        # Box filter by an integer factor, the fastest resampling
+        small = image.reduce( PLOT_DPI // dpi )
+    else:
+        scale = float( dpi ) / PLOT_DPI
+        size = ( max( 1, int( round( image.width * scale ) ) ), max( 1, int( round( image.height * scale ) ) ) )
+        small = image.resize( size, Image.BOX )
+    small.save( small_filename )
+
+
+def create_performance_report( output_dir, backend='png', **kwargs ):
+    """
+    Returns a report for output_dir made by backend (one of REPORT_BACKENDS).
+    The keyword arguments are passed to the report class
+    """
+    if backend == 'png':
+        return PerformanceReport( output_dir, **kwargs )
+    if backend == 'html':
+        from os_perftest.performance_report_html import HtmlPerformanceReport
+        return HtmlPerformanceReport( output_dir, **kwargs )
+    raise ValueError( "Unknown report backend '%s', must be one of %s"%( backend, ", ".join( REPORT_BACKENDS ) ) )
 
 
 def gen_dates( num_of_dates, latest_date=None ):
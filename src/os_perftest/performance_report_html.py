@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""
+:mod:`os_perftest.performance_report_html` -- interactive html report generator
+===============================================================================
+
+Alternative to PerformanceReport with the same plot_data/create_report api.
+Instead of a png per graph, the time series of all graphs are written once
+to data.js, and drawn in the browser by a small chart script (chart.js)
+written to the report dir. The report works offline, directly from the
+file system. Drag over a chart to zoom in, double click to zoom out.
+
+The main plot of a report is also rendered as main.png (and
+main-small.png), like in the png report.
+"""
+import json
+import logging
+import os
+import shutil
+
+from os_perftest.performance_report import color_map
+from os_perftest.performance_report import create_legend
+from os_perftest.performance_report import max_plot_points
+from os_perftest.performance_report import plot_job
+from os_perftest.performance_report import render_plot
+
+logger = logging.getLogger("dbc." + __name__)
+
+CHART_SCRIPT = r"""
+(function () {
+  "use strict";
+
+  function pad(n) { return (n < 10 ? "0" : "") + n; }
+
+  function formatDate(seconds, format) {
+    var d = new Date(seconds * 1000);
+    return format.replace(/%([dmYHMS])/g, function (m, c) {
+      switch (c) {
+        case "d": return pad(d.getDate());
+        case "m": return pad(d.getMonth() + 1);
+        case "Y": return d.getFullYear();
+        case "H": return pad(d.getHours());
+        case "M": return pad(d.getMinutes());
+        case "S": return pad(d.getSeconds());
+      }
+    });
+  }
+
+  function niceStep(range, ticks) {
+    var raw = range / ticks;
+    var magnitude = Math.pow(10, Math.floor(Math.log(raw) / Math.LN10));
+    var steps = [1, 2, 5, 10];
+    for (var i = 0; i < steps.length; i++) {
+      if (raw <= steps[i] * magnitude) { return steps[i] * magnitude; }
+    }
+    return 10 * magnitude;
+  }
+
+  function Chart(canvas, graph) {
+    this.canvas = canvas;
+    this.graph = graph;
+    this.from = 0;
+    this.to = graph.dates.length - 1;
+    this.hover = null;
+    this.dragStart = null;
+    this.margin = {left: 70, right: 20, top: 10, bottom: 60};
+    this.bind();
+    this.draw();
+  }
+
+  Chart.prototype.xFor = function (index) {
+    var width = this.canvas.width - this.margin.left - this.margin.right;
+    var span = Math.max(1, this.to - this.from);
+    return this.margin.left + (index - this.from) * width / span;
+  };
+
+  Chart.prototype.indexFor = function (x) {
+    var width = this.canvas.width - this.margin.left - this.margin.right;
+    var span = Math.max(1, this.to - this.from);
+    var index = Math.round(this.from + (x - this.margin.left) * span / width);
+    return Math.min(this.to, Math.max(this.from, index));
+  };
+
+  Chart.prototype.draw = function () {
+    var ctx = this.canvas.getContext("2d");
+    var graph = this.graph, m = this.margin, self = this;
+    var width = this.canvas.width, height = this.canvas.height;
+    var plotHeight = height - m.top - m.bottom;
+    ctx.clearRect(0, 0, width, height);
+
+    var max = 0;
+    graph.lines.forEach(function (line) {
+      for (var i = self.from; i <= self.to; i++) {
+        if (line.values[i] > max) { max = line.values[i]; }
+      }
+    });
+    max = max > 0 ? max * 1.1 : 1;
+    var yFor = function (value) { return m.top + plotHeight - value * plotHeight / max; };
+
+    ctx.font = "11px sans-serif";
+    ctx.strokeStyle = "#dddddd";
+    ctx.fillStyle = "#000000";
+    ctx.lineWidth = 1;
+
+    var step = niceStep(max, 6);
+    ctx.textAlign = "right";
+    ctx.textBaseline = "middle";
+    for (var v = 0; v <= max; v += step) {
+      var y = Math.round(yFor(v)) + 0.5;
+      ctx.beginPath(); ctx.moveTo(m.left, y); ctx.lineTo(width - m.right, y); ctx.stroke();
+      ctx.fillText(+v.toPrecision(6), m.left - 5, y);
+    }
+
+    var labels = Math.max(1, Math.floor((width - m.left - m.right) / 90));
+    var every = Math.max(1, Math.ceil((this.to - this.from) / labels));
+    ctx.textAlign = "right";
+    ctx.textBaseline = "top";
+    for (var i = this.from; i <= this.to; i += every) {
+      var x = Math.round(this.xFor(i)) + 0.5;
+      ctx.beginPath(); ctx.moveTo(x, m.top); ctx.lineTo(x, m.top + plotHeight); ctx.stroke();
+      if (graph.dates[i] !== 0) {
+        ctx.save();
+        ctx.translate(x, m.top + plotHeight + 5);
+        ctx.rotate(-Math.PI / 6);
+        ctx.fillText(formatDate(graph.dates[i], graph.date_format), 0, 0);
+        ctx.restore();
+      }
+    }
+
+    ctx.save();
+    ctx.translate(12, m.top + plotHeight / 2);
+    ctx.rotate(-Math.PI / 2);
+    ctx.textAlign = "center";
+    ctx.fillText(graph.unit, 0, 0);
+    ctx.restore();
+
+    ctx.save();
+    ctx.beginPath();
+    ctx.rect(m.left, m.top, width - m.left - m.right, plotHeight);
+    ctx.clip();
+    graph.lines.forEach(function (line) {
+      ctx.strokeStyle = line.color;
+      ctx.beginPath();
+      for (var i = self.from; i <= self.to; i++) {
+        var x = self.xFor(i), y = yFor(line.values[i]);
+        if (i === self.from) { ctx.moveTo(x, y); } else { ctx.lineTo(x, y); }
+      }
+      ctx.stroke();
+    });
+    ctx.restore();
+
+    ctx.strokeStyle = "#000000";
+    ctx.strokeRect(m.left + 0.5, m.top + 0.5, width - m.left - m.right, plotHeight);
+
+    if (this.dragStart !== null && this.hover !== null) {
+      var x0 = this.xFor(this.dragStart), x1 = this.xFor(this.hover);
+      ctx.fillStyle = "rgba(0, 0, 255, 0.1)";
+      ctx.fillRect(Math.min(x0, x1), m.top, Math.abs(x1 - x0), plotHeight);
+    }
+
+    if (this.hover !== null) {
+      var hx = Math.round(this.xFor(this.hover)) + 0.5;
+      ctx.strokeStyle = "#888888";
+      ctx.beginPath(); ctx.moveTo(hx, m.top); ctx.lineTo(hx, m.top + plotHeight); ctx.stroke();
+      var text = [formatDate(graph.dates[this.hover], graph.date_format)];
+      graph.lines.forEach(function (line) {
+        text.push(line.legend + ": " + line.values[self.hover].toFixed(line.precision));
+      });
+      ctx.textAlign = "left";
+      ctx.textBaseline = "top";
+      var boxWidth = 0;
+      text.forEach(function (t) { boxWidth = Math.max(boxWidth, ctx.measureText(t).width); });
+      var bx = hx + 8 + boxWidth + 10 > width ? hx - boxWidth - 18 : hx + 8;
+      ctx.fillStyle = "rgba(255, 255, 255, 0.9)";
+      ctx.fillRect(bx, m.top + 5, boxWidth + 10, text.length * 14 + 6);
+      text.forEach(function (t, i) {
+        ctx.fillStyle = i === 0 ? "#000000" : graph.lines[i - 1].color;
+        ctx.fillText(t, bx + 5, m.top + 8 + i * 14);
+      });
+    }
+  };
+
+  Chart.prototype.bind = function () {
+    var self = this;
+    var position = function (event) {
+      var rect = self.canvas.getBoundingClientRect();
+      return self.indexFor((event.clientX - rect.left) * self.canvas.width / rect.width);
+    };
+    this.canvas.addEventListener("mousemove", function (event) {
+      self.hover = position(event);
+      self.draw();
+    });
+    this.canvas.addEventListener("mouseleave", function () {
+      self.hover = null;
+      self.dragStart = null;
+      self.draw();
+    });
+    this.canvas.addEventListener("mousedown", function (event) {
+      self.dragStart = position(event);
+    });
+    this.canvas.addEventListener("mouseup", function (event) {
+      var end = position(event);
+      if (self.dragStart !== null && Math.abs(end - self.dragStart) >= 1) {
+        self.from = Math.min(self.dragStart, end);
+        self.to = Math.max(self.dragStart, end);
+      }
+      self.dragStart = null;
+      self.draw();
+    });
+    this.canvas.addEventListener("dblclick", function () {
+      self.from = 0;
+      self.to = self.graph.dates.length - 1;
+      self.draw();
+    });
+  };
+
+  window.addEventListener("load", function () {
+    REPORT_DATA.forEach(function (graph) {
+      var canvas = document.getElementById("chart-" + graph.id);
+      if (canvas) { new Chart(canvas, graph); }
+    });
+  });
+})();
+"""
+
+
+def _timestamp( date ):
+    """ Seconds since epoch of a datetime (in local time, like the png report) """
+    return int( round( date.timestamp() ) )
+
+
+class HtmlPerformanceReport( object ):
+
+    def __init__( self, output_dir, width=900, height=450, parallel=False, workers=None, thumbnails=True,
+                  incremental=False, downsample=True ):
+        """
+        Creates an interactive html report in output_dir.
+
+        The options of PerformanceReport apply to the main plot (main.png):
+        it gets a thumbnail unless thumbnails is False, and its lines are
+        downsampled as given by downsample. The charts are drawn by the
+        browser, and all their data is in data.js, so plots are neither
+        rendered in parallel nor incrementally. parallel or incremental
+        raise a ValueError, and the output dir is always created anew.
+        """
+        if parallel or incremental:
+            raise ValueError( "The html report backend does not support parallel or incremental reports" )
+
+        self.output_dir = os.path.abspath( output_dir )
+        if os.path.exists( self.output_dir ):
+            shutil.rmtree( self.output_dir )
+        os.mkdir( self.output_dir )
+
+        self.width = width
+        self.height = height
+        self.thumbnails = thumbnails
+        self.max_points = max_plot_points( downsample )
+        self.figs = []
+        self.graphs = []
+        self.plots = {}
+
+    def plot_data( self, plot_name, description, unit, dates, *data_list, date_format="%d-%m-%Y" ):
+
+        tlen = len( dates )
+        logger.debug("Plot data plot_name='%s', description='%s', unit=%s, dates=%s", plot_name, description, unit, tlen)
+
+        for color, legend, lst, precision in data_list:
+            if len( lst ) != tlen:
+                raise RuntimeError( "mismatch in length of timestamp/data lists, %s != %s"%(len(lst), tlen) )
+
+        plot_legend = []
+        lines = []
+        for color, legend, lst, precision in data_list:
+            plot_legend.append( (color_map[color], legend, lst[ -1 ], precision ) )
+            # Values are rounded to a few more decimals than shown, to keep data.js small
+            lines.append( { 'color': color_map[color], 'legend': legend, 'precision': precision,
+                            'values': [ round( x, precision + 3 ) for x in lst ] } )
+
+        graph_id = len( self.graphs )
+        self.graphs.append( { 'id': graph_id, 'name': plot_name, 'unit': unit, 'date_format': date_format,
+                              'dates': [ _timestamp( d ) for d in dates ], 'lines': lines } )
+        self.figs.append( { 'id': graph_id, 'plotname': plot_name, 'description': description, 'legend': plot_legend } )
+        self.plots[plot_name] = ( unit, dates, data_list, date_format )
+
+    def create_report( self, filename='index.html', plot_name=None, legend_timing=True ):
+        """
+        if plot_name is supplied, the specific plot is shown first in the report,
+        and is also saved as a png file called 'main.png'
+        """
+        logger.debug("Create report filename='%s', plot_name='%s', legend_timing=%s", filename, plot_name, legend_timing)
+
+        if plot_name in self.plots:
+            main_file = os.path.join( self.output_dir, 'main.png' )
+            main_small_file = os.path.join( self.output_dir, 'main-small.png' ) if self.thumbnails else main_file
+            unit, dates, data_list, date_format = self.plots[plot_name]
+            render_plot( plot_job( main_file, main_small_file, plot_name, unit, dates, data_list, date_format,
+                                   self.max_points ) )
+
+        with open( os.path.join( self.output_dir, 'data.js' ), 'w' ) as fh:
+            fh.write( "var REPORT_DATA = " )
+            json.dump( self.graphs, fh, separators=( ',', ':' ) )
+            fh.write( ";\n" )
+
+        with open( os.path.join( self.output_dir, 'chart.js' ), 'w' ) as fh:
+            fh.write( CHART_SCRIPT )
+
+        figs = sorted( self.figs, key=lambda fig: fig['plotname'] != plot_name )
+
+        with open( os.path.join( self.output_dir, filename ), 'w' ) as fh:
+            fh.write( '<html>\n<head>\n<meta charset="utf-8">\n' )
+            fh.write( '<script src="data.js"></script>\n<script src="chart.js"></script>\n' )
+            fh.write( '</head>\n<body>\n' )
+            for fig in figs:
+                fh.write( "<p>\n")
+                fh.write( '<h2 id="%s">%s</h2>\n'%( fig['plotname'], fig['plotname'] ) )
+                fh.write( "<b>Description: %s</b>\n"%fig['description'] )
+                fh.write( "<br>\n" )
+                fh.write( '<canvas id="chart-%s" width="%s" height="%s"></canvas>\n'%( fig['id'], self.width, self.height ) )
+                if fig['legend'] != []:
+                    fh.write( create_legend( fig['legend'], legend_timing ) )
+                fh.write( "</p>\n")
+            fh.write( '</body>\n</html>\n' )
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""
+:mod:`os_perftest.performance_statistics` -- streaming statistics
+=================================================================
+
+Single pass statistics over streamed or in-memory values. Count, min,
+max, mean and variance are computed with Welford's method, and partial
+results (ie. from several files or processes) can be merged.
+
+Percentiles are computed from the counts of each distinct value, with
+linear interpolation between the closest ranks: for n sorted values the
+p'th percentile lies at rank (n - 1) * p / 100. This is the default method
+of NumPy (and type 7 in Hyndman & Fan).
+"""
+from bisect import bisect_right
+from collections import Counter
+import math
+
+DEFAULT_PERCENTILES = [50, 95, 99, 99.9]
+
+
+class Statistics(object):
+    """ Mergeable single pass statistics of a stream of values.
+
+    If keep_counts is False, only the moments are kept and percentiles
+    cannot be calculated.
+    """
+
+    def __init__(self, keep_counts=True):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.counts = Counter() if keep_counts else None
+
+    @classmethod
+    def from_values(cls, values, keep_counts=True):
+        stats = cls(keep_counts=keep_counts)
+        stats.add_many(values)
+        return stats
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.counts is not None:
+            self.counts[value] += 1
+
+    def add_many(self, values):
+        """ Adds a block of values (any iterable, ie. a list, array or generator).
+
+        The moments of the block are computed in memory and merged, which
+        is faster than adding the values one by one.
+        """
+        if not isinstance(values, (list, tuple)):
+            values = list(values)
+        if not values:
+            return
+
+        block = Statistics(keep_counts=False)
+        block.count = len(values)
+        block.mean = math.fsum(values) / block.count
+        block.m2 = math.fsum((x - block.mean)**2 for x in values)
+        block.min = min(values)
+        block.max = max(values)
+        self._merge_moments(block)
+        if self.counts is not None:
+            self.counts.update(values)
+
+    def merge(self, other):
+        """ Merges the statistics of other into this """
+        self._merge_moments(other)
+        if self.counts is not None:
+            if other.counts is None:
+                raise ValueError("Cannot merge statistics without counts into statistics with counts")
+            self.counts.update(other.counts)
+        return self
+
+    def variance(self):
+        """ Population variance """
+        if self.count == 0:
+            return 0.0
+        return self.m2 / self.count
+
+    def standard_deviation(self):
+        return math.sqrt(self.variance())
+
+    def percentiles(self, percentiles):
+        """ Returns dict from each percentile in percentiles to its value """
+        if self.counts is None:
+            raise ValueError("Percentiles need value counts")
+        if self.count == 0:
+            raise ValueError("No values to calculate percentiles from")
+
+        values = sorted(self.counts)
+        cumulative = []
+        seen = 0
+        for value in values:
+            seen += self.counts[value]
+            cumulative.append(seen)
+
+        def value_at(rank):
+            return values[bisect_right(cumulative, rank)]
+
+        result = {}
+        for p in percentiles:
+            if not 0 <= p <= 100:
+                raise ValueError("Percentile must be between 0 and 100, got %s" % p)
+            rank = (self.count - 1) * p / 100.0
+            lower = int(math.floor(rank))
+            fraction = rank - lower
+            value = value_at(lower)
+            if fraction > 0:
+                value = value + (value_at(lower + 1) - value) * fraction
+            result[p] = value
+        return result
+
+    def calculate(self, percentiles=None):
+        """ Returns the statistics as a dict (the format of calculate_values) """
+        if self.count == 0:
+            raise ValueError("No values to calculate from")
+
+        result = {}
+        result['samples'] = self.count
+        result['min'] = self.min
+        result['max'] = self.max
+        result['mean'] = self.mean
+        result['standard-deviation'] = self.standard_deviation()
+        result['percentiles'] = {}
+        if percentiles is not None:
+            result['percentiles'] = self.percentiles(percentiles)
+
+        return result
+
+    def _merge_moments(self, other):
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+
+def steady_state_start(values, window=10, max_cv=0.1):
+    """ Returns the index of the first value of the steady state in a series, or None.
+
+    The steady state starts at the first rolling window of values whose
+    coefficient of variation (standard deviation / mean) is at most max_cv.
+    """
+    for start in range(0, len(values) - window + 1):
+        stats = Statistics.from_values(values[start:start + window], keep_counts=False)
+        if stats.mean != 0 and stats.standard_deviation() / abs(stats.mean) <= max_cv:
+            return start
+    return None
+
+
+class LatencyHistogram(object):
+    """ Mergeable histogram with logarithmic buckets.
+
+    A value v > 0 is counted in bucket ceil(log(v) / log(gamma)), where
+    gamma = (1 + accuracy) / (1 - accuracy). Every percentile read from the
+    histogram is within the relative accuracy of a value in the data
+    (values are clamped to the exact min and max). Values <= 0 are counted
+    in a separate zero bucket.
+
+    Histograms with the same accuracy merge exactly, so percentiles over
+    several runs or load generators can be calculated from the merged
+    histogram.
+    """
+
+    def __init__(self, accuracy=0.01):
+        if not 0 < accuracy < 1:
+            raise ValueError("accuracy must be between 0 and 1, got %s" % accuracy)
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def from_counts(cls, counts, accuracy=0.01):
+        """ Creates histogram from a dict of value -> count (ie. Statistics.counts) """
+        histogram = cls(accuracy=accuracy)
+        for value, count in counts.items():
+            histogram.add(value, count)
+        return histogram
+
+    def add(self, value, count=1):
+        if count <= 0:
+            return
+        if value <= 0:
+            self.zero += count
+        else:
+            index = int(math.ceil(math.log(value) / self._log_gamma))
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """ Merges other into this histogram. Both must have the same accuracy """
+        if other.accuracy != self.accuracy:
+            raise ValueError("Cannot merge histograms with accuracy %s and %s" % (self.accuracy, other.accuracy))
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    def percentile(self, p):
+        """ Returns the value at percentile p (nearest rank) """
+        if self.count == 0:
+            raise ValueError("No values in histogram")
+        if not 0 <= p <= 100:
+            raise ValueError("Percentile must be between 0 and 100, got %s" % p)
+
+        rank = int(math.floor((self.count - 1) * p / 100.0))
+        if rank < self.zero:
+            return min(max(0, self.min), self.max)
+
+        seen = self.zero
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                value = 2 * self.gamma**index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def percentiles(self, percentiles):
+        return dict((p, self.percentile(p)) for p in percentiles)
+
+    def to_dict(self):
+        """ Compact representation, with the bucket counts as a dense list from the lowest bucket """
+        result = {'accuracy': self.accuracy, 'count': self.count, 'min': self.min, 'max': self.max,
+                  'zero': self.zero, 'offset': 0, 'counts': []}
+        if self.buckets:
+            offset = min(self.buckets)
+            result['offset'] = offset
+            result['counts'] = [self.buckets.get(i, 0) for i in range(offset, max(self.buckets) + 1)]
+        return result
+
+    @classmethod
+    def from_dict(cls, dikt):
+        histogram = cls(accuracy=dikt['accuracy'])
+        offset = dikt['offset']
+        histogram.buckets = dict((offset + i, c) for i, c in enumerate(dikt['counts']) if c > 0)
+        histogram.zero = dikt['zero']
+        histogram.count = dikt['count']
+        histogram.min = dikt['min']
+        histogram.max = dikt['max']
+        return histogram
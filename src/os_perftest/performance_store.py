@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""
+:mod:`os_perftest.performance_store` -- columnar store for dump data
+====================================================================
+
+Flattens each dump entry once into columns keyed on the full path of
+every leaf value, ie. (service, mbean, 'value', attribute). A column holds
+the sample indices where the path is present, and the values in an
+array (or a list for non numeric values), so looking up a path does not
+walk the dump again.
+"""
+from array import array
+
+_INT_MIN = -2**63
+_INT_MAX = 2**63 - 1
+
+
+def _is_int( value ):
+    return type( value ) == int and _INT_MIN <= value <= _INT_MAX
+
+
+def _is_float( value ):
+    return type( value ) == float
+
+
+def is_number( value ):
+    """ True if value is an int or a float. Booleans are not numbers
+    """
+    return isinstance( value, ( int, float ) ) and not isinstance( value, bool )
+
+
+class Column( object ):
+    """ Values of a single path, and the indices of the samples they belong to
+    """
+
+    def __init__( self ):
+        self.indices = array( 'l' )
+        self.values = None
+
+    def append( self, index, value ):
+        if self.values is None:
+            if _is_int( value ):
+                self.values = array( 'q' )
+            elif _is_float( value ):
+                self.values = array( 'd' )
+            else:
+                self.values = []
+        elif isinstance( self.values, array ):
+            if self.values.typecode == 'q' and _is_float( value ):
+                self.values = array( 'd', self.values )
+            elif not ( _is_int( value ) or _is_float( value ) ):
+                self.values = list( self.values )
+
+        self.indices.append( index )
+        self.values.append( value )
+
+    def dense( self, samples, default=0 ):
+        """ Returns a list with a value for every sample, missing samples are set to default
+        """
+        result = [ default ] * samples
+        for index, value in zip( self.indices, self.values ):
+            result[index] = value
+        return result
+
+    def __len__( self ):
+        return len( self.indices )
+
+
+class DumpStore( object ):
+    """ Columnar store of a dump (a list of entries)
+    """
+
+    def __init__( self, dump=None ):
+        self.samples = 0
+        self.columns = {}
+        self.entries = set()
+        self._mbeans = {}
+        self._mbean_columns = {}
+        self._dump = []
+        for entry in dump or []:
+            self.append( entry )
+
+    def append( self, entry ):
+        """ Flattens entry into the columns
+        """
+        index = self.samples
+        self.samples += 1
+        self._dump.append( entry )
+        self.entries.update( entry.keys() )
+        for name, mbeans in entry.items():
+            if isinstance( mbeans, dict ):
+                self._mbeans.setdefault( name, {} ).update( dict.fromkeys( mbeans ) )
+        self._flatten( entry, (), index )
+
+    def has_path( self, path ):
+        return self._key( path ) in self.columns
+
+    def column( self, path ):
+        """ Returns the column at path, or None if the path holds no leaf values
+        """
+        return self.columns.get( self._key( path ) )
+
+    def values( self, path, default=0 ):
+        """ Returns the value at path for every sample. Samples without the path get default.
+
+        path is either a tuple of keys, or a '/' separated string
+        """
+        key = self._key( path )
+        column = self.columns.get( key )
+        if column is not None:
+            return column.dense( self.samples, default )
+
+        # path is not a leaf (or not present), fall back to looking it up in each entry
+        return [ self._lookup( entry, key, default ) for entry in self._dump ]
+
+    def lookup( self, entry, mbean, path, default=0 ):
+        """ Returns the values at path in mbean of entry (same semantics as
+        MBeanDumper.read_values_from_dump_new)
+        """
+        if path.startswith( "/" ):
+            path = path[1:]
+        return self.values( ( str( entry ), str( mbean ) ) + tuple( path.split( "/" ) ), default )
+
+    def mbeans( self, entry ):
+        """ Returns the names of the mbeans dumped for entry
+        """
+        return list( self._mbeans.get( entry, {} ) )
+
+    def mbean_columns( self, entry, mbean ):
+        """ Returns the paths of all columns below mbean in entry
+        """
+        return self._mbean_columns.get( ( entry, mbean ), [] )
+
+    def _flatten( self, dikt, path, index ):
+        for key, value in dikt.items():
+            key_path = path + ( str( key ), )
+            if isinstance( value, dict ):
+                self._flatten( value, key_path, index )
+            else:
+                column = self.columns.get( key_path )
+                if column is None:
+                    column = Column()
+                    self.columns[key_path] = column
+                    if len( key_path ) > 2:
+                        self._mbean_columns.setdefault( key_path[:2], [] ).append( key_path )
+                column.append( index, value )
+
+    def _key( self, path ):
+        if isinstance( path, str ):
+            return tuple( path.split( "/" ) )
+        return tuple( str( x ) for x in path )
+
+    def _lookup( self, entry, key, default ):
+        value = entry
+        for k in key:
+            if not isinstance( value, dict ) or k not in value:
+                return default
+            value = value[k]
+        return value
@@ -4,6 +4,7 @@
 
 import datetime
 import logging
+import math
 import os
 import re
 import shutil
@@ -17,6 +18,7 @@ from os_python.common.utils.init_functions import log_fields
 from os_python.common.utils.init_functions import die
 from os_python.common.utils.cleanupstack import CleanupStack
 
+import os_perftest.performance_history as performance_history
 import os_perftest.performance_report as performance_report
 from os_perftest.performance_dumper import MBeanDumper
 from os_perftest.performance_report import PerformanceReport
@@ -31,6 +33,62 @@ logger = logging.getLogger("dbc." + __name__)
 logger.addHandler(NullHandler())
 
 
+class FixedRateScheduler:
+    """ Calls a function at fixed rate deadlines measured on the monotonic clock.
+
+    Deadlines lie on a fixed grid (start + n * interval), so the samples do
+    not drift. If a call overruns one or more deadlines, the missed ticks are
+    skipped and counted, and the next call waits for the next deadline on
+    the grid.
+    """
+
+    def __init__(self, interval, clock=time.monotonic, sleep=time.sleep):
+        if interval <= 0:
+            raise ValueError("interval must be positive, got %s" % interval)
+        self.interval = float(interval)
+        self.clock = clock
+        self.sleep = sleep
+        self.ticks = 0
+        self.missed_ticks = 0
+        self.fire_times = []
+
+    def run(self, func, duration):
+        """ Calls func every interval seconds, until duration seconds has passed """
+        start = self.clock()
+        end = start + duration
+        deadline = start
+
+        while deadline < end:
+            self.fire_times.append(self.clock())
+            func()
+            self.ticks += 1
+
+            deadline += self.interval
+            now = self.clock()
+            if now > deadline:
+                missed = int((now - deadline) // self.interval) + 1
+                logger.warning("Dump overran interval of %s seconds, skipping %s tick(s)" % (self.interval, missed))
+                self.missed_ticks += missed
+                deadline += missed * self.interval
+
+            self.sleep(max(0.0, min(deadline, end) - self.clock()))
+
+        logger.info("Dumped %s times with interval %.3f seconds (requested %s), missed %s tick(s)"
+                    % (self.ticks, self.achieved_interval(), self.interval, self.missed_ticks))
+
+    def grid_index(self):
+        """ Returns the index on the grid (start + n * interval) of the current call.
+        Unlike ticks, it counts the skipped ticks too
+        """
+        return self.ticks + self.missed_ticks
+
+    def achieved_interval(self):
+        """ Returns the mean interval between calls in seconds """
+        if len(self.fire_times) < 2:
+            return self.interval
+        return (self.fire_times[-1] - self.fire_times[0]) / (len(self.fire_times) - 1)
+
+
 class PerformanceTest:
 
     def on_service_start(self, name, service, configuration):
@@ -52,6 +110,9 @@ class PerformanceTest:
                              'log-zip-file':'logs.zip'}
 
         self.configuration.update(configuration)
+        self.dump_scheduler = None
+        self.dump_phase = None
+        self.started = datetime.datetime.now()
         self._setup_logger(configuration['verbose'])
         log_fields("Performance configuration", fields=configuration)
 
@@ -85,23 +146,24 @@ class PerformanceTest:
             if configuration['run-time']:
                 logger.info("Running test for %s seconds" % configuration['run-time'])
                 if 'dump-every' in configuration and configuration['dump-every'] is not None:
-                    now = lambda: datetime.datetime.now()
-                    start = now()
-                    end = now() + datetime.timedelta( 0, configuration['run-time'] )
-                    while( now() < end ):
-                        dump_start = now()
-                        logger.debug("Dumping performance statistics")
-                        self.on_dump_statistics(services, configuration )
-                        duration =  now() - dump_start
-                        sleep_time = int(configuration['dump-every']) - duration.seconds;
-                        logger.debug("Sleeping %s"%sleep_time)
-                        time.sleep( sleep_time )
+                    self.dump_scheduler = FixedRateScheduler(float(configuration['dump-every']))
+                    dump_start = time.monotonic()
+
+                    def dump():
+                        self.dump_phase = self._dump_phase(configuration, time.monotonic() - dump_start,
+                                                           self.dump_scheduler.grid_index())
+                        logger.debug("Dumping performance statistics (%s)" % self.dump_phase)
+                        self.on_dump_statistics(services, configuration)
+
+                    self.dump_scheduler.run(dump, float(configuration['run-time']))
+                    self.dump_phase = None
                 else:
                     time.sleep( int( configuration['run-time'] ) )
             else:
                 input("\nPress Enter to shutdown...")
 
             self.on_test_end(services, configuration)
+            self.apply_history_retention()
 
         except Exception as err:
             die("Caught error during performance test:\n%s" % self._format_traceback(sys.exc_info(), err))
@@ -121,17 +183,76 @@ class PerformanceTest:
                 logger.debug("Deleting folder " + folder)
                 shutil.rmtree(folder)
 
+    def _dump_phase(self, configuration, elapsed, tick):
+        """ Returns the phase of a dump: 'warm-up', 'steady' or 'cool-down'.
+
+        The warm-up and cool-down are configured in seconds ('warm-up',
+        'cool-down') or as a number of dumps ('warm-up-dumps', 'cool-down-dumps').
+        tick is the index of the dump on the grid of the scheduler (skipped
+        ticks included), so the dumps are counted in grid slots.
+        """
+        run_time = float(configuration['run-time'])
+        interval = float(configuration['dump-every'])
+        total_ticks = int(math.ceil(run_time / interval))
+
+        if configuration.get('warm-up') and elapsed < float(configuration['warm-up']):
+            return 'warm-up'
+        if configuration.get('warm-up-dumps') and tick < int(configuration['warm-up-dumps']):
+            return 'warm-up'
+        if configuration.get('cool-down') and elapsed >= run_time - float(configuration['cool-down']):
+            return 'cool-down'
+        if configuration.get('cool-down-dumps') and tick >= total_ticks - int(configuration['cool-down-dumps']):
+            return 'cool-down'
+        return 'steady'
+
     def dump_statistics(self, filename, *mBean_pair):
-        """ Dumps mbean statistics to file (through jolokia)"""
+        """ Dumps mbean statistics to file (through jolokia)
+
+        Dumps made during the warm-up or cool-down of the test are marked
+        with their phase, and left out of the plots. If 'history' is
+        configured (a sqlite database), the dumps of this test are also
+        added to a run in the history. Its retention is applied once at
+        the end of the test (see apply_history_retention).
+        """
         logger.info("Dumping performance statistics to file %s" % filename)
         mbd = MBeanDumper(filename)
 
-        mbd.dump(*mBean_pair)
-
-    def plot_statistics(self, config_file, main_plot=None):
-        """ plots statistics using the performace-report tool"""
+        run = "%s %s" % (os.path.basename(filename), self.started.strftime("%Y-%m-%dT%H:%M:%S"))
+        mbd.dump(*mBean_pair, phase=self.dump_phase, history=self.configuration.get('history'), run=run)
+
+    def apply_history_retention(self):
+        """ Rolls up the runs in the history outside its raw retention, once at the end of the test.
+
+        The retention is configured by 'history-raw-days' (default 30) and
+        'history-raw-runs' (the latest runs of each kind kept raw)
+        """
+        history = self.configuration.get('history')
+        if history is None:
+            return
+        raw_runs = self.configuration.get('history-raw-runs')
+        raw_days = self.configuration.get('history-raw-days', performance_history.DEFAULT_RAW_DAYS)
+        logger.info("Applying retention to history %s" % history)
+        performance_history.apply_retention(history,
+                                            raw_runs=int(raw_runs) if raw_runs is not None else None,
+                                            raw_days=int(raw_days) if raw_days is not None else None)
+
+    def plot_statistics(self, config_file, main_plot=None, backend='png', incremental=None, thumbnails=None):
+        """ plots statistics using the performace-report tool
+
+        backend is either 'png' (images) or 'html' (interactive charts).
+        If incremental is True (default is the 'incremental-report'
+        configuration for the png backend), the report folder is kept, and
+        only plots whose values have changed are rendered again. If thumbnails is False
+        (default is the 'report-thumbnails' configuration, True if not
+        set), the index shows the full size images.
+        """
+        if incremental is None:
+            incremental = backend == 'png' and bool(self.configuration.get('incremental-report', False))
+        if thumbnails is None:
+            thumbnails = bool(self.configuration.get('report-thumbnails', True))
         logger.info("Plotting performance statistics")
-        performance_plotter.plot(config_file, main_plot=main_plot)
+        performance_plotter.plot(config_file, main_plot=main_plot, backend=backend, incremental=incremental,
+                                 thumbnails=thumbnails)
 
     def _save_service_logfiles(self, service, name, logfolder):
         """ Saves service logfiles """
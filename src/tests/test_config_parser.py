@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from os_perftest.config_parser import ConfigParseError
+from os_perftest.config_parser import parse_config
+
+CONFIG = """[main]
+datafile = %s
+
+[Errors]
+unit = ratio
+    [[errors]]
+    color = r
+    jolokiaurl = metrics
+    mbean = "name=errors,type=counters"
+    yCoordPath = /value/Count
+    [[error ratio]]
+    color = b
+    jolokiaurl = metrics
+    mbean = "name=errors,type=counters"
+    yCoordPath = /value/Count
+    derive = counter-ratio
+    otherMbean = "name=requests,type=meters"
+    otherPath = /value/Count
+"""
+
+
+LITERAL_CONFIG = """[main]
+datafile = %s
+
+[Requests]
+unit = count
+    [[search]]
+    color = b
+    jolokiaurl = metrics
+    mbean = "type=meters,name=search[*]"
+    yCoordPath = /value/Count
+    [[all]]
+    color = r
+    query = "sum(metrics:type=meters,*/value/Count)"
+"""
+
+
+class ParseConfigTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dump_file = os.path.join(self.tmp_dir, 'dump.json')
+        with open(self.dump_file, 'w') as fh:
+            for i, (requests, errors) in enumerate([(0, 0), (100, 1), (300, 4)]):
+                entry = {'metrics': {'name=requests,type=meters': {'timestamp': 1000 + 10 * i, 'value': {'Count': requests}},
+                                     'name=errors,type=counters': {'timestamp': 1000 + 10 * i, 'value': {'Count': errors}},
+                                     'name=search[*],type=meters': {'timestamp': 1000 + 10 * i, 'value': {'Count': i}},
+                                     'name=searchx,type=meters': {'timestamp': 1000 + 10 * i, 'value': {'Count': 50}}}}
+                fh.write(json.dumps(entry) + '\n')
+        self.config_file = os.path.join(self.tmp_dir, 'graphs.ini')
+        self._write_config(CONFIG)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_config(self, config):
+        with open(self.config_file, 'w') as fh:
+            fh.write(config % self.dump_file)
+
+    def test_derived_lines_default_to_precision_2(self):
+        graph = parse_config(self.config_file)[0]
+        lines = dict((line[1], line) for line in graph['lines'])
+        self.assertEqual([0, 1, 4], lines['errors'][2])
+        self.assertEqual(0, lines['errors'][3])
+        self.assertEqual([0, 0.01, 0.015], lines['error ratio'][2])
+        self.assertEqual(2, lines['error ratio'][3])
+
+    def test_mbean_names_are_not_patterns(self):
+        self._write_config(LITERAL_CONFIG)
+        lines = dict((line[1], line) for line in parse_config(self.config_file)[0]['lines'])
+        self.assertEqual([0, 1, 2], lines['search'][2])
+        self.assertEqual([50, 151, 352], lines['all'][2])
+
+    def test_reduce_needs_a_query(self):
+        self._write_config(LITERAL_CONFIG.replace("    yCoordPath = /value/Count\n", "    yCoordPath = /value/Count\n    reduce = sum\n", 1))
+        self.assertRaises(ConfigParseError, parse_config, self.config_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
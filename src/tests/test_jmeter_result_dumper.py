@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from os_perftest.jmeter_result_dumper import RunAggregator
+from os_perftest.jmeter_result_dumper import WindowAggregator
+from os_perftest.jmeter_result_dumper import harvest_values_from_jtl_file
+from os_perftest.jmeter_result_dumper import harvest_values_from_jtl_files
+from os_perftest.jmeter_result_dumper import add_to_index
+from os_perftest.jmeter_result_dumper import collect_and_append_jtl_results_to_dump_file
+from os_perftest.jmeter_result_dumper import is_success
+from os_perftest.jmeter_result_dumper import iterate_jtl_blocks
+from os_perftest.jmeter_result_dumper import iterate_jtl_samples
+from os_perftest.jmeter_result_dumper import label_plot_name
+from os_perftest.jmeter_result_dumper import make_performance_report
+from os_perftest.jmeter_result_dumper import merge_histograms
+
+
+def _block(successes):
+    size = len(successes)
+    return {'t': ['100'] * size, 'lt': ['90'] * size, 'ct': ['5'] * size, 's': list(successes),
+            'lb': ['search'] * size, 'ts': [str(1700000000000 + i) for i in range(size)],
+            'by': ['10'] * size, 'rc': ['200'] * size}
+
+
+def _write(tmp_dir, name, content):
+    path = os.path.join(tmp_dir, name)
+    with open(path, 'w') as fh:
+        fh.write(content)
+    return path
+
+
+class LabelPlotNameTest(unittest.TestCase):
+
+    def test_plain_label_is_kept(self):
+        self.assertEqual('search', label_plot_name('search'))
+        self.assertEqual('get-item_v1.2', label_plot_name('get-item_v1.2'))
+
+    def test_replaced_characters(self):
+        name = label_plot_name('get item/1')
+        self.assertTrue(name.startswith('get_item_1-'), name)
+        self.assertRegex(name, r'^[\w.-]+$')
+
+    def test_labels_with_the_same_sanitized_name_get_different_names(self):
+        labels = ['get item', 'get/item', 'get_item', 'get  item']
+        self.assertEqual(len(labels), len(set(label_plot_name(x) for x in labels)))
+
+
+class SuccessTest(unittest.TestCase):
+
+    def test_is_success(self):
+        self.assertTrue(is_success('true'))
+        self.assertTrue(is_success(None))
+        self.assertTrue(is_success(''))
+        self.assertFalse(is_success('false'))
+        self.assertFalse(is_success('FALSE'))
+
+    def test_labels_and_windows_count_the_same_errors(self):
+        aggregator = RunAggregator(window=10)
+        aggregator.add_block(_block(['true', 'false', None, '', 'false']))
+        result = aggregator.calculate([50])
+        label = result['labels']['search']
+        self.assertEqual(3, label['success'])
+        self.assertEqual(2, label['errors'])
+        self.assertEqual([100.0 * 2 / 5], result['windows']['error-rate'])
+
+
+class AddToIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index = os.path.join(self.tmp_dir, 'index.html')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _add(self, content):
+        with open(self.index, 'w') as fh:
+            fh.write(content)
+        add_to_index(self.index, '<p>link</p>\n')
+        with open(self.index) as fh:
+            return fh.read()
+
+    def test_html_document(self):
+        self.assertEqual('<html>\n<body>\n<p>plots</p>\n<p>link</p>\n</body>\n</html>\n',
+                         self._add('<html>\n<body>\n<p>plots</p>\n</body>\n</html>\n'))
+
+    def test_fragment(self):
+        self.assertEqual('<p>plots</p>\n<p>link</p>\n', self._add('<p>plots</p>\n'))
+
+
+class CsvJtlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _harvest(self, content):
+        return harvest_values_from_jtl_file(_write(self.tmp_dir, 'result.jtl', content), percentiles=[50])
+
+    def test_full_header(self):
+        values = self._harvest("timeStamp,elapsed,label,responseCode,success,bytes,Latency,Connect\n"
+                               "1700000000000,100,search,200,true,1000,90,5\n"
+                               "1700000001000,300,search,500,false,2000,250,7\n")
+        self.assertEqual(200.0, values['time']['mean'])
+        self.assertEqual(170.0, values['latency']['mean'])
+        search = values['labels']['search']
+        self.assertEqual((1, 1, 3000), (search['success'], search['errors'], search['bytes']))
+        self.assertEqual(6.0, search['connect']['mean'])
+
+    def test_reduced_header(self):
+        values = self._harvest("timeStamp,elapsed,label,success\n"
+                               "1700000000000,100,search,true\n"
+                               "1700000001000,300,search,false\n")
+        self.assertEqual(200.0, values['time']['mean'])
+        self.assertEqual(0, values['latency']['max'])
+        search = values['labels']['search']
+        self.assertEqual((1, 1, 0), (search['success'], search['errors'], search['bytes']))
+        self.assertNotIn('connect', search)
+        self.assertEqual([0.2], values['windows']['throughput'])
+
+    def test_default_columns_without_header(self):
+        values = self._harvest("1700000000000,100,search,200,OK,thread 1-1,text,true,,1000,300,1,1,"
+                               "http://localhost/search,90,0,5\n")
+        self.assertEqual(90, values['latency']['max'])
+        self.assertEqual(1000, values['labels']['search']['bytes'])
+
+    def test_truncated_last_row_is_skipped(self):
+        values = self._harvest("timeStamp,elapsed,label,success,Latency\n"
+                               "1700000000000,100,search,true,90\n"
+                               "1700000001000,300\n")
+        self.assertEqual(1, values['time']['samples'])
+
+    def test_no_elapsed_column(self):
+        self.assertRaises(ValueError, self._harvest, "timeStamp,label,success\n1700000000000,search,true\n")
+
+    def test_blocks(self):
+        rows = "".join("%s,%s,label-%s\n" % (1700000000000 + i, i, i) for i in range(7))
+        jtl_file = _write(self.tmp_dir, 'result.jtl', "timeStamp,elapsed,label\n" + rows + "1700000000007,7\n")
+        blocks = list(iterate_jtl_blocks(jtl_file, block_size=3))
+        self.assertEqual([3, 3, 1], [len(x['t']) for x in blocks])
+        self.assertEqual([str(i) for i in range(7)], [t for x in blocks for t in x['t']])
+        self.assertEqual(['label-%s' % i for i in range(7)], [lb for x in blocks for lb in x['lb']])
+        self.assertEqual([None] * 3, blocks[0]['lt'])
+
+
+XML_JTL = """<?xml version="1.0" encoding="UTF-8"?>
+<testResults version="1.2">
+<httpSample t="100" lt="90" ts="1700000000000" s="true" lb="search" rc="200" by="1000">
+  <httpSample t="40" lt="30" ts="1700000000010" s="true" lb="search-0" rc="200" by="400"/>
+  <httpSample t="50" lt="40" ts="1700000000050" s="false" lb="search-1" rc="404" by="600"/>
+  <assertionResult><name>code</name><failure>false</failure></assertionResult>
+</httpSample>
+<sample t="300" lt="0" ts="1700000001000" s="false" lb="transaction" rc="500" by="2000">
+  <httpSample t="300" lt="250" ts="1700000001000" s="false" lb="get item" rc="500" by="2000">
+    <sample t="10" lt="10" ts="1700000001000" s="true" lb="nested" rc="200" by="1"/>
+  </httpSample>
+</sample>
+<httpSample t="200" lt="150" ts="1700000002000" s="true" lb="suggest" rc="200" by="500"/>
+</testResults>
+"""
+
+
+class XmlJtlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.jtl_file = _write(self.tmp_dir, 'result.jtl', XML_JTL)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_top_level_samples(self):
+        samples = []
+        for node in iterate_jtl_samples(self.jtl_file):
+            # Earlier samples are cleared, and removed from the tree except for the last one
+            previous = node.getprevious()
+            if previous is not None:
+                self.assertEqual((0, {}), (len(previous), dict(previous.attrib)))
+                self.assertIsNone(previous.getprevious())
+            samples.append((node.tag, node.get('lb'), len(node)))
+        self.assertEqual([('httpSample', 'search', 3), ('sample', 'transaction', 1), ('httpSample', 'suggest', 0)],
+                         samples)
+
+    def test_sub_samples_are_not_counted(self):
+        blocks = list(iterate_jtl_blocks(self.jtl_file, block_size=2))
+        self.assertEqual([['search', 'transaction'], ['suggest']], [x['lb'] for x in blocks])
+        self.assertEqual([None, None], blocks[0]['ct'])
+
+        values = harvest_values_from_jtl_file(self.jtl_file, percentiles=[50])
+        self.assertEqual(3, values['time']['samples'])
+        self.assertEqual(['search', 'suggest', 'transaction'], sorted(values['labels']))
+        self.assertEqual((0, 1, 2000), tuple(values['labels']['transaction'][x] for x in ('success', 'errors', 'bytes')))
+
+
+class WindowAggregatorTest(unittest.TestCase):
+
+    def _windows(self, timestamps, successes=None):
+        block = _block(successes or ['true'] * len(timestamps))
+        block['ts'] = list(timestamps)
+        aggregator = RunAggregator(window=10)
+        aggregator.add_block(block)
+        return aggregator.calculate([50])
+
+    def test_samples_in_windows(self):
+        start = 1700000000000
+        values = self._windows([str(start + x) for x in (0, 9999, 10000, 35000)], ['true', 'false', 'true', 'true'])
+        windows = values['windows']
+        self.assertEqual((10, start // 1000), (windows['size'], windows['start']))
+        self.assertEqual([0.2, 0.1, 0.0, 0.1], windows['throughput'])
+        self.assertEqual([50.0, 0.0, 0.0, 0.0], windows['error-rate'])
+        self.assertEqual([100, 100, 0, 100], windows['time'][50])
+        self.assertEqual(0.1, values['throughput'])
+
+    def test_window_boundaries_are_aligned_to_the_epoch(self):
+        windows = self._windows(['1700000005000', '1700000014999', '1700000015000', '1700000020000'])['windows']
+        self.assertEqual(1700000000, windows['start'])
+        self.assertEqual([0.1, 0.2, 0.1], windows['throughput'])
+
+    def test_samples_without_millisecond_timestamps(self):
+        values = self._windows([None, '2024/01/01 10:00:00', '1700000000000'])
+        self.assertEqual(3, values['time']['samples'])
+        self.assertEqual([0.1], values['windows']['throughput'])
+
+        values = self._windows([None, '2024/01/01 10:00:00'])
+        self.assertEqual(2, values['time']['samples'])
+        self.assertNotIn('windows', values)
+        self.assertNotIn('throughput', values)
+
+    def test_merge_of_other_window_sizes(self):
+        self.assertRaises(ValueError, WindowAggregator(window=10).merge, WindowAggregator(window=60))
+
+    def test_add_many_is_add(self):
+        samples = [(0, 100, 90, True), (0, 100, 80, False), (1, 250, 200, True), (0, 120, 90, True)]
+        one_by_one = WindowAggregator(window=10)
+        for sample in samples:
+            one_by_one.add(*sample)
+        many = WindowAggregator(window=10)
+        many.add_many(samples)
+        self.assertEqual(one_by_one.calculate([50, 99]), many.calculate([50, 99]))
+
+
+class DumpFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_one_compact_run_per_line(self):
+        rows = "".join("%s,%s,search,true,%s\n" % (1700000000000 + i, 10 * i, 5 * i) for i in range(100))
+        jtl_file = _write(self.tmp_dir, 'result.jtl', "timeStamp,elapsed,label,success,Latency\n" + rows)
+        dump_file = os.path.join(self.tmp_dir, 'dump.json')
+        for _ in range(2):
+            collect_and_append_jtl_results_to_dump_file(dump_file, jtl_file, percentiles=[50])
+
+        with open(dump_file) as fh:
+            lines = fh.read().splitlines()
+        self.assertEqual(4, len(lines))
+        self.assertEqual(['[', ']'], [lines[0], lines[-1]])
+        with open(dump_file) as fh:
+            data = json.load(fh)
+        self.assertEqual(2, len(data))
+        self.assertEqual(100, data[-1]['time']['histogram']['count'])
+
+
+class MultiFileHarvestTest(unittest.TestCase):
+
+    HEADER = "timeStamp,elapsed,label,responseCode,success,bytes,Latency,Connect\n"
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rnd = random.Random(3)
+        self.jtl_files = []
+        rows = []
+        for generator in range(3):
+            generator_rows = []
+            for i in range(500):
+                timestamp = 1700000000000 + 97 * i + 31 * generator
+                elapsed = rnd.randint(1, 900)
+                generator_rows.append((timestamp, "%s,%s,%s,200,%s,%s,%s,%s\n" % (
+                    timestamp, elapsed, rnd.choice(['search', 'suggest']), 'true' if rnd.random() > 0.1 else 'false',
+                    rnd.randint(100, 5000), elapsed // 2, rnd.randint(0, 9))))
+            self.jtl_files.append(_write(self.tmp_dir, 'generator-%s.jtl' % generator,
+                                         self.HEADER + "".join(row for ts, row in generator_rows)))
+            rows.extend(generator_rows)
+        self.all_file = _write(self.tmp_dir, 'all.jtl', self.HEADER + "".join(row for ts, row in sorted(rows)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assertValuesEqual(self, expected, actual, path=''):
+        if isinstance(expected, dict):
+            self.assertEqual(sorted(expected), sorted(actual), path)
+            for key in expected:
+                self.assertValuesEqual(expected[key], actual[key], '%s/%s' % (path, key))
+        elif isinstance(expected, list):
+            self.assertEqual(len(expected), len(actual), path)
+            for i, (x, y) in enumerate(zip(expected, actual)):
+                self.assertValuesEqual(x, y, '%s[%s]' % (path, i))
+        elif isinstance(expected, float):
+            self.assertAlmostEqual(expected, actual, places=6, msg=path)
+        else:
+            self.assertEqual(expected, actual, path)
+
+    def test_merged_files_are_the_combined_file(self):
+        merged = harvest_values_from_jtl_files(self.jtl_files, percentiles=[50, 99], workers=2)
+        generators = merged.pop('generators')
+        self.assertValuesEqual(harvest_values_from_jtl_file(self.all_file, percentiles=[50, 99]), merged)
+        self.assertEqual(1500, merged['time']['histogram']['count'])
+
+        self.assertEqual(self.jtl_files, sorted(generators))
+        for jtl_file in self.jtl_files:
+            values = harvest_values_from_jtl_file(jtl_file, percentiles=[50, 99])
+            self.assertEqual({'time': values['time'], 'latency': values['latency']}, generators[jtl_file])
+
+    def test_merged_histograms_of_runs(self):
+        dump_file = os.path.join(self.tmp_dir, 'dump.json')
+        for jtl_file in self.jtl_files:
+            collect_and_append_jtl_results_to_dump_file(dump_file, jtl_file, percentiles=[50])
+        combined = harvest_values_from_jtl_file(self.all_file, percentiles=[50])
+        self.assertEqual(combined['time']['histogram'], merge_histograms(dump_file, 'time').to_dict())
+        self.assertEqual(1000, merge_histograms(dump_file, 'latency', runs=2).count)
+
+
+class WindowReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        rows = "".join("%s,%s,search,%s,%s\n" % (1700000000000 + 1000 * i, 100 + i, 'true' if i % 5 else 'false', 90 + i)
+                       for i in range(60))
+        self.jtl_file = _write(self.tmp_dir, 'result.jtl', "timeStamp,elapsed,label,success,Latency\n" + rows)
+        self.dump_file = os.path.join(self.tmp_dir, 'dump.json')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_latest_run_report(self):
+        collect_and_append_jtl_results_to_dump_file(self.dump_file, self.jtl_file, percentiles=[50, 99])
+        make_performance_report(self.dump_file, thumbnails=False)
+
+        latest_run = os.path.join('performance-report', 'latest-run')
+        self.assertEqual(['Error-rate.html', 'Error-rate.png', 'Latency.html', 'Latency.png', 'Throughput.html',
+                          'Throughput.png', 'Time.html', 'Time.png', 'index.html', 'main-small.png', 'main.png'],
+                         sorted(os.listdir(latest_run)))
+        with open(os.path.join('performance-report', 'index.html')) as fh:
+            self.assertIn('<a href="latest-run/index.html">', fh.read())
+
+    def test_html_report(self):
+        collect_and_append_jtl_results_to_dump_file(self.dump_file, self.jtl_file, percentiles=[50, 99])
+        make_performance_report(self.dump_file, backend='html')
+
+        with open(os.path.join('performance-report', 'latest-run', 'data.js')) as fh:
+            graphs = json.loads(fh.read()[len('var REPORT_DATA = '):-2])
+        self.assertEqual(['Throughput', 'Error-rate', 'Time', 'Latency'], [x['name'] for x in graphs])
+        self.assertEqual([1.0] * 6, graphs[0]['lines'][0]['values'])
+        self.assertEqual([20.0] * 6, graphs[1]['lines'][0]['values'])
+        with open(os.path.join('performance-report', 'index.html')) as fh:
+            self.assertTrue(fh.read().endswith('<p><a href="latest-run/index.html">The latest run over time</a></p>\n'
+                                               '</body>\n</html>\n'))
+
+    def test_runs_without_windows(self):
+        collect_and_append_jtl_results_to_dump_file(self.dump_file, self.jtl_file, percentiles=[50, 99])
+        with open(self.dump_file) as fh:
+            data = json.load(fh)
+        del data[-1]['windows']
+        with open(self.dump_file, 'w') as fh:
+            json.dump(data, fh)
+        make_performance_report(self.dump_file, thumbnails=False)
+        self.assertFalse(os.path.exists(os.path.join('performance-report', 'latest-run')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+from os_perftest.performance_assertion_suite import AssertionConfigError
+from os_perftest.performance_assertion_suite import evaluate_assertion
+from os_perftest.performance_assertion_suite import run_assertions
+from os_perftest.performance_assertion_suite import validate_assertion
+from os_perftest.performance_store import DumpStore
+
+CONFIG = """[main]
+datafile = %s
+
+[no-errors]
+jolokiaurl = metrics
+mbean = "name=errors,type=counters"
+path = /value/Count
+operator = ==
+value = 0
+
+[request-rate]
+type = rate
+jolokiaurl = metrics
+mbean = "name=requests,type=meters"
+path = /value/Count
+sample = all
+min = 10
+"""
+
+
+def _dump(requests, errors, step=10):
+    """ Entries with the cumulative counters requests and errors, a sample every step seconds """
+    return [{'metrics': {'name=requests,type=meters': {'timestamp': 1000 + i * step, 'value': {'Count': r}},
+                         'name=errors,type=counters': {'timestamp': 1000 + i * step, 'value': {'Count': e}}}}
+            for i, (r, e) in enumerate(zip(requests, errors))]
+
+
+def _assertion(**options):
+    options.setdefault('jolokiaurl', 'metrics')
+    options.setdefault('mbean', 'name=requests,type=meters')
+    options.setdefault('path', '/value/Count')
+    return validate_assertion('test', options)
+
+
+class ValidateAssertionTest(unittest.TestCase):
+
+    def test_defaults(self):
+        assertion = _assertion(max='5')
+        self.assertEqual('value', assertion['type'])
+        self.assertEqual('last', assertion['sample'])
+        self.assertEqual(5.0, assertion['max'])
+        self.assertEqual('/timestamp', assertion['timestampPath'])
+
+    def test_unquoted_mbean_is_joined(self):
+        self.assertEqual('name=requests,type=meters', _assertion(mbean=['name=requests', 'type=meters'], max=1)['mbean'])
+
+    def test_invalid_assertions(self):
+        self.assertRaises(AssertionConfigError, _assertion)
+        self.assertRaises(AssertionConfigError, _assertion, type='median', max=1)
+        self.assertRaises(AssertionConfigError, _assertion, sample='p99', max=1)
+        self.assertRaises(AssertionConfigError, _assertion, operator='=~', value=1)
+        self.assertRaises(AssertionConfigError, _assertion, operator='<')
+        self.assertRaises(AssertionConfigError, _assertion, max='many')
+        self.assertRaises(AssertionConfigError, _assertion, type='counter-ratio', max=1)
+        self.assertRaises(AssertionConfigError, validate_assertion, 'test', {'jolokiaurl': 'metrics', 'path': '/x', 'max': 1})
+
+
+class EvaluateAssertionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = DumpStore(_dump([0, 100, 300, 400], [0, 1, 2, 2]))
+
+    def test_sample_reductions(self):
+        for sample, expected in (('last', 400), ('first', 0), ('min', 0), ('max', 400), ('mean', 200)):
+            result = evaluate_assertion(self.store, _assertion(sample=sample, min=0))
+            self.assertEqual(expected, result['value'], sample)
+
+    def test_operator_and_bounds(self):
+        self.assertEqual('passed', evaluate_assertion(self.store, _assertion(operator='>=', value=400))['status'])
+        result = evaluate_assertion(self.store, _assertion(operator='<', value=400))
+        self.assertEqual('failed', result['status'])
+        self.assertEqual('400 is not < 400.0', result['message'])
+        self.assertEqual('failed', evaluate_assertion(self.store, _assertion(max=399))['status'])
+
+    def test_rate_of_a_counter(self):
+        result = evaluate_assertion(self.store, _assertion(type='rate', sample='all', min=10))
+        self.assertEqual([10.0, 20.0, 10.0], result['value'])
+        self.assertEqual('passed', result['status'])
+
+    def test_rate_of_a_gauge(self):
+        store = DumpStore(_dump([400, 300, 300, 100], [0, 0, 0, 0]))
+        result = evaluate_assertion(store, _assertion(type='gauge-rate', sample='all', max=0))
+        self.assertEqual([-10.0, 0.0, -20.0], result['value'])
+        self.assertEqual('passed', result['status'])
+        self.assertEqual([30.0, 0.0, 10.0], evaluate_assertion(store, _assertion(type='rate', sample='all', min=0))['value'])
+
+    def test_counter_ratio(self):
+        assertion = _assertion(type='counter-ratio', mbean='name=errors,type=counters',
+                               otherMbean='name=requests,type=meters', otherPath='/value/Count', sample='all', max=0.01)
+        result = evaluate_assertion(self.store, assertion)
+        self.assertEqual([0.01, 0.005, 0.0], result['value'])
+        self.assertEqual('passed', result['status'])
+
+    def test_ratio_skips_zero_denominators(self):
+        assertion = validate_assertion('test', {
+            'type': 'ratio', 'sample': 'all', 'max': 1,
+            'numerator': {'jolokiaurl': 'metrics', 'mbean': 'name=errors,type=counters', 'path': '/value/Count'},
+            'denominator': {'jolokiaurl': 'metrics', 'mbean': 'name=requests,type=meters', 'path': '/value/Count'}})
+        self.assertEqual([0.01, 2 / 300.0, 0.005], evaluate_assertion(self.store, assertion)['value'])
+
+    def test_missing_data_is_an_error(self):
+        result = evaluate_assertion(self.store, _assertion(jolokiaurl='nohost', max=1))
+        self.assertEqual('error', result['status'])
+        result = evaluate_assertion(self.store, _assertion(path='/value/Mean', max=1))
+        self.assertEqual('error', result['status'])
+
+
+class RunAssertionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _run(self, requests, errors):
+        dump_file = os.path.join(self.tmp_dir, 'dump.json')
+        with open(dump_file, 'w') as fh:
+            for entry in _dump(requests, errors):
+                fh.write(json.dumps(entry) + '\n')
+        config_file = os.path.join(self.tmp_dir, 'assertions.ini')
+        with open(config_file, 'w') as fh:
+            fh.write(CONFIG % dump_file)
+        junit_file = os.path.join(self.tmp_dir, 'assertions.xml')
+        json_file = os.path.join(self.tmp_dir, 'assertions.json')
+        passed = run_assertions(config_file, junit_file, json_file)
+        with open(json_file) as fh:
+            report = json.load(fh)
+        return passed, ElementTree.parse(junit_file).getroot(), report
+
+    def test_passing_run(self):
+        passed, suite, report = self._run([0, 100, 300], [0, 0, 0])
+        self.assertTrue(passed)
+        self.assertTrue(report['passed'])
+        self.assertEqual(('2', '0', '0'), (suite.get('tests'), suite.get('failures'), suite.get('errors')))
+
+    def test_failing_run(self):
+        passed, suite, report = self._run([0, 50, 300], [0, 1, 1])
+        self.assertFalse(passed)
+        self.assertFalse(report['passed'])
+        self.assertEqual('2', suite.get('failures'))
+        self.assertEqual(['failed', 'failed'], [x['status'] for x in report['assertions']])
+        self.assertEqual(2, len(suite.findall('testcase/failure')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import unittest
+
+import os_perftest.performance_derive as derive
+
+
+class CounterDeltasTest(unittest.TestCase):
+
+    def test_increases(self):
+        self.assertEqual([None, 10, 0, 5], derive.counter_deltas([0, 10, 10, 15]))
+
+    def test_reset_counts_from_zero(self):
+        self.assertEqual([None, 10, 3, 2], derive.counter_deltas([10, 20, 3, 5]))
+        self.assertEqual([2], derive.counter_resets([10, 20, 3, 5]))
+
+    def test_missing_samples_are_not_resets(self):
+        self.assertEqual([None, None, None, 10], derive.counter_deltas([10, None, 20, 30]))
+        self.assertEqual([], derive.counter_resets([10, None, 20, 30]))
+        self.assertEqual([], derive.counter_resets([10, True, 20]))
+
+
+class CounterRatesTest(unittest.TestCase):
+
+    def test_rates_per_second(self):
+        self.assertEqual([None, 1.0, 2.5], derive.counter_rates([0, 10, 20], [0, 10, 35]))
+
+    def test_interval_without_time(self):
+        self.assertEqual([None, None, 1.0], derive.counter_rates([0, 0, 10], [0, 10, 20]))
+
+    def test_missing_timestamp(self):
+        self.assertEqual([None, None, None], derive.counter_rates([0, None, 20], [0, 10, 20]))
+
+
+class GaugeRatesTest(unittest.TestCase):
+
+    def test_decrease_is_not_a_reset(self):
+        self.assertEqual([None, 10, -15, 5], derive.gauge_deltas([10, 20, 5, 10]))
+        self.assertEqual([None, 1.0, -1.5], derive.gauge_rates([0, 10, 20], [10, 20, 5]))
+
+    def test_missing_samples(self):
+        self.assertEqual([None, None, None, 1.0], derive.gauge_rates([0, 10, 10, 20], [10, None, 20, 30]))
+
+
+class CounterRatioTest(unittest.TestCase):
+
+    def test_error_ratio(self):
+        self.assertEqual([None, 0.1, None, 0.0], derive.counter_ratio([0, 1, 1, 1], [0, 10, 10, 20]))
+
+    def test_hit_rate(self):
+        self.assertEqual([None, 0.75, None, 0.0], derive.hit_rate([0, 3, 3, 3], [0, 1, 1, 5]))
+
+    def test_reset_of_the_counters(self):
+        self.assertEqual([None, 0.5, 0.4], derive.counter_ratio([0, 5, 2], [0, 10, 5]))
+
+
+class DeriveTest(unittest.TestCase):
+
+    def test_derivations(self):
+        self.assertEqual([None, 1.0], derive.derive('rate', [0, 10], [0, 10]))
+        self.assertEqual([None, 1.0], derive.derive('rate', [0, 10], [20, 10]))
+        self.assertEqual([None, -1.0], derive.derive('gauge-rate', [0, 10], [20, 10]))
+        self.assertEqual([None, 0.5], derive.derive('counter-ratio', [0, 10], [0, 5], [0, 10]))
+        self.assertEqual([None, 0.5], derive.derive('hit-rate', [0, 10], [0, 5], [0, 5]))
+
+    def test_invalid_derivations(self):
+        self.assertRaises(ValueError, derive.derive, 'median', [0, 10], [0, 10])
+        self.assertRaises(ValueError, derive.derive, 'counter-ratio', [0, 10], [0, 10])
+
+    def test_fill_missing(self):
+        self.assertEqual([0, 1.5, 0], derive.fill_missing([None, 1.5, None]))
+
+
+if __name__ == '__main__':
+    unittest.main()
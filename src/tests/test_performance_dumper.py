@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import gzip
+import http.client
+import http.server
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import os_perftest.performance_dumper as performance_dumper
+from os_perftest.performance_dumper import ConnectionPool
+from os_perftest.performance_dumper import JolokiaConnector
+from os_perftest.performance_dumper import MBeanDumper
+from os_perftest.performance_dumper import get_connection_pool
+from os_perftest.performance_dumper import sample_skew
+
+URL = 'http://localhost:8778/jolokia'
+DOMAIN = 'metrics'
+
+
+class StubJolokiaPool(object):
+    """ Connection pool answering as a jolokia service exposing mbeans (key -> value) in DOMAIN
+
+    If bulk is False, POST requests are refused as by a jolokia policy.
+    """
+
+    def __init__(self, mbeans, bulk=True, listed=()):
+        self.mbeans = mbeans
+        self.bulk = bulk
+        self.listed = list(mbeans) + list(listed)
+        self.requests = []
+
+    def request(self, method, path, body=None, headers=None, timeout=None):
+        self.requests.append((method, path))
+        if path == '/jolokia/list':
+            response = {'value': {DOMAIN: dict((key, {}) for key in self.listed)}, 'status': 200}
+        elif method == 'POST':
+            if self.bulk:
+                response = [self._read(operation['mbean']) for operation in json.loads(body.decode('utf-8'))]
+            else:
+                response = {'error_type': 'java.lang.Exception', 'error': 'HTTP method POST is not allowed', 'status': 403}
+        else:
+            response = self._read(path[len('/jolokia/read/'):].split('?')[0])
+        return json.dumps(response).encode('utf-8')
+
+    def _read(self, mbean):
+        key = mbean.split(':', 1)[1]
+        if key not in self.mbeans:
+            return {'request': {'mbean': mbean, 'type': 'read'}, 'status': 404,
+                    'error_type': 'javax.management.InstanceNotFoundException', 'error': mbean}
+        return {'request': {'mbean': mbean, 'type': 'read'}, 'value': self.mbeans[key], 'timestamp': 1000, 'status': 200}
+
+
+def _mbeans(count):
+    return dict(('name=requests%s,type=meters' % i, {'Count': i}) for i in range(count))
+
+
+class BulkReadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dump_file = os.path.join(self.tmp_dir, 'mbeans.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _dump(self, pool, bulk=True):
+        with mock.patch.object(performance_dumper, 'get_connection_pool', return_value=pool):
+            return MBeanDumper(self.dump_file, bulk=bulk)._dump_mBeans((URL, DOMAIN))
+
+    def test_one_post_for_all_mbeans(self):
+        pool = StubJolokiaPool(_mbeans(50))
+        entry = self._dump(pool)
+        self.assertEqual([('GET', '/jolokia/list'), ('POST', '/jolokia/?ignoreErrors=true')], pool.requests)
+        self.assertEqual(sorted(_mbeans(50)), sorted(entry[DOMAIN]))
+        self.assertEqual({'Count': 7}, entry[DOMAIN]['name=requests7,type=meters']['value'])
+
+    def test_same_entry_as_single_reads(self):
+        bulk_entry = self._dump(StubJolokiaPool(_mbeans(5)))
+        pool = StubJolokiaPool(_mbeans(5))
+        single_entry = self._dump(pool, bulk=False)
+        self.assertEqual(6, len(pool.requests))
+        self.assertEqual(bulk_entry[DOMAIN], single_entry[DOMAIN])
+
+    def test_error_status_of_a_single_mbean(self):
+        pool = StubJolokiaPool(_mbeans(3), listed=['name=gone,type=meters'])
+        connector = JolokiaConnector(URL)
+        connector.pool = pool
+        responses = connector.bulk_read([DOMAIN + ':' + key for key in pool.listed])
+        self.assertEqual([200, 200, 200, 404], [x['status'] for x in responses])
+        self.assertEqual(1, len(pool.requests))
+
+    def test_fallback_to_single_reads(self):
+        pool = StubJolokiaPool(_mbeans(3), bulk=False)
+        entry = self._dump(pool)
+        self.assertEqual(['GET', 'POST', 'GET', 'GET', 'GET'], [x[0] for x in pool.requests])
+        self.assertEqual(self._dump(StubJolokiaPool(_mbeans(3)))[DOMAIN], entry[DOMAIN])
+
+    def test_no_mbeans(self):
+        connector = JolokiaConnector(URL)
+        connector.pool = StubJolokiaPool({})
+        self.assertEqual([], connector.bulk_read([]))
+        self.assertEqual([], connector.pool.requests)
+
+
+class StubHttpHandler(http.server.BaseHTTPRequestHandler):
+    """ Answers each request with the next of the (status, gzipped, close) responses of the server
+
+    If close is True, the connection is closed after the response without
+    telling the client, as a keep-alive timeout of the server does.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        http.server.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        status, gzipped, close = self.server.responses.pop(0) if self.server.responses else (200, False, False)
+        body = json.dumps({'value': len(self.server.paths), 'status': 200}).encode('utf-8')
+        self.send_response(status)
+        if gzipped:
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if close:
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHttpHandler)
+        self.server.connections = 0
+        self.server.paths = []
+        self.server.responses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.pool = ConnectionPool('http', '127.0.0.1', self.server.server_address[1], size=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        for i in range(3):
+            self.assertEqual(i + 1, json.loads(self.pool.request('GET', '/jolokia/version'))['value'])
+        self.assertEqual(1, self.server.connections)
+
+    def test_reconnect_of_a_stale_connection(self):
+        self.server.responses = [(200, False, True)]
+        self.pool.request('GET', '/jolokia/version')
+        self.assertEqual(2, json.loads(self.pool.request('GET', '/jolokia/version'))['value'])
+        self.assertEqual(2, self.server.connections)
+
+    def test_gzip_decoding(self):
+        self.server.responses = [(200, True, False)]
+        self.assertEqual({'value': 1, 'status': 200}, json.loads(self.pool.request('GET', '/jolokia/version')))
+
+    def test_error_status(self):
+        self.server.responses = [(404, False, False)]
+        with self.assertRaises(http.client.HTTPException) as context:
+            self.pool.request('GET', '/jolokia/version')
+        self.assertEqual(404, context.exception.status)
+        # The connection is still usable
+        self.pool.request('GET', '/jolokia/version')
+        self.assertEqual(1, self.server.connections)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.responses = [(404, False, False)]
+        connector = JolokiaConnector('http://127.0.0.1:%s/jolokia' % self.server.server_address[1])
+        connector.pool = self.pool
+        self.assertRaises(http.client.HTTPException, connector.read, 'metrics:name=requests')
+        self.assertEqual(1, len(self.server.paths))
+
+    def test_server_errors_are_retried(self):
+        self.server.responses = [(503, False, False)]
+        connector = JolokiaConnector('http://127.0.0.1:%s/jolokia' % self.server.server_address[1])
+        connector.pool = self.pool
+        self.assertEqual(2, connector.read('metrics:name=requests')['value'])
+
+    def test_pool_per_host_and_port(self):
+        pool = get_connection_pool('http://pool-test:8080/jolokia')
+        self.assertIs(pool, get_connection_pool('http://pool-test:8080/other'))
+        self.assertIsNot(pool, get_connection_pool('http://pool-test:8081/jolokia'))
+        self.assertEqual(443, get_connection_pool('https://pool-test/jolokia').port)
+
+
+class DelayedConnector(object):
+    """ Connector to a service answering after the delay (in seconds) given for its url
+    """
+    delays = {}
+
+    def __init__(self, url, pool_size=4, timeout=10):
+        self.url = url
+
+    def list(self):
+        time.sleep(self.delays[self.url])
+        return {'value': {'metrics': {'name=requests,type=meters': {}}}, 'status': 200}
+
+    def bulk_read(self, mBeans):
+        return [{'value': {'url': self.url}, 'status': 200} for mBean in mBeans]
+
+
+class ConcurrentSamplingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pairs = [('http://service%s/jolokia' % i, 'metrics') for i in range(4)]
+        DelayedConnector.delays = dict((url, delay) for (url, domain), delay in zip(self.pairs, [0.3, 0.1, 0.2, 0.0]))
+
+    def _dump(self, concurrency):
+        with mock.patch.object(performance_dumper, 'JolokiaConnector', DelayedConnector):
+            return MBeanDumper('mbeans.json', concurrency=concurrency)._dump_mBeans(*self.pairs)
+
+    def test_samples_keep_the_order_of_the_pairs(self):
+        entry = self._dump(4)
+        self.assertEqual([url for url, domain in self.pairs], [x['url'] for x in entry['sampling']])
+        for sample in entry['sampling']:
+            self.assertGreaterEqual(sample['end'] - sample['start'], DelayedConnector.delays[sample['url']])
+
+    def test_services_are_sampled_at_the_same_time(self):
+        entry = self._dump(4)
+        self.assertLess(sample_skew(entry), 0.1)
+        self.assertLess(max(x['end'] for x in entry['sampling']) - min(x['start'] for x in entry['sampling']), 0.5)
+
+    def test_concurrency_limit(self):
+        entry = self._dump(1)
+        starts = [x['start'] for x in entry['sampling']]
+        self.assertEqual(sorted(starts), starts)
+        self.assertGreaterEqual(sample_skew(entry), 0.6)
+
+    def test_same_domain_of_several_services(self):
+        entry = self._dump(2)
+        # The mBeans of the last service in a domain are kept
+        self.assertEqual({'url': self.pairs[-1][0]}, entry['metrics']['name=requests,type=meters']['value'])
+
+    def test_skew_of_an_entry_without_sampling(self):
+        self.assertEqual(0.0, sample_skew({'metrics': {}}))
+
+
+class CountingDumper(MBeanDumper):
+    """ Dumper sampling a counter, which is increased by each dump
+    """
+
+    def __init__(self, dump_file):
+        MBeanDumper.__init__(self, dump_file)
+        self.samples = 0
+
+    def _dump_mBeans(self, *mBean_pair):
+        self.samples += 1
+        return {'metrics': {'name=requests': {'value': {'Count': self.samples}}}}
+
+
+class DumpFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dump_file = os.path.join(self.tmp_dir, 'mbeans.json')
+        self.dumper = CountingDumper(self.dump_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _dump(self, times, **kwargs):
+        for _ in range(times):
+            self.dumper.dump((URL, DOMAIN), **kwargs)
+
+    def _counts(self):
+        return [x['metrics']['name=requests']['value']['Count'] for x in self.dumper.read_dump()]
+
+    def _lines(self):
+        with open(self.dump_file) as fh:
+            return fh.read().split('\n')
+
+    def test_entries_are_appended_as_lines(self):
+        self._dump(3)
+        self.assertEqual([1, 2, 3], self._counts())
+        lines = self._lines()
+        self.assertEqual('', lines.pop())
+        self.assertEqual([1, 2, 3], [json.loads(x)['metrics']['name=requests']['value']['Count'] for x in lines])
+
+    def test_conversion_of_a_json_array_dump(self):
+        with open(self.dump_file, 'w') as fh:
+            json.dump([{'metrics': {'name=requests': {'value': {'Count': -i}}}} for i in range(5, 0, -1)], fh, indent=4)
+        self.dumper.samples = 0
+        self._dump(1, count=3)
+        self.assertEqual([-3, -2, -1, 1], self._counts())
+        self.assertEqual(5, len(self._lines()))
+
+        self._dump(2, count=3)
+        self.assertEqual([-3, -2, -1, 1, 2, 3], self._counts())
+
+    def test_compaction(self):
+        # Compacted to count + 1 entries once the file holds count + 1 + compact_every entries
+        self._dump(9, count=5, compact_every=3)
+        self.assertEqual(list(range(1, 10)), self._counts())
+        self._dump(1, count=5, compact_every=3)
+        self.assertEqual(list(range(5, 11)), self._counts())
+        self._dump(3, count=5, compact_every=3)
+        self.assertEqual(list(range(5, 14)), self._counts())
+        self._dump(1, count=5, compact_every=3)
+        self.assertEqual(list(range(9, 15)), self._counts())
+
+    def test_torn_last_line_is_skipped(self):
+        self._dump(2)
+        with open(self.dump_file, 'a') as fh:
+            fh.write('{"metrics": {"name=requ')
+        self._dump(1)
+        self.assertEqual([1, 2, 3], self._counts())
+        self.assertEqual(5, len(self._lines()))
+
+    def test_external_truncation(self):
+        self._dump(9, count=5, compact_every=3)
+        open(self.dump_file, 'w').close()
+        # The next compaction recounts the entries in the file
+        self._dump(1, count=5, compact_every=3)
+        self.assertEqual([10], self._counts())
+        self._dump(8, count=5, compact_every=3)
+        self.assertEqual(list(range(10, 19)), self._counts())
+        self._dump(1, count=5, compact_every=3)
+        self.assertEqual(list(range(14, 20)), self._counts())
+
+
+if __name__ == '__main__':
+    unittest.main()
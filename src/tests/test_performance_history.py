@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from os_perftest.performance_history import DAY
+from os_perftest.performance_history import HistoryStore
+from os_perftest.performance_history import jtl_run_name
+from os_perftest.performance_history import record_mbean_entry
+
+SERVICE = 'metrics'
+MBEAN = 'name=requests,type=meters'
+
+# Midnight (UTC) 100 days after the epoch
+START = 100 * DAY
+
+
+def _entry(timestamp, count, phase=None, heap=None):
+    entry = {SERVICE: {MBEAN: {'timestamp': timestamp, 'value': {'Count': count, 'RateUnit': 'events/second'}}}}
+    if heap is not None:
+        entry['java.lang'] = {'type=Memory': {'timestamp': timestamp, 'value': {'HeapMemoryUsage': {'used': heap}}}}
+    if phase is not None:
+        entry['phase'] = phase
+    return entry
+
+
+class HistoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.tmp_dir, 'history.db')
+        self.store = HistoryStore(self.db_file)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_dump(self, entries):
+        dump_file = os.path.join(self.tmp_dir, 'mbeans.json')
+        with open(dump_file, 'w') as fh:
+            for entry in entries:
+                fh.write(json.dumps(entry) + '\n')
+        return dump_file
+
+    def test_numeric_values_are_stored(self):
+        added = self.store.add_mbean_entries([_entry(START, 10, heap=512), _entry(START + 60, 20, heap=600)], 'run')
+        self.assertEqual(4, added)
+        self.assertEqual([(START, 10), (START + 60, 20)], self.store.samples(SERVICE, MBEAN, 'Count'))
+        self.assertEqual([('java.lang', 'type=Memory', 'HeapMemoryUsage/used'), (SERVICE, MBEAN, 'Count')],
+                         self.store.series())
+
+    def test_trimmed_entries_are_left_out(self):
+        self.store.add_mbean_entries([_entry(START, 10, phase='warm-up'), _entry(START + 60, 20, phase='steady')], 'run')
+        self.assertEqual([(START + 60, 20)], self.store.samples(SERVICE, MBEAN, 'Count'))
+
+    def test_values_without_timestamp_are_left_out(self):
+        entry = _entry(START, 10)
+        del entry[SERVICE][MBEAN]['timestamp']
+        self.assertEqual(1, self.store.add_mbean_entries([entry, _entry(START + 60, 20)], 'run'))
+        self.assertEqual([(START + 60, 20)], self.store.samples(SERVICE, MBEAN, 'Count'))
+
+    def test_reimport_of_a_dump(self):
+        entries = [_entry(START + 60 * i, 10 * i) for i in range(3)]
+        self.assertEqual(3, self.store.import_mbean_dump(self._write_dump(entries), run='run'))
+        self.assertEqual(0, self.store.import_mbean_dump(self._write_dump(entries), run='run'))
+
+        entries.append(_entry(START + 180, 30))
+        self.assertEqual(1, self.store.import_mbean_dump(self._write_dump(entries[1:]), run='run'))
+        self.assertEqual(4, len(self.store.samples(SERVICE, MBEAN, 'Count')))
+
+    def test_reimport_of_a_dump_without_timestamps(self):
+        entries = [_entry(START, 10), _entry(START + 60, 20)]
+        del entries[0][SERVICE][MBEAN]['timestamp']
+        self.store.import_mbean_dump(self._write_dump(entries), run='run')
+        self.assertEqual(0, self.store.import_mbean_dump(self._write_dump(entries), run='run'))
+        self.assertEqual(1, len(self.store.samples(SERVICE, MBEAN, 'Count')))
+
+    def test_reimport_of_a_jtl_dump(self):
+        runs = [{'time': {'mean': 100.0 + i}, 'throughput': 50.0, 'labels': {'search': {'time': {'mean': 90.0}}}}
+                for i in range(3)]
+        dump_file = os.path.join(self.tmp_dir, 'jtl.json')
+        with open(dump_file, 'w') as fh:
+            json.dump(runs, fh)
+        self.assertEqual(3, self.store.import_jtl_dump(dump_file))
+        self.assertEqual(0, self.store.import_jtl_dump(dump_file))
+        self.assertEqual([jtl_run_name(x) for x in runs], [x['name'] for x in self.store.runs(kind='jtl')])
+        self.assertEqual(3, len(self.store.samples('jmeter', 'search', 'time/mean')))
+
+    def test_roll_up(self):
+        # Two runs on the first day, and one on each of the next two days
+        for run, offset in (('a', 0), ('b', 3600), ('c', DAY), ('d', 2 * DAY)):
+            self.store.add_mbean_entries([_entry(START + offset, 10), _entry(START + offset + 60, 30)], run)
+
+        self.assertEqual(2, self.store.apply_retention(raw_runs=2, raw_days=None, now=START + 3 * DAY))
+        self.assertEqual(['daily', 'daily', 'raw', 'raw'], [x['tier'] for x in self.store.runs()])
+        self.assertEqual([{'day': START, 'count': 4, 'mean': 20.0, 'min': 10, 'max': 30, 'last': 30}],
+                         self.store.daily(SERVICE, MBEAN, 'Count'))
+        self.assertEqual(4, len(self.store.samples(SERVICE, MBEAN, 'Count')))
+        self.assertEqual([(START, 20.0), (START + DAY, 10), (START + DAY + 60, 30)],
+                         self.store.history(SERVICE, MBEAN, 'Count')[:3])
+
+        # Rolled up runs are not rolled up again
+        self.assertEqual(0, self.store.apply_retention(raw_runs=2, raw_days=None, now=START + 3 * DAY))
+        self.assertEqual(4, self.store.daily(SERVICE, MBEAN, 'Count')[0]['count'])
+
+    def test_daily_since_and_until_are_days(self):
+        for run, offset in (('a', 0), ('b', DAY), ('c', 2 * DAY)):
+            self.store.add_mbean_entries([_entry(START + offset, 10)], run)
+        self.store.apply_retention(raw_runs=0, raw_days=None, now=START + 3 * DAY)
+        days = self.store.daily(SERVICE, MBEAN, 'Count', since=START + 3600, until=START + 2 * DAY + 3600)
+        self.assertEqual([START, START + DAY], [x['day'] for x in days])
+
+    def test_raw_days(self):
+        self.store.add_mbean_entries([_entry(START, 10)], 'old')
+        self.store.add_mbean_entries([_entry(START + 40 * DAY, 10)], 'new')
+        self.assertEqual(1, self.store.apply_retention(raw_days=30, now=START + 41 * DAY))
+        self.assertEqual(['daily', 'raw'], [x['tier'] for x in self.store.runs()])
+
+    def test_record_mbean_entry_does_not_roll_up(self):
+        self.store.add_mbean_entries([_entry(START, 10)], 'old')
+        record_mbean_entry(self.db_file, _entry(START + 400 * DAY, 20), 'new')
+        self.assertEqual(['raw', 'raw'], [x['tier'] for x in self.store.runs()])
+        self.assertEqual(2, len(self.store.samples(SERVICE, MBEAN, 'Count')))
+
+
+if __name__ == '__main__':
+    unittest.main()
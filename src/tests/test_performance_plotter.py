@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import math
+import unittest
+
+import os_perftest.performance_plotter as performance_plotter
+
+MBEAN = 'metrics:name=requests,type=timers'
+
+
+def _entry(timestamp, **value):
+    return {'metrics': {'name=requests,type=timers': {'timestamp': timestamp, 'value': value,
+                                                      'request': {'type': 'read', 'mbean': MBEAN}}}}
+
+
+def _flatten(*entries):
+    mbeans = {}
+    performance_plotter._fetch_mbeans_from_dump(list(entries), mbeans)
+    return mbeans[MBEAN]
+
+
+def _values(mbean, attribute):
+    return ['missing' if math.isnan(x) else x for x in mbean['value'][attribute]]
+
+
+class FetchMBeansFromDumpTest(unittest.TestCase):
+
+    def test_values_of_each_sample(self):
+        mbean = _flatten(_entry(10, Count=5, Mean=1.5), _entry(20, Count=6, Mean=2.5))
+        self.assertEqual([10, 20], mbean['timestamp'])
+        self.assertEqual([5, 6], list(mbean['value']['Count']))
+        self.assertEqual([1.5, 2.5], list(mbean['value']['Mean']))
+
+    def test_attribute_missing_in_the_middle(self):
+        mbean = _flatten(_entry(10, Count=5, Mean=1.0), _entry(20, Mean=2.0), _entry(30, Count=7, Mean=3.0))
+        self.assertEqual([5, 'missing', 7], _values(mbean, 'Count'))
+
+    def test_attribute_appearing_late(self):
+        mbean = _flatten(_entry(10, Mean=1.0), _entry(20, Mean=2.0), _entry(30, Count=7, Mean=3.0))
+        self.assertEqual(['missing', 'missing', 7], _values(mbean, 'Count'))
+
+    def test_attribute_missing_at_the_end(self):
+        mbean = _flatten(_entry(10, Count=5, Mean=1.0), _entry(20, Mean=2.0), _entry(30, Mean=3.0))
+        self.assertEqual([5, 'missing', 'missing'], _values(mbean, 'Count'))
+
+    def test_non_numeric_and_unplotted_attributes_are_dropped(self):
+        mbean = _flatten(_entry(10, Count=5, RateUnit='events/second', StdDev=1.0))
+        self.assertIsNone(mbean['value']['RateUnit'])
+        self.assertIsNone(mbean['value']['StdDev'])
+
+    def test_graph_lines_have_a_value_per_timestamp(self):
+        mbeans = {}
+        performance_plotter._fetch_mbeans_from_dump(
+            [_entry(10, Count=5, Mean=1.0), _entry(20, Mean=2.0), _entry(30, Count=7)], mbeans)
+        graphs = performance_plotter._create_count_graphs(mbeans) + performance_plotter._create_percentile_graphs(mbeans)
+        self.assertEqual(2, len(graphs))
+        for graph in graphs:
+            for line in graph['lines']:
+                self.assertEqual(len(graph['timestamps']), len(line[2]))
+
+    def test_missing_values_are_plotted_as_zero(self):
+        mbeans = {}
+        performance_plotter._fetch_mbeans_from_dump([_entry(10, Mean=1.0), _entry(20, Count=1), _entry(30, Mean=3.0)], mbeans)
+        graph = performance_plotter._create_percentile_graphs(mbeans)[0]
+        self.assertEqual([1.0, 0.0, 3.0], graph['lines'][0][2])
+
+
+class CounterRatesTest(unittest.TestCase):
+
+    def _rates(self, *counts):
+        mbeans = {}
+        entries = [_entry(10 * (i + 1), Count=c) if c is not None else _entry(10 * (i + 1), Mean=1.0)
+                   for i, c in enumerate(counts)]
+        performance_plotter._fetch_mbeans_from_dump(entries, mbeans)
+        graph = performance_plotter._create_count_graphs(mbeans)[0]
+        return graph['lines'][0][2]
+
+    def test_rates_per_second(self):
+        self.assertEqual([0, 1.0, 2.0], self._rates(10, 20, 40))
+
+    def test_counter_reset(self):
+        self.assertEqual([0, 1.0, 0.5], self._rates(10, 20, 5))
+
+    def test_missing_sample_is_not_a_reset(self):
+        self.assertEqual([0, 0, 0, 1.0], self._rates(10, None, 30, 40))
+
+
+if __name__ == '__main__':
+    unittest.main()
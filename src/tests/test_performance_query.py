@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import unittest
+
+from os_perftest.performance_query import MBeanPattern
+from os_perftest.performance_query import Query
+from os_perftest.performance_query import QueryError
+from os_perftest.performance_query import compile_query
+from os_perftest.performance_query import run_queries
+from os_perftest.performance_store import DumpStore
+
+
+def _entry(search, suggest, errors, young_gc=None):
+    entry = {'metrics': {'name=search.requests,type=meters': {'timestamp': 1000, 'value': {'Count': search}},
+                         'name=suggest.requests,type=meters': {'timestamp': 1010, 'value': {'Count': suggest}},
+                         'name=errors,type=counters': {'timestamp': 1000, 'value': {'Count': errors}},
+                         'name=/health,type=timers': {'timestamp': 1000, 'value': {'Count': 7, 'Mean': 1.5}}},
+             'java.lang': {'type=GarbageCollector,name=G1 Old': {'value': {'LastGcInfo': {'duration': 50}}}}}
+    if young_gc is not None:
+        entry['java.lang']['type=GarbageCollector,name=G1 Young'] = {'value': {'LastGcInfo': {'duration': young_gc}}}
+    return entry
+
+
+def _values(store, text, default=0):
+    return run_queries(store, [compile_query(text)])[0].values(default)
+
+
+class MBeanPatternTest(unittest.TestCase):
+
+    def test_properties_in_any_order(self):
+        pattern = MBeanPattern('type=meters,name=search.requests')
+        self.assertTrue(pattern.matches('name=search.requests,type=meters'))
+        self.assertFalse(pattern.matches('name=search.requests,type=meters,scope=a'))
+
+    def test_trailing_wildcard_allows_other_properties(self):
+        pattern = MBeanPattern('type=meters,*')
+        self.assertTrue(pattern.matches('name=search.requests,type=meters'))
+        self.assertFalse(pattern.matches('name=errors,type=counters'))
+
+    def test_glob_in_property_values(self):
+        pattern = MBeanPattern('name=*.requests,type=meters')
+        self.assertTrue(pattern.matches('name=suggest.requests,type=meters'))
+        self.assertFalse(pattern.matches('name=errors,type=meters'))
+
+    def test_glob_on_the_whole_name(self):
+        self.assertTrue(MBeanPattern('*requests*').matches('name=search.requests,type=meters'))
+
+    def test_invalid_property(self):
+        self.assertRaises(QueryError, MBeanPattern, 'name=a,meters')
+
+    def test_literal_names(self):
+        pattern = MBeanPattern('type=meters,name=a*', literal=True)
+        self.assertTrue(pattern.matches('name=a*,type=meters'))
+        self.assertFalse(pattern.matches('name=ab,type=meters'))
+        self.assertEqual((('name', 'a*'), ('type', 'meters')), pattern.literal)
+        self.assertRaises(QueryError, MBeanPattern, 'type=meters,*', literal=True)
+        self.assertTrue(MBeanPattern('requests[1]', literal=True).matches('requests[1]'))
+        self.assertFalse(MBeanPattern('requests[1]', literal=True).matches('requests1'))
+
+
+class CompileQueryTest(unittest.TestCase):
+
+    def test_parts(self):
+        query = compile_query(' sum(metrics:type=meters,*/value/Count) ')
+        self.assertEqual(('metrics', 'type=meters,*', ('value', 'Count'), 'sum'),
+                         (query.domain, query.mbean, query.path, query.reduction))
+        self.assertEqual('sum(metrics:type=meters,*/value/Count)', query.text)
+
+    def test_escaped_slash_in_mbean(self):
+        query = compile_query('metrics:name=!/health,type=timers/value/Mean')
+        self.assertEqual('name=/health,type=timers', query.mbean)
+        self.assertEqual(('value', 'Mean'), query.path)
+        self.assertEqual('metrics:name=!/health,type=timers/value/Mean', query.with_path('/value/Mean').text)
+
+    def test_invalid_queries(self):
+        self.assertRaises(QueryError, compile_query, 'name=errors,type=counters/value/Count')
+        self.assertRaises(QueryError, compile_query, 'median(metrics:type=meters,*/value/Count)')
+        self.assertRaises(QueryError, compile_query, 'metrics:name=errors,type=counters')
+
+
+class RunQueriesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = DumpStore([_entry(10, 1, 0), _entry(20, 3, 1, young_gc=5), _entry(40, 6, 1, young_gc=15)])
+
+    def test_literal_query(self):
+        self.assertEqual([10, 20, 40], _values(self.store, 'metrics:type=meters,name=search.requests/value/Count'))
+
+    def test_escaped_slash(self):
+        self.assertEqual([1.5, 1.5, 1.5], _values(self.store, 'metrics:name=!/health,type=timers/value/Mean'))
+
+    def test_reductions(self):
+        self.assertEqual([11, 23, 46], _values(self.store, 'sum(metrics:*.requests,*/value/Count)'))
+        self.assertEqual([10, 20, 40], _values(self.store, 'max(metrics:type=meters,*/value/Count)'))
+        self.assertEqual([1, 3, 6], _values(self.store, 'min(metrics:type=meters,*/value/Count)'))
+        self.assertEqual([5.5, 11.5, 23.0], _values(self.store, 'avg(metrics:type=meters,*/value/Count)'))
+
+    def test_reduction_over_path_globs(self):
+        self.assertEqual([8.5, 8.5, 8.5], _values(self.store, 'sum(metrics:name=!/health,type=timers/value/*)'))
+
+    def test_reduction_of_samples_without_values(self):
+        young_gc = 'max(java.lang:type=GarbageCollector,name=*Young/value/LastGcInfo/duration)'
+        self.assertEqual([None, 5, 15], _values(self.store, young_gc, default=None))
+
+    def test_domain_glob(self):
+        self.assertEqual([50, 50, 50], _values(self.store, 'max(java*:type=GarbageCollector,*/value/LastGcInfo/duration)'))
+
+    def test_several_matches_need_a_reduction(self):
+        result = run_queries(self.store, [compile_query('metrics:type=meters,*/value/Count')])[0]
+        self.assertEqual(2, len(result.keys()))
+        self.assertRaises(QueryError, result.values)
+
+    def test_literal_names(self):
+        query = Query('metrics', 'type=meters,name=search.requests', '/value/Count', literal=True)
+        self.assertEqual([10, 20, 40], run_queries(self.store, [query])[0].values())
+        self.assertEqual([0, 0, 0], run_queries(self.store, [Query('metrics', 'type=meters,name=*', '/value/Count', literal=True)])[0].values())
+        self.assertTrue(query.with_path('/timestamp').literal)
+
+    def test_no_matches(self):
+        self.assertEqual([0, 0, 0], _values(self.store, 'metrics:name=missing/value/Count'))
+
+    def test_queries_run_together(self):
+        queries = [compile_query('metrics:name=errors,type=counters/value/Count'),
+                   compile_query('sum(metrics:type=meters,*/value/Count)'),
+                   compile_query('metrics:name=errors,type=counters/value/Count').with_path('/timestamp')]
+        results = run_queries(self.store, queries)
+        self.assertEqual([[0, 1, 1], [11, 23, 46], [1000, 1000, 1000]], [x.values() for x in results])
+
+
+if __name__ == '__main__':
+    unittest.main()
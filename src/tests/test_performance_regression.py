@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import unittest
+
+from os_perftest.performance_regression import RegressionConfigError
+from os_perftest.performance_regression import check_regressions
+from os_perftest.performance_regression import evaluate_check
+from os_perftest.performance_regression import mann_whitney
+from os_perftest.performance_regression import normalize_checks
+
+
+def _check(**options):
+    options.setdefault('path', 'time')
+    return normalize_checks([options])[0]
+
+
+class MannWhitneyTest(unittest.TestCase):
+
+    def test_separated_samples(self):
+        u, p = mann_whitney([1, 2, 3], [4, 5, 6])
+        self.assertEqual(9.0, u)
+        self.assertAlmostEqual(0.0404, p, places=4)
+
+    def test_equal_samples(self):
+        u, p = mann_whitney([1, 2, 3], [1, 2, 3])
+        self.assertEqual(4.5, u)
+        self.assertGreater(p, 0.5)
+
+    def test_all_values_tied(self):
+        self.assertEqual((3.0, 1.0), mann_whitney([5, 5, 5], [5, 5]))
+
+    def test_empty_sample(self):
+        self.assertRaises(ValueError, mann_whitney, [], [1])
+
+
+class NormalizeChecksTest(unittest.TestCase):
+
+    def test_defaults(self):
+        check = _check()
+        self.assertEqual('time', check['name'])
+        self.assertEqual('mean-shift', check['test'])
+        self.assertEqual(10.0, check['threshold'])
+        self.assertEqual(1, check['candidate'])
+
+    def test_options_from_config_are_converted(self):
+        check = normalize_checks([{'path': 'time', 'threshold': '5', 'baseline': '4'}], candidate='2')[0]
+        self.assertEqual(5.0, check['threshold'])
+        self.assertEqual(4, check['baseline'])
+        self.assertEqual(2, check['candidate'])
+
+    def test_invalid_checks(self):
+        self.assertRaises(RegressionConfigError, normalize_checks, [{'name': 'no path'}])
+        self.assertRaises(RegressionConfigError, normalize_checks, [{'path': 'time', 'worse': 'bigger'}])
+        self.assertRaises(RegressionConfigError, normalize_checks, [{'path': 'time', 'test': 't-test'}])
+        self.assertRaises(RegressionConfigError, normalize_checks, [{'path': 'time', 'candidate': '0'}])
+        self.assertRaises(RegressionConfigError, normalize_checks, [{'path': 'time', 'threshold': 'ten'}])
+
+
+class EvaluateCheckTest(unittest.TestCase):
+
+    def test_mean_shift_regression(self):
+        result = evaluate_check(_check(), [100, 101, 99, 100, 130])
+        self.assertEqual('regression', result['verdict'])
+        self.assertEqual(30.0, result['change-percent'])
+
+    def test_mean_shift_within_threshold(self):
+        self.assertEqual('pass', evaluate_check(_check(), [100, 101, 99, 100, 102])['verdict'])
+
+    def test_lower_is_worse(self):
+        self.assertEqual('regression', evaluate_check(_check(worse='lower'), [100, 101, 99, 100, 70])['verdict'])
+        self.assertEqual('pass', evaluate_check(_check(worse='lower'), [100, 101, 99, 100, 130])['verdict'])
+
+    def test_too_few_baseline_runs(self):
+        result = evaluate_check(_check(), [100, None, 130])
+        self.assertEqual('skipped', result['verdict'])
+        self.assertEqual(1, result['baseline-runs'])
+
+    def test_baseline_window(self):
+        result = evaluate_check(_check(baseline=3), [500, 500, 100, 101, 99, 130])
+        self.assertEqual(3, result['baseline-runs'])
+        self.assertEqual(100.0, result['baseline'])
+
+    def test_mann_whitney(self):
+        check = _check(test='mann-whitney', candidate=3)
+        result = evaluate_check(check, [100, 101, 99, 100, 102, 98, 130, 131, 129])
+        self.assertEqual('regression', result['verdict'])
+        self.assertLess(result['p-value'], 0.05)
+        self.assertEqual('pass', evaluate_check(check, [100, 101, 99, 100, 102, 98, 100, 101, 99])['verdict'])
+
+
+class CheckRegressionsTest(unittest.TestCase):
+
+    def test_non_numeric_values_are_left_out(self):
+        dump = [{'time': 100}, {'time': 101}, {'time': True}, {'time': 'n/a'}, {'time': 99}, {'time': 130}]
+        verdict = check_regressions(dump, [_check()])
+        self.assertEqual('fail', verdict['verdict'])
+        self.assertEqual(['time'], verdict['regressions'])
+        self.assertEqual(6, verdict['runs'])
+        self.assertEqual(3, verdict['checks'][0]['baseline-runs'])
+
+
+if __name__ == '__main__':
+    unittest.main()
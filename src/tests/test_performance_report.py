@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from matplotlib.figure import Figure
+from PIL import Image
+from PIL import ImageChops
+
+import os_perftest.performance_report as performance_report
+from os_perftest.performance_report import PerformanceReport
+
+DATES = [datetime.datetime(2024, 1, 1) + datetime.timedelta(days=i) for i in range(5)]
+
+
+def _report(output_dir, plots, plot_name=None):
+    """ Creates an incremental report of plots (name -> values), returns the names of the rendered plots """
+    rendered = []
+    render_plot = performance_report.render_plot
+
+    def render(job):
+        rendered.append(job['plotname'])
+        render_plot(job)
+
+    with mock.patch.object(performance_report, 'render_plot', render):
+        report = PerformanceReport(output_dir, incremental=True)
+        for name, values in plots.items():
+            report.plot_data(name, name, "ms", DATES, ('b', 'mean', values, 0))
+        report.create_report(plot_name=plot_name)
+    return rendered
+
+
+class IncrementalReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.tmp_dir, 'report')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _manifest(self):
+        with open(os.path.join(self.output_dir, performance_report.MANIFEST_FILE)) as fh:
+            return json.load(fh)
+
+    def test_only_changed_plots_are_rendered(self):
+        self.assertEqual(['a', 'b'], _report(self.output_dir, {'a': [1, 2, 3, 4, 5], 'b': [5, 4, 3, 2, 1]}))
+        self.assertEqual([], _report(self.output_dir, {'a': [1, 2, 3, 4, 5], 'b': [5, 4, 3, 2, 1]}))
+        self.assertEqual(['b'], _report(self.output_dir, {'a': [1, 2, 3, 4, 5], 'b': [5, 4, 3, 2, 2]}))
+
+    def test_stale_plots_are_removed(self):
+        _report(self.output_dir, {'a': [1, 2, 3, 4, 5], 'b': [5, 4, 3, 2, 1]})
+        _report(self.output_dir, {'a': [1, 2, 3, 4, 5]})
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, 'b.png')))
+        self.assertEqual(['a'], sorted(self._manifest()))
+
+    def test_interrupted_report_does_not_keep_mismatched_plots(self):
+        _report(self.output_dir, {'a': [1, 2, 3, 4, 5]})
+
+        # A report with other values for a is interrupted after a was rendered
+        report = PerformanceReport(self.output_dir, incremental=True)
+        report.plot_data('a', 'a', "ms", DATES, ('b', 'mean', [9, 9, 9, 9, 9], 0))
+
+        # The next report with the first values must render a again
+        self.assertEqual(['a'], _report(self.output_dir, {'a': [1, 2, 3, 4, 5]}))
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, performance_report.MANIFEST_JOURNAL)))
+
+    def test_torn_journal_line_is_ignored(self):
+        _report(self.output_dir, {'a': [1, 2, 3, 4, 5]})
+        with open(os.path.join(self.output_dir, performance_report.MANIFEST_JOURNAL), 'w') as fh:
+            fh.write('["a", nu')
+        self.assertEqual([], _report(self.output_dir, {'a': [1, 2, 3, 4, 5]}))
+
+    def test_main_plot(self):
+        main = os.path.join(self.output_dir, 'main.png')
+        _report(self.output_dir, {'a': [1, 2, 3, 4, 5], 'b': [5, 4, 3, 2, 1]}, plot_name='a')
+        with open(os.path.join(self.output_dir, 'a.png'), 'rb') as fh, open(main, 'rb') as main_fh:
+            self.assertEqual(fh.read(), main_fh.read())
+        self.assertEqual(self._manifest()['a'], self._manifest()[performance_report.MAIN_PLOT_KEY])
+
+        _report(self.output_dir, {'a': [1, 2, 3, 4, 5], 'b': [5, 4, 3, 2, 1]}, plot_name='b')
+        with open(os.path.join(self.output_dir, 'b.png'), 'rb') as fh, open(main, 'rb') as main_fh:
+            self.assertEqual(fh.read(), main_fh.read())
+
+        _report(self.output_dir, {'a': [1, 2, 3, 4, 5], 'b': [5, 4, 3, 2, 1]})
+        self.assertFalse(os.path.exists(main))
+        self.assertNotIn(performance_report.MAIN_PLOT_KEY, self._manifest())
+
+    def test_hash_depends_on_the_date_labels_only(self):
+        job = {'unit': 'ms', 'dates': DATES, 'data_list': [('b', 'mean', [1, 2, 3, 4, 5], 0)],
+               'indices': None, 'date_format': '%d-%m-%Y', 'filename': 'a.png', 'smallfilename': 'a-small.png'}
+        later = dict(job, dates=[d + datetime.timedelta(hours=1) for d in DATES])
+        next_day = dict(job, dates=[d + datetime.timedelta(days=1) for d in DATES])
+        self.assertEqual(performance_report.plot_hash(job), performance_report.plot_hash(later))
+        self.assertNotEqual(performance_report.plot_hash(job), performance_report.plot_hash(next_day))
+
+
+class ThumbnailTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.tmp_dir, 'report')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _report(self, **kwargs):
+        report = PerformanceReport(self.output_dir, **kwargs)
+        report.plot_data('a', 'a', "ms", DATES, ('b', 'mean', [1, 2, 3, 4, 5], 0))
+        report.create_report()
+        with open(os.path.join(self.output_dir, 'index.html')) as fh:
+            return fh.read()
+
+    def test_thumbnail_of_the_plot(self):
+        self.assertIn('<img src="a-small.png"', self._report())
+        factor = performance_report.PLOT_DPI // performance_report.THUMBNAIL_DPI
+        with Image.open(os.path.join(self.output_dir, 'a.png')) as image, \
+             Image.open(os.path.join(self.output_dir, 'a-small.png')) as small:
+            self.assertEqual((-(-image.width // factor), -(-image.height // factor)), small.size)
+            # The same pixels as a thumbnail of the saved png
+            self.assertIsNone(ImageChops.difference(image.reduce(factor), small).getbbox())
+
+    def test_no_thumbnails(self):
+        self.assertIn('<img src="a.png"', self._report(thumbnails=False))
+        self.assertEqual(['a.html', 'a.png', 'index.html'], sorted(os.listdir(self.output_dir)))
+
+
+class ParallelReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _files(self, name, **kwargs):
+        output_dir = os.path.join(self.tmp_dir, name)
+        report = PerformanceReport(output_dir, **kwargs)
+        for i in range(3):
+            report.plot_data('plot-%s' % i, 'plot %s' % i, "ms", DATES,
+                             ('b', 'mean', [i, 2 * i, 3, 4, 5], 0), ('r', 'max', [5, 4, 3 * i, 2, 1], 1))
+        report.create_report(plot_name='plot-1')
+        files = {}
+        for filename in os.listdir(output_dir):
+            with open(os.path.join(output_dir, filename), 'rb') as fh:
+                files[filename] = fh.read()
+        return files
+
+    def test_parallel_rendering_writes_the_same_files(self):
+        serial = self._files('serial')
+        parallel = self._files('parallel', parallel=True, workers=2)
+        self.assertEqual(sorted(serial), sorted(parallel))
+        self.assertIn('main-small.png', serial)
+        for filename in serial:
+            self.assertEqual(serial[filename], parallel[filename], filename)
+
+
+class DownsampleTest(unittest.TestCase):
+
+    def test_extremes_and_ends_are_kept(self):
+        values = [5] * 100
+        values[0] = 4
+        values[37] = 100
+        values[62] = -3
+        values[99] = 6
+        indices, kept = performance_report.downsample_min_max(values, 10)
+        self.assertEqual([values[i] for i in indices], kept)
+        self.assertEqual(sorted(set(indices)), indices)
+        for index in (0, 37, 62, 99):
+            self.assertIn(index, indices)
+        self.assertLessEqual(len(indices), 2 * 10 + 2)
+
+    def test_short_series_are_unchanged(self):
+        self.assertEqual(([0, 1, 2, 3], [3, 1, 4, 1]), performance_report.downsample_min_max([3, 1, 4, 1], 2))
+        self.assertEqual(([0, 1, 2], [3, 1, 4]), performance_report.downsample_min_max((3, 1, 4), 0))
+
+    def _job(self, points, **kwargs):
+        jobs = []
+        dates = [DATES[0] + datetime.timedelta(minutes=i) for i in range(points)]
+        with tempfile.TemporaryDirectory() as output_dir, mock.patch.object(performance_report, 'render_plot', jobs.append):
+            report = PerformanceReport(os.path.join(output_dir, 'report'), **kwargs)
+            report.plot_data('a', 'a', "ms", dates, ('b', 'mean', [i % 7 for i in range(points)], 0))
+        return jobs[0]
+
+    def test_point_limit(self):
+        self.assertIsNone(self._job(100, downsample=False)['indices'])
+        self.assertIsNone(self._job(100)['indices'])
+
+        job = self._job(100, downsample=20)
+        self.assertEqual(0, job['indices'][0][0])
+        self.assertEqual(99, job['indices'][0][-1])
+        self.assertLessEqual(len(job['indices'][0]), 22)
+        self.assertEqual([i % 7 for i in job['indices'][0]], job['data_list'][0][2])
+
+        limit = performance_report.POINTS_PER_PIXEL * performance_report.PLOT_WIDTH
+        self.assertIsNone(self._job(limit)['indices'])
+        self.assertIsNotNone(self._job(limit + 1)['indices'])
+
+    def test_downsampled_points_are_drawn_at_their_dates(self):
+        job = self._job(100, downsample=20)
+        figures = []
+
+        def figure():
+            figures.append(Figure())
+            return figures[-1]
+
+        with tempfile.TemporaryDirectory() as output_dir, mock.patch.object(performance_report, 'Figure', figure):
+            filename = os.path.join(output_dir, 'a.png')
+            performance_report.render_plot(dict(job, filename=filename, smallfilename=filename))
+        line = figures[0].axes[0].lines[0]
+        self.assertEqual(job['indices'][0], list(line.get_xdata()))
+        self.assertEqual(job['data_list'][0][2], list(line.get_ydata()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from os_perftest.performance_report import create_legend
+from os_perftest.performance_report import create_performance_report
+from os_perftest.performance_report_html import CHART_SCRIPT
+from os_perftest.performance_report_html import HtmlPerformanceReport
+
+DATES = [datetime.datetime(2024, 1, 1) + datetime.timedelta(days=i) for i in range(5)]
+
+
+class HtmlReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.tmp_dir, 'report')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _report(self, plot_name=None, **kwargs):
+        report = create_performance_report(self.output_dir, backend='html', **kwargs)
+        report.plot_data('Time', 'request time', "ms", DATES, ('b', 'mean', [1.23456, 2, 3, 4, 5.5], 1))
+        report.plot_data('Errors', 'errors', "requests", DATES, ('r', 'errors', [0, 1, 0, 2, 3], 0))
+        report.create_report(plot_name=plot_name)
+        return report
+
+    def _read(self, filename):
+        with open(os.path.join(self.output_dir, filename)) as fh:
+            return fh.read()
+
+    def test_index(self):
+        self.assertIsInstance(self._report(plot_name='Time'), HtmlPerformanceReport)
+        index = self._read('index.html')
+        self.assertIn('<script src="data.js"></script>\n<script src="chart.js"></script>\n', index)
+        # The main plot comes first
+        self.assertLess(index.index('<h2 id="Time">'), index.index('<h2 id="Errors">'))
+        self.assertIn('<canvas id="chart-0" width="900" height="450"></canvas>\n', index)
+        self.assertIn('<canvas id="chart-1" width="900" height="450"></canvas>\n', index)
+        self.assertIn(create_legend([('#FF0000', 'errors', 3, 0)]), index)
+        self.assertTrue(index.endswith('</body>\n</html>\n'))
+
+    def test_data(self):
+        self._report()
+        data = self._read('data.js')
+        self.assertTrue(data.startswith('var REPORT_DATA = '))
+        self.assertTrue(data.endswith(';\n'))
+        graphs = json.loads(data[len('var REPORT_DATA = '):-2])
+        self.assertEqual(['Time', 'Errors'], [x['name'] for x in graphs])
+        self.assertEqual([int(d.timestamp()) for d in DATES], graphs[0]['dates'])
+        self.assertEqual({'color': '#0000FF', 'legend': 'mean', 'precision': 1, 'values': [1.2346, 2, 3, 4, 5.5]},
+                         graphs[0]['lines'][0])
+
+    def test_chart_script(self):
+        self._report()
+        self.assertEqual(CHART_SCRIPT, self._read('chart.js'))
+
+    def test_main_plot(self):
+        self._report()
+        self.assertEqual(['chart.js', 'data.js', 'index.html'], sorted(os.listdir(self.output_dir)))
+
+        self._report(plot_name='Time')
+        self.assertEqual(['chart.js', 'data.js', 'index.html', 'main-small.png', 'main.png'],
+                         sorted(os.listdir(self.output_dir)))
+        with Image.open(os.path.join(self.output_dir, 'main.png')) as image, \
+             Image.open(os.path.join(self.output_dir, 'main-small.png')) as small:
+            self.assertLess(small.width, image.width)
+
+        self._report(plot_name='Time', thumbnails=False)
+        self.assertNotIn('main-small.png', os.listdir(self.output_dir))
+
+    def test_unsupported_options(self):
+        self.assertRaises(ValueError, HtmlPerformanceReport, self.output_dir, incremental=True)
+        self.assertRaises(ValueError, HtmlPerformanceReport, self.output_dir, parallel=True)
+        self.assertRaises(TypeError, HtmlPerformanceReport, self.output_dir, dpi=50)
+
+
+if __name__ == '__main__':
+    unittest.main()
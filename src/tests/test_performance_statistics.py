@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import random
+import statistics
+import unittest
+
+from os_perftest.performance_statistics import LatencyHistogram
+from os_perftest.performance_statistics import Statistics
+from os_perftest.performance_statistics import steady_state_start
+
+
+def _values(count, seed=1):
+    rnd = random.Random(seed)
+    return [rnd.randint(1, 1000) for _ in range(count)]
+
+
+class StatisticsTest(unittest.TestCase):
+
+    def assertMoments(self, values, stats):
+        self.assertEqual(len(values), stats.count)
+        self.assertEqual(min(values), stats.min)
+        self.assertEqual(max(values), stats.max)
+        self.assertAlmostEqual(statistics.fmean(values), stats.mean, places=9)
+        self.assertAlmostEqual(statistics.pvariance(values), stats.variance(), places=6)
+
+    def test_add_one_by_one(self):
+        values = _values(1000)
+        stats = Statistics()
+        for value in values:
+            stats.add(value)
+        self.assertMoments(values, stats)
+
+    def test_add_many(self):
+        values = _values(1000)
+        self.assertMoments(values, Statistics.from_values(iter(values)))
+
+    def test_merge_equals_statistics_of_all_values(self):
+        parts = [_values(n, seed=n) for n in (1, 10, 500, 2000)]
+        merged = Statistics()
+        for part in parts:
+            merged.merge(Statistics.from_values(part))
+        values = [x for part in parts for x in part]
+        self.assertMoments(values, merged)
+        self.assertEqual(Statistics.from_values(values).percentiles([50, 99]), merged.percentiles([50, 99]))
+
+    def test_merge_empty(self):
+        values = _values(10)
+        stats = Statistics.from_values(values)
+        stats.merge(Statistics())
+        self.assertMoments(values, stats)
+        self.assertMoments(values, Statistics().merge(Statistics.from_values(values)))
+
+    def test_merge_without_counts_into_counts_fails(self):
+        with self.assertRaises(ValueError):
+            Statistics().merge(Statistics.from_values([1, 2], keep_counts=False))
+
+    def test_percentiles_interpolate_between_ranks(self):
+        stats = Statistics.from_values([1, 2, 3, 4])
+        self.assertEqual({0: 1, 50: 2.5, 100: 4}, stats.percentiles([0, 50, 100]))
+        self.assertAlmostEqual(3.97, stats.percentiles([99])[99])
+
+    def test_percentiles_need_counts(self):
+        with self.assertRaises(ValueError):
+            Statistics.from_values([1, 2], keep_counts=False).percentiles([50])
+
+    def test_calculate(self):
+        result = Statistics.from_values([2, 4, 4, 4, 5, 5, 7, 9]).calculate(percentiles=[50])
+        self.assertEqual(8, result['samples'])
+        self.assertEqual(5.0, result['mean'])
+        self.assertEqual(2.0, result['standard-deviation'])
+        self.assertEqual({50: 4.5}, result['percentiles'])
+
+    def test_steady_state_start(self):
+        values = [1, 50, 100, 150] + [200] * 20
+        self.assertEqual(4, steady_state_start(values, window=5))
+        self.assertIsNone(steady_state_start([1, 100] * 10, window=5))
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def assertWithinAccuracy(self, expected, actual, accuracy=0.01):
+        self.assertLessEqual(abs(actual - expected), accuracy * expected + 1e-9,
+                             "%s is not within %s of %s" % (actual, accuracy, expected))
+
+    def test_percentiles_within_accuracy(self):
+        values = _values(10000)
+        histogram = LatencyHistogram.from_counts(Statistics.from_values(values).counts)
+        ordered = sorted(values)
+        for p in (0, 10, 50, 90, 95, 99, 99.9, 100):
+            expected = ordered[int((len(values) - 1) * p / 100.0)]
+            self.assertWithinAccuracy(expected, histogram.percentile(p))
+
+    def test_min_and_max_are_exact(self):
+        histogram = LatencyHistogram()
+        for value in (3, 7, 1000):
+            histogram.add(value)
+        self.assertEqual(3, histogram.percentile(0))
+        self.assertEqual(1000, histogram.percentile(100))
+
+    def test_zero_bucket(self):
+        histogram = LatencyHistogram()
+        histogram.add(0, 3)
+        histogram.add(10)
+        self.assertEqual(4, histogram.count)
+        self.assertEqual(3, histogram.zero)
+        self.assertEqual(0, histogram.percentile(50))
+
+    def test_merge_equals_histogram_of_all_values(self):
+        first, second = _values(1000, seed=1), _values(3000, seed=2)
+        merged = LatencyHistogram.from_counts(Statistics.from_values(first).counts)
+        merged.merge(LatencyHistogram.from_counts(Statistics.from_values(second).counts))
+        expected = LatencyHistogram.from_counts(Statistics.from_values(first + second).counts)
+        self.assertEqual(expected.to_dict(), merged.to_dict())
+
+    def test_merge_needs_same_accuracy(self):
+        with self.assertRaises(ValueError):
+            LatencyHistogram(0.01).merge(LatencyHistogram(0.02))
+
+    def test_dict_round_trip(self):
+        histogram = LatencyHistogram.from_counts(Statistics.from_values(_values(500) + [0]).counts)
+        copy = LatencyHistogram.from_dict(histogram.to_dict())
+        self.assertEqual(histogram.to_dict(), copy.to_dict())
+        self.assertEqual(histogram.percentiles([50, 99]), copy.percentiles([50, 99]))
+
+
+if __name__ == '__main__':
+    unittest.main()
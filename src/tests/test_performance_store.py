@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import unittest
+
+from os_perftest.performance_store import DumpStore
+from os_perftest.performance_store import is_number
+
+
+def _entry(count=None, mean=None, text=None):
+    value = {}
+    if count is not None:
+        value['Count'] = count
+    if mean is not None:
+        value['Mean'] = mean
+    if text is not None:
+        value['Name'] = text
+    return {'metrics': {'name=requests,type=timers': {'timestamp': 1000, 'value': value}}}
+
+
+class DumpStoreTest(unittest.TestCase):
+
+    def test_values_of_a_path(self):
+        store = DumpStore([_entry(count=1), _entry(count=2), _entry(count=3)])
+        self.assertEqual([1, 2, 3], store.values('metrics/name=requests,type=timers/value/Count'))
+
+    def test_missing_samples_get_default(self):
+        store = DumpStore([_entry(count=1), _entry(mean=2.5), _entry(count=3)])
+        self.assertEqual([1, 0, 3], store.values('metrics/name=requests,type=timers/value/Count'))
+        self.assertEqual([None, 2.5, None], store.values('metrics/name=requests,type=timers/value/Mean', default=None))
+
+    def test_ints_are_widened_to_floats(self):
+        store = DumpStore([_entry(count=1), _entry(count=2.5)])
+        column = store.column('metrics/name=requests,type=timers/value/Count')
+        self.assertEqual('d', column.values.typecode)
+        self.assertEqual([1.0, 2.5], list(column.values))
+
+    def test_non_numeric_values_are_kept_in_a_list(self):
+        store = DumpStore([_entry(text='a'), _entry(text='b')])
+        self.assertEqual(['a', 'b'], store.values('metrics/name=requests,type=timers/value/Name'))
+
+    def test_lookup(self):
+        store = DumpStore([_entry(count=1), _entry(count=2)])
+        self.assertEqual([1, 2], store.lookup('metrics', 'name=requests,type=timers', '/value/Count'))
+        self.assertEqual([0, 0], store.lookup('metrics', 'name=requests,type=timers', '/value/Missing'))
+
+    def test_non_leaf_path_is_looked_up_in_the_entries(self):
+        store = DumpStore([_entry(count=1)])
+        self.assertEqual([{'Count': 1}], store.values('metrics/name=requests,type=timers/value'))
+
+    def test_mbeans_and_columns(self):
+        store = DumpStore([_entry(count=1, mean=2.0)])
+        self.assertEqual({'metrics'}, store.entries)
+        self.assertEqual(['name=requests,type=timers'], store.mbeans('metrics'))
+        self.assertEqual(sorted([('metrics', 'name=requests,type=timers', 'timestamp'),
+                                 ('metrics', 'name=requests,type=timers', 'value', 'Count'),
+                                 ('metrics', 'name=requests,type=timers', 'value', 'Mean')]),
+                         sorted(store.mbean_columns('metrics', 'name=requests,type=timers')))
+
+
+class IsNumberTest(unittest.TestCase):
+
+    def test_numbers(self):
+        for value in (0, -3, 2.5, float('nan')):
+            self.assertTrue(is_number(value))
+
+    def test_not_numbers(self):
+        for value in (True, False, None, '1', [1]):
+            self.assertFalse(is_number(value))
+
+
+if __name__ == '__main__':
+    unittest.main()
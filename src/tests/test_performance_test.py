@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+from os_perftest.performance_history import DAY
+from os_perftest.performance_history import HistoryStore
+from os_perftest.performance_test import FixedRateScheduler
+from os_perftest.performance_test import PerformanceTest
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FixedRateSchedulerTest(unittest.TestCase):
+
+    def test_grid_index_counts_skipped_ticks(self):
+        clock = FakeClock()
+        scheduler = FixedRateScheduler(1.0, clock=clock, sleep=clock.sleep)
+        indices = []
+
+        def func():
+            indices.append(scheduler.grid_index())
+            if len(indices) == 2:
+                # Overrun two deadlines
+                clock.now += 2.5
+
+        scheduler.run(func, 8.0)
+        self.assertEqual(2, scheduler.missed_ticks)
+        self.assertEqual([0, 1, 4, 5, 6, 7], indices)
+
+
+class DumpPhaseTest(unittest.TestCase):
+
+    def _phase(self, tick, **configuration):
+        configuration.setdefault('run-time', '10')
+        configuration.setdefault('dump-every', '1')
+        return PerformanceTest._dump_phase(None, configuration, float(tick), tick)
+
+    def test_dumps_counted_in_grid_slots(self):
+        phases = [self._phase(tick, **{'warm-up-dumps': '2', 'cool-down-dumps': '3'}) for tick in (0, 1, 4, 6, 7, 9)]
+        self.assertEqual(['warm-up', 'warm-up', 'steady', 'steady', 'cool-down', 'cool-down'], phases)
+
+    def test_seconds(self):
+        phases = [self._phase(tick, **{'warm-up': '2', 'cool-down': '2'}) for tick in (1, 2, 7, 8)]
+        self.assertEqual(['warm-up', 'steady', 'steady', 'cool-down'], phases)
+
+
+class HistoryRetentionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.tmp_dir, 'history.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _apply(self, **configuration):
+        test = PerformanceTest.__new__(PerformanceTest)
+        test.configuration = configuration
+        test.apply_history_retention()
+
+    def test_retention_of_the_configured_history(self):
+        with HistoryStore(self.db_file) as store:
+            for i in range(3):
+                entry = {'metrics': {'name=requests,type=meters': {'timestamp': 100 * DAY + i, 'value': {'Count': i}}}}
+                store.add_mbean_entries([entry], 'run-%s' % i)
+
+        self._apply(**{'history': self.db_file, 'history-raw-runs': '1', 'history-raw-days': None})
+        with HistoryStore(self.db_file) as store:
+            self.assertEqual(['daily', 'daily', 'raw'], [x['tier'] for x in store.runs()])
+
+    def test_without_history(self):
+        self._apply()
+        self.assertFalse(os.path.exists(self.db_file))
+
+
+if __name__ == '__main__':
+    unittest.main()